@@ -1,29 +1,136 @@
 import argparse
 import os
-from cim.branches import compare_branches
-from cim.commits import analyze_two_commits_with_cache
 
 
 def main():
     parser = argparse.ArgumentParser(description="Сравнение веток и коммитов.")
     parser.add_argument("source", nargs="?", help="Исходная ветка или коммит.")
-    parser.add_argument("base", help="Базовая ветка или коммит.")
+    parser.add_argument("base", nargs="?", help="Базовая ветка или коммит.")
     parser.add_argument("--commits", action="store_true", help="Сравнить два коммита.")
+    parser.add_argument(
+        "--range",
+        dest="commit_range",
+        metavar="BASE..HEAD",
+        help="Проанализировать каждый коммит диапазона по сравнению с предыдущим.",
+    )
+    parser.add_argument(
+        "--last",
+        type=int,
+        metavar="N",
+        help="Проанализировать последние N коммитов (каждый с предыдущим).",
+    )
     parser.add_argument(
         "--output", default="output", help="Папка для сохранения результатов."
     )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="Читать CSV/TSV потоково частями по указанному числу строк.",
+    )
+    parser.add_argument(
+        "--approx",
+        action="store_true",
+        help="Оценивать число дубликатов приближённо (HyperLogLog).",
+    )
+    parser.add_argument(
+        "--approx-error",
+        type=float,
+        default=0.01,
+        help="Допустимая относительная погрешность приближённого режима.",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="Число параллельных процессов для обработки файлов.",
+    )
+    parser.add_argument(
+        "--model-sample",
+        type=int,
+        default=0,
+        metavar="ROWS",
+        help="Сравнивать предсказания моделей на выборке из ROWS строк матрицы признаков.",
+    )
+    parser.add_argument(
+        "--row-diff",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="KEY",
+        help=(
+            "Сравнивать таблицы построчно: по ключевому столбцу KEY (имя или "
+            "номер столбца) или, если KEY не указан, по хэшам строк."
+        ),
+    )
+    parser.add_argument(
+        "--drift",
+        action="store_true",
+        help="Считать дрейф распределений столбцов таблиц (PSI, KS, категории, даты).",
+    )
     args = parser.parse_args()
 
+    # Импорт после разбора аргументов: --help и ошибки аргументов не ждут
+    # загрузки модулей анализа
+    from cim.branches import compare_branches
+    from cim.commits import analyze_two_commits_with_cache
+    from cim.history import (
+        analyze_commit_history,
+        list_last_commits,
+        list_range_commits,
+    )
+    from cim.utils import resolve_refs
+
+    approx_error = args.approx_error if args.approx else None
+
     repo_path = os.getcwd()
+    options = dict(
+        chunksize=args.chunksize,
+        approx_error=approx_error,
+        jobs=args.jobs,
+        model_sample=args.model_sample,
+        row_key=args.row_diff,
+        drift=args.drift,
+    )
+
+    if args.commit_range or args.last:
+        if args.commit_range and args.last:
+            parser.error("Укажите либо --range, либо --last.")
+        if args.commit_range:
+            commits = list_range_commits(repo_path, args.commit_range)
+        else:
+            commits = list_last_commits(repo_path, args.last)
+        analyze_commit_history(repo_path, commits, args.output, **options)
+        return
+
+    # Единственный позиционный аргумент - это базовая ветка
+    if args.base is None:
+        args.source, args.base = None, args.source
+    if not args.base:
+        parser.error("Необходимо указать базовую ветку или коммит.")
 
     if args.commits:
         if not args.source or not args.base:
             parser.error("Для сравнения коммитов необходимо указать оба хэша коммитов.")
-        analyze_two_commits_with_cache(repo_path, args.base, args.source, args.output)
+        commits = resolve_refs(repo_path, [args.base, args.source])
+        analyze_two_commits_with_cache(
+            repo_path,
+            commits[args.base],
+            commits[args.source],
+            args.output,
+            **options,
+        )
     else:
         if not args.source:
             args.source = "HEAD"
-        compare_branches(repo_path, args.source, args.base, args.output)
+        compare_branches(
+            repo_path,
+            args.source,
+            args.base,
+            args.output,
+            **options,
+        )
 
 
 if __name__ == "__main__":
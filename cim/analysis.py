@@ -1,4 +1,8 @@
-import numpy as np
+# Версия алгоритма риска: входит в ключ кэша результатов (см. cim.cache),
+# её нужно увеличивать при любом изменении расчёта статистик или Q.
+RISK_VERSION = 3
+
+DEFAULT_WEIGHTS = {"rows": 0.2, "columns": 0.2, "duplicates": 0.4, "nulls": 0.2}
 
 
 def calculate_risk(old_data, new_data, weights=None):
@@ -6,40 +10,24 @@ def calculate_risk(old_data, new_data, weights=None):
     Рассчитывает уровень риска на основе изменения показателей данных.
 
     Parameters:
-    - old_data (numpy.ndarray): исходные данные
-    - new_data (numpy.ndarray): новые данные
+    - old_data (pandas.DataFrame | numpy.ndarray | TableProfile): исходные данные или их профиль
+    - new_data (pandas.DataFrame | numpy.ndarray | TableProfile): новые данные или их профиль
     - weights (dict): веса для каждого компонента ("rows", "columns", "duplicates", "nulls").
                       Если None, используются примерные веса.
 
     Returns:
     - Q (float): значение метрики риска.
     """
+    from cim.profile import TableProfile, profile_table
+
+    old = old_data if isinstance(old_data, TableProfile) else profile_table(old_data)
+    new = new_data if isinstance(new_data, TableProfile) else profile_table(new_data)
+
     # Базовые параметры
-    R_0, C_0 = old_data.shape
-    R_t, C_t = new_data.shape
-
-    # Инициализация количества дубликатов
-    D_0 = 0
-    D_t = 0
-
-    # Проверка дубликатов по числовым столбцам
-    for col_idx in range(C_0):
-        # Если тип столбца числовой
-        if np.issubdtype(old_data[:, col_idx].dtype, np.number):
-            unique_old = np.unique(old_data[:, col_idx])
-            unique_new = np.unique(new_data[:, col_idx])
-
-            # Добавляем разницу дубликатов
-            D_0 += len(old_data[:, col_idx]) - len(unique_old)
-            D_t += len(new_data[:, col_idx]) - len(unique_new)
-
-    # Количество пустых значений (работает только с числовыми столбцами)
-    N_0 = 0
-    N_t = 0
-    for col_idx in range(C_0):
-        if np.issubdtype(old_data[:, col_idx].dtype, np.number):
-            N_0 += np.isnan(old_data[:, col_idx]).sum()
-            N_t += np.isnan(new_data[:, col_idx]).sum()
+    R_0, C_0 = old.rows, old.columns
+    R_t, C_t = new.rows, new.columns
+    D_0, D_t = old.duplicates, new.duplicates
+    N_0, N_t = old.nulls, new.nulls
 
     # Изменения (в относительных величинах)
     delta_R = (R_t - R_0) / R_0 if R_0 > 0 else 0
@@ -49,7 +37,7 @@ def calculate_risk(old_data, new_data, weights=None):
 
     # Установка весов
     if weights is None:
-        weights = {"rows": 0.2, "columns": 0.2, "duplicates": 0.4, "nulls": 0.2}
+        weights = DEFAULT_WEIGHTS
 
     # Рассчет метрики Q
     Q = (
@@ -0,0 +1,290 @@
+import hashlib
+import json
+import os
+import subprocess
+
+import yaml
+
+from cim.utils import read_file_at_commit
+from cim.worktrees import acquire_worktree
+
+# Статусы стадий и записей dvc.lock при сравнении двух коммитов
+UNCHANGED = "unchanged"
+ADDED = "added"
+REMOVED = "removed"
+MODIFIED = "modified"
+
+
+def read_dvc_lock(repo_path, commit):
+    """
+    Читает dvc.lock в заданном коммите.
+
+    :param repo_path: Путь к репозиторию.
+    :param commit: Хэш коммита.
+    :return: Содержимое dvc.lock (словарь); пустой словарь, если файла нет.
+    """
+    content = read_file_at_commit(repo_path, commit, "dvc.lock")
+    if content is None:
+        return {}
+    return yaml.safe_load(content) or {}
+
+
+def find_cache_object(cache_dir, md5):
+    """
+    Ищет объект в кэше DVC по хэшу (раскладка DVC 3.x и DVC 2.x).
+
+    :param cache_dir: Папка кэша DVC.
+    :param md5: Хэш объекта (для папок - с суффиксом .dir).
+    :return: Путь к объекту или None, если его нет в кэше.
+    """
+    for prefix in (os.path.join(cache_dir, "files", "md5"), cache_dir):
+        path = os.path.join(prefix, md5[:2], md5[2:])
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def expand_lock_entry(entry, cache_dir):
+    """
+    Раскрывает запись dvc.lock в список файлов с их хэшами.
+
+    Для папок (хэш с суффиксом .dir) читается манифест из кэша DVC.
+
+    :param entry: Запись deps/outs из dvc.lock (path, md5, ...).
+    :param cache_dir: Папка кэша DVC.
+    :return: Кортеж ({путь: md5}, множество отсутствующих в кэше хэшей).
+    """
+    path, md5 = entry["path"], entry.get("md5")
+    if md5 is None:
+        return {}, set()
+    if not md5.endswith(".dir"):
+        missing = set() if find_cache_object(cache_dir, md5) else {md5}
+        return {path: md5}, missing
+
+    manifest_path = find_cache_object(cache_dir, md5)
+    if manifest_path is None:
+        return {}, {md5}
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+
+    files = {}
+    missing = set()
+    for item in manifest:
+        file_path = os.path.join(path, item["relpath"])
+        files[file_path] = item["md5"]
+        if find_cache_object(cache_dir, item["md5"]) is None:
+            missing.add(item["md5"])
+    return files, missing
+
+
+def _tracked_lock_entries(lock, stage, stage_def):
+    """Записи deps и outs стадии из dvc.lock, описанные в dvc.yaml: {путь: запись}."""
+    tracked = set(stage_def.get("deps", []) + stage_def.get("outs", []))
+    lock_stage = (lock.get("stages") or {}).get(stage) or {}
+    return {
+        entry["path"]: entry
+        for entry in lock_stage.get("deps", []) + lock_stage.get("outs", [])
+        if entry["path"] in tracked
+    }
+
+
+def _status(old_present, new_present, changed):
+    if not old_present:
+        return ADDED
+    if not new_present:
+        return REMOVED
+    return MODIFIED if changed else UNCHANGED
+
+
+def diff_dvc_locks(old_lock, new_lock, dvc_yaml):
+    """
+    Сравнивает записи dvc.lock двух коммитов без обращения к кэшу DVC.
+
+    Запись (файл или папка) считается неизменённой, если её md5 совпадает в
+    обоих коммитах; для папки это хэш манифеста .dir, то есть всего её
+    содержимого. Стадия неизменна, если неизменны все её записи.
+
+    :param old_lock: Содержимое dvc.lock старого коммита (см. read_dvc_lock).
+    :param new_lock: Содержимое dvc.lock нового коммита.
+    :param dvc_yaml: Содержимое dvc.yaml (см. read_dvc_yaml).
+    :return: Словарь {стадия: {"status": статус, "entries": {путь: статус}}}.
+    """
+    result = {}
+    for stage, stage_def in dvc_yaml["stages"].items():
+        old_entries = _tracked_lock_entries(old_lock, stage, stage_def)
+        new_entries = _tracked_lock_entries(new_lock, stage, stage_def)
+        entries = {
+            path: _status(
+                path in old_entries,
+                path in new_entries,
+                old_entries.get(path, {}).get("md5")
+                != new_entries.get(path, {}).get("md5"),
+            )
+            for path in sorted(set(old_entries) | set(new_entries))
+        }
+        statuses = set(entries.values())
+        if statuses <= {UNCHANGED}:
+            status = UNCHANGED
+        elif len(statuses) == 1:
+            status = statuses.pop()
+        else:
+            status = MODIFIED
+        result[stage] = {"status": status, "entries": entries}
+    return result
+
+
+def unchanged_lock_entries(lock_diff):
+    """
+    Выбирает из результата diff_dvc_locks неизменённые записи.
+
+    :param lock_diff: Результат diff_dvc_locks.
+    :return: Словарь {стадия: множество путей неизменённых записей}.
+    """
+    return {
+        stage: {path for path, status in diff["entries"].items() if status == UNCHANGED}
+        for stage, diff in lock_diff.items()
+    }
+
+
+def _expand_unchanged_entry(entry, cache_dir):
+    """
+    Раскрывает неизменённую запись без загрузки объектов.
+
+    Манифест папки читается, только если он уже есть в локальном кэше;
+    иначе запись остаётся одной строкой с путём папки.
+    """
+    path, md5 = entry["path"], entry.get("md5")
+    if md5 is None:
+        return {}
+    manifest_path = find_cache_object(cache_dir, md5) if md5.endswith(".dir") else None
+    if manifest_path is None:
+        return {path: md5}
+    with open(manifest_path, "r") as f:
+        return {
+            os.path.join(path, item["relpath"]): item["md5"] for item in json.load(f)
+        }
+
+
+def collect_commit_hashes(
+    repo_path, commit, dvc_yaml, cache_dir, unchanged=None, lock=None
+):
+    """
+    Собирает хэши всех deps и outs стадий по dvc.lock заданного коммита.
+
+    Записи из unchanged (см. unchanged_lock_entries) не проверяются на наличие
+    в кэше: их файлы не будут читаться, достаточно хэшей.
+
+    :param repo_path: Путь к репозиторию.
+    :param commit: Хэш коммита.
+    :param dvc_yaml: Содержимое dvc.yaml (см. read_dvc_yaml).
+    :param cache_dir: Папка кэша DVC.
+    :param unchanged: Словарь {стадия: множество путей неизменённых записей}.
+    :param lock: Уже прочитанный dvc.lock коммита (иначе читается через git show).
+    :return: Кортеж ({стадия: {файл: md5}}, {стадия: множество отсутствующих хэшей}).
+    """
+    if lock is None:
+        lock = read_dvc_lock(repo_path, commit)
+    unchanged = unchanged or {}
+
+    files = {}
+    missing = {}
+    for stage, stage_def in dvc_yaml["stages"].items():
+        files[stage] = {}
+        skipped = unchanged.get(stage, set())
+        for path, entry in _tracked_lock_entries(lock, stage, stage_def).items():
+            if path in skipped:
+                files[stage].update(_expand_unchanged_entry(entry, cache_dir))
+                continue
+            entry_files, entry_missing = expand_lock_entry(entry, cache_dir)
+            files[stage].update(entry_files)
+            if entry_missing:
+                missing.setdefault(stage, set()).update(entry_missing)
+    return files, missing
+
+
+def artifact_dir(file, extensions):
+    """
+    Возвращает папку-артефакт (например, train.csr), которой принадлежит файл.
+
+    :param file: Путь файла относительно корня репозитория.
+    :param extensions: Расширения папок-артефактов (см. handlers.directory_extensions).
+    :return: Путь папки или None.
+    """
+    parent = os.path.dirname(file)
+    name = os.path.basename(parent)
+    if "." in name and name.split(".")[-1].lower() in extensions:
+        return parent
+    return None
+
+
+def group_artifact_files(files, extensions):
+    """
+    Объединяет файлы папок-артефактов в один артефакт на папку.
+
+    Хэш артефакта считается по хэшам его файлов, поэтому он меняется
+    при изменении любого из них.
+
+    :param files: Словарь {файл: md5}.
+    :param extensions: Расширения папок-артефактов (см. handlers.directory_extensions).
+    :return: Словарь {файл или папка-артефакт: md5}.
+    """
+    grouped = {}
+    members = {}
+    for file, md5 in files.items():
+        artifact = artifact_dir(file, extensions)
+        if artifact is None:
+            grouped[file] = md5
+        else:
+            members.setdefault(artifact, []).append((os.path.basename(file), md5))
+    for artifact, items in members.items():
+        digest = hashlib.md5(
+            "\n".join(f"{name}:{md5}" for name, md5 in sorted(items)).encode()
+        )
+        grouped[artifact] = digest.hexdigest() + "." + artifact.split(".")[-1].lower()
+    return grouped
+
+
+def fetch_missing_objects(repo_path, commit, stages):
+    """
+    Загружает в локальный кэш DVC объекты только для заданных стадий.
+
+    dvc fetch скачивает лишь отсутствующие в кэше объекты и не трогает
+    рабочую копию; worktree из пула разделяет кэш с исходным репозиторием.
+    Без --with-deps dvc fetch <стадия> загружает только outs стадии, а её deps
+    (выходы предыдущих стадий и файлы .dvc) остались бы без объектов.
+
+    :param repo_path: Путь к репозиторию.
+    :param commit: Хэш коммита.
+    :param stages: Список стадий, для которых не хватает объектов.
+    """
+    with acquire_worktree(repo_path, commit) as worktree:
+        try:
+            subprocess.run(["dvc", "fetch", "--with-deps", *stages], cwd=worktree, check=True)
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            print(f"Warning: Could not fetch DVC objects for {stages}. Error: {e}")
+
+
+def link_cached_files(files, cache_dir, target_dir):
+    """
+    Создаёт в target_dir символические ссылки на объекты кэша DVC.
+
+    Данные не копируются: ссылка сохраняет исходное имя (и расширение) файла.
+
+    :param files: Словарь {файл: md5}.
+    :param cache_dir: Папка кэша DVC.
+    :param target_dir: Папка, в которой создаются ссылки.
+    :return: Список файлов, для которых ссылка создана.
+    """
+    linked = []
+    for file, md5 in files.items():
+        source = find_cache_object(cache_dir, md5)
+        if source is None:
+            print(f"Warning: {file} ({md5}) is missing in DVC cache")
+            continue
+        target = os.path.join(target_dir, file)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.lexists(target):
+            os.remove(target)
+        os.symlink(source, target)
+        linked.append(file)
+    return linked
@@ -0,0 +1,110 @@
+"""
+Сравнение прежнего (построчно-столбцового) и текущего (векторизованного)
+расчёта метрики риска.
+
+Запуск:
+    python -m cim.benchmarks.risk_kernel --rows 10000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from cim.analysis import calculate_risk
+from cim.profile import profile_table
+
+
+def legacy_calculate_risk(old_data, new_data, weights=None):
+    """Прежняя реализация calculate_risk (до профилей) - только для сравнения."""
+    R_0, C_0 = old_data.shape
+    R_t, C_t = new_data.shape
+
+    D_0 = 0
+    D_t = 0
+    for col_idx in range(C_0):
+        if np.issubdtype(old_data[:, col_idx].dtype, np.number):
+            D_0 += len(old_data[:, col_idx]) - len(np.unique(old_data[:, col_idx]))
+            D_t += len(new_data[:, col_idx]) - len(np.unique(new_data[:, col_idx]))
+
+    N_0 = 0
+    N_t = 0
+    for col_idx in range(C_0):
+        if np.issubdtype(old_data[:, col_idx].dtype, np.number):
+            N_0 += np.isnan(old_data[:, col_idx]).sum()
+            N_t += np.isnan(new_data[:, col_idx]).sum()
+
+    delta_R = (R_t - R_0) / R_0 if R_0 > 0 else 0
+    delta_C = (C_t - C_0) / C_0 if C_0 > 0 else 0
+    delta_D = (D_t - D_0) / R_0 if R_0 > 0 else 0
+    delta_N = (N_t - N_0) / (R_0 * C_0) if R_0 * C_0 > 0 else 0
+
+    if weights is None:
+        weights = {"rows": 0.2, "columns": 0.2, "duplicates": 0.4, "nulls": 0.2}
+
+    return (
+        weights["rows"] * abs(delta_R)
+        + weights["columns"] * abs(delta_C)
+        + weights["duplicates"] * abs(delta_D)
+        + weights["nulls"] * abs(delta_N)
+    )
+
+
+def make_table(rows, seed):
+    """Таблица, похожая на data/prepared/*.tsv: id, метка и текст."""
+    rng = np.random.default_rng(seed)
+    values = rng.random(rows)
+    values[rng.random(rows) < 0.01] = np.nan
+    words = np.array(["r", "python", "pandas", "numpy", "dvc", "git"], dtype=object)
+    return pd.DataFrame(
+        {
+            "id": rng.integers(0, rows, rows),
+            "label": rng.integers(0, 2, rows),
+            "score": values,
+            "text": words[rng.integers(0, len(words), rows)],
+        }
+    )
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк расчёта метрики риска.")
+    parser.add_argument("--rows", type=int, default=10_000_000, help="Число строк.")
+    args = parser.parse_args()
+
+    old_df = make_table(args.rows, seed=1)
+    new_df = make_table(args.rows + args.rows // 10, seed=2)
+
+    # Прежний путь: DataFrame -> object-массив (как делал load_table_as_numpy);
+    # проверки np.issubdtype на нём не срабатывают, дубликаты и пустые теряются
+    legacy_q, legacy_time = timed(
+        legacy_calculate_risk, old_df.to_numpy(), new_df.to_numpy()
+    )
+    # Лучший случай для прежнего пути: только числовые столбцы, массив float
+    numeric = ["id", "label", "score"]
+    legacy_num_q, legacy_num_time = timed(
+        legacy_calculate_risk,
+        old_df[numeric].to_numpy(dtype=float),
+        new_df[numeric].to_numpy(dtype=float),
+    )
+    q, vectorized_time = timed(calculate_risk, old_df, new_df)
+    q_num, vectorized_num_time = timed(
+        calculate_risk, old_df[numeric], new_df[numeric]
+    )
+    _, profile_time = timed(profile_table, new_df)
+
+    print(f"rows: {args.rows}")
+    print(f"legacy, object array:     Q={legacy_q:.6f}  {legacy_time:.2f}s")
+    print(f"legacy, numeric columns:  Q={legacy_num_q:.6f}  {legacy_num_time:.2f}s")
+    print(f"vectorized, numeric:      Q={q_num:.6f}  {vectorized_num_time:.2f}s")
+    print(f"vectorized, all columns:  Q={q:.6f}  {vectorized_time:.2f}s")
+    print(f"profile of one side (reused for the base): {profile_time:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
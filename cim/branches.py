@@ -1,52 +1,51 @@
-import shutil
-import subprocess
-
 from cim.commits import analyze_two_commits_with_cache
-from cim.utils import clone_and_prepare_repo
-
-
-def compare_branches(repo_path, branch1, branch2, output_dir):
+from cim.utils import resolve_refs
+
+
+def compare_branches(
+    repo_path,
+    branch1,
+    branch2,
+    output_dir,
+    chunksize=None,
+    approx_error=None,
+    jobs=1,
+    model_sample=0,
+    row_key=None,
+    drift=False,
+):
     """
     Сравнивает HEAD коммиты двух веток и записывает результаты в output_dir.
 
+    Ветки разрешаются в хэши напрямую в исходном репозитории, без checkout.
+
     :param repo_path: Путь к репозиторию.
     :param branch1: Первая ветка.
     :param branch2: Вторая ветка.
     :param output_dir: Папка для сохранения результатов.
+    :param chunksize: Если задан, таблицы читаются потоково частями по chunksize строк.
+    :param approx_error: Если задан, дубликаты оцениваются приближённо (HyperLogLog).
+    :param jobs: Число параллельных процессов для обработки файлов.
+    :param model_sample: Размер выборки для сравнения предсказаний моделей (0 - не сравнивать).
+    :param row_key: Ключ построчного сравнения таблиц (None - не сравнивать, см. cim.rowdiff).
+    :param drift: Считать метрики дрейфа распределений столбцов (см. cim.drift).
     """
-    temp_repo = clone_and_prepare_repo(repo_path)
     try:
         # Получаем последний коммит для каждой ветки
-        subprocess.run(
-            ["git", "checkout", branch1],
-            cwd=temp_repo,
-            check=True,
-        )
-        head_commit_branch1 = subprocess.run(
-            ["git", "rev-parse", "HEAD"],
-            cwd=temp_repo,
-            capture_output=True,
-            text=True,
-        ).stdout.strip()
-
-        subprocess.run(
-            ["git", "checkout", branch2],
-            cwd=temp_repo,
-            check=True,
-        )
-        head_commit_branch2 = subprocess.run(
-            ["git", "rev-parse", "HEAD"],
-            cwd=temp_repo,
-            capture_output=True,
-            text=True,
-        ).stdout.strip()
+        heads = resolve_refs(repo_path, [branch1, branch2])
 
         analyze_two_commits_with_cache(
-            repo_path, head_commit_branch1, head_commit_branch2, output_dir
+            repo_path,
+            heads[branch1],
+            heads[branch2],
+            output_dir,
+            chunksize=chunksize,
+            approx_error=approx_error,
+            jobs=jobs,
+            model_sample=model_sample,
+            row_key=row_key,
+            drift=drift,
         )
 
     except Exception as e:
         print(f"Error comparing branches {branch1} and {branch2}: {e}")
-
-    finally:
-        shutil.rmtree(temp_repo)
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from cim.analysis import DEFAULT_WEIGHTS, RISK_VERSION
+
+CACHE_DIR = os.path.join(".cim", "cache")
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def make_cache_key(old_hash, new_hash, weights=None, mode="exact", kind=None):
+    """
+    Строит ключ кэша результата сравнения двух версий файла.
+
+    :param old_hash: Хэш содержимого старой версии (None, если файла не было).
+    :param new_hash: Хэш содержимого новой версии (None, если файл удалён).
+    :param weights: Веса метрики риска (None - веса по умолчанию).
+    :param mode: Режим профилей (см. cim.profile.profile_mode).
+    :param kind: Тип файла (см. cim.handlers.file_type).
+    :return: Ключ (hex-строка sha256).
+    """
+    payload = json.dumps(
+        [old_hash, new_hash, RISK_VERSION, weights or DEFAULT_WEIGHTS, mode, kind],
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_path(cache_dir, key):
+    return os.path.join(cache_dir, key[:2], key[2:] + ".json")
+
+
+def load_cached_result(cache_dir, key):
+    """
+    Возвращает сохранённый результат по ключу и отмечает его как использованный.
+
+    :param cache_dir: Папка кэша.
+    :param key: Ключ (см. make_cache_key).
+    :return: Сохранённый словарь или None, если записи нет.
+    """
+    path = _entry_path(cache_dir, key)
+    try:
+        with open(path, "r") as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # mtime служит отметкой последнего использования для LRU
+    os.utime(path)
+    return result
+
+
+def store_cached_result(cache_dir, key, result):
+    """
+    Сохраняет результат в кэш.
+
+    Размер кэша не проверяется: evict_cached_results вызывается один раз
+    после анализа, а не на каждую запись.
+
+    :param cache_dir: Папка кэша.
+    :param key: Ключ (см. make_cache_key).
+    :param result: Сериализуемый в JSON словарь.
+    """
+    path = _entry_path(cache_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Запись через временный файл, чтобы параллельные запуски не видели обрывков
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(result, f)
+    os.replace(temp_path, path)
+
+
+def evict_cached_results(cache_dir, max_bytes=MAX_CACHE_BYTES):
+    """
+    Удаляет давно не использовавшиеся записи, пока кэш больше max_bytes (LRU).
+
+    :param cache_dir: Папка кэша.
+    :param max_bytes: Максимальный суммарный размер кэша.
+    :return: Количество удалённых записей.
+    """
+    if not os.path.isdir(cache_dir):
+        return 0
+
+    entries = []
+    for root, _, files in os.walk(cache_dir):
+        for file in files:
+            if file.endswith(".json"):
+                stat = os.stat(os.path.join(root, file))
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, file)))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,261 @@
+"""
+Профили колоночных форматов (Parquet, Feather/Arrow) через pyarrow.
+
+Parquet хранит в метаданных (футере) число строк и статистики групп строк,
+поэтому профиль строится по футеру, а читаются только столбцы, статистик
+которых не хватает. Feather читается через отображение в память,
+статистики столбцов считаются средствами Arrow без перевода в pandas.
+"""
+from cim.consumer import DEFAULT_CHUNKSIZE
+from cim.profile import ColumnProfile, TableProfile, profile_chunks, profile_table
+
+
+def _has_min_max(arrow_type):
+    import pyarrow.types as types
+
+    return types.is_integer(arrow_type) or types.is_floating(arrow_type)
+
+
+def _group_distinct(statistics, rows):
+    """Число различных непустых значений группы строк по статистикам или None."""
+    if rows == statistics.null_count:
+        return 0
+    if statistics.has_distinct_count:
+        return int(statistics.distinct_count)
+    if statistics.has_min_max and statistics.min == statistics.max:
+        return 1
+    return None
+
+
+def _merge_distinct(groups):
+    """
+    Число различных значений столбца по группам строк или None.
+
+    Различные значения групп складываются, только если диапазоны
+    [min, max] групп не пересекаются (например, отсортированный столбец id),
+    или если во всех группах одно и то же значение.
+
+    :param groups: Список (min, max, distinct) непустых групп.
+    """
+    if len(groups) <= 1:
+        return sum(distinct for _, _, distinct in groups)
+    if any(low is None for low, _, _ in groups):
+        return None
+    values = {low for low, high, _ in groups} | {high for _, high, _ in groups}
+    if len(values) == 1:
+        return 1
+    groups = sorted(groups, key=lambda group: group[0])
+    for (_, previous_high, _), (low, _, _) in zip(groups, groups[1:]):
+        if not previous_high < low:
+            return None
+    return sum(distinct for _, _, distinct in groups)
+
+
+def _footer_column(field, chunks):
+    """
+    Профиль столбца по статистикам групп строк.
+
+    :param field: Поле схемы Arrow.
+    :param chunks: Список (statistics, число строк) по группам строк.
+    :return: ColumnProfile или None, если статистик не хватает.
+    """
+    import pyarrow.types as types
+
+    rows = sum(group_rows for _, group_rows in chunks)
+    if types.is_null(field.type):
+        # У столбца типа null статистик нет: все значения пустые
+        return ColumnProfile(
+            name=field.name,
+            dtype=str(field.type),
+            duplicates=max(rows - 1, 0),
+            nulls=rows,
+            distinct=min(rows, 1),
+        )
+    if any(statistics is None or not statistics.has_null_count for statistics, _ in chunks):
+        return None
+    nulls = sum(int(statistics.null_count) for statistics, _ in chunks)
+    groups = []
+    for statistics, group_rows in chunks:
+        distinct = _group_distinct(statistics, group_rows)
+        if distinct is None:
+            return None
+        if distinct:
+            bounds = (statistics.min, statistics.max) if statistics.has_min_max else (None, None)
+            groups.append((*bounds, distinct))
+    distinct = _merge_distinct(groups)
+    if distinct is None:
+        return None
+    min_value = max_value = None
+    if groups and _has_min_max(field.type) and all(low is not None for low, _, _ in groups):
+        min_value = float(min(low for low, _, _ in groups))
+        max_value = float(max(high for _, high, _ in groups))
+    # В Parquet distinct_count не учитывает пустые значения, а в профиле
+    # пустое значение считается одним значением (см. profile_table)
+    distinct += nulls > 0
+    return ColumnProfile(
+        name=field.name,
+        dtype=str(field.type),
+        duplicates=rows - distinct,
+        nulls=nulls,
+        distinct=distinct,
+        min=min_value,
+        max=max_value,
+    )
+
+
+def data_fields(schema):
+    """
+    Поля схемы Arrow без сохранённого pandas индекса (__index_level_0__ и т.п.):
+    в профиль таблицы, прочитанной через pandas, индекс не входит.
+    """
+    metadata = schema.pandas_metadata or {}
+    index = {name for name in metadata.get("index_columns", []) if isinstance(name, str)}
+    return [field for field in schema if field.name not in index]
+
+
+def footer_columns(parquet_file):
+    """
+    Профили столбцов Parquet-файла только по метаданным (футеру).
+
+    Число строк и пустых значений хранится в статистиках групп строк почти
+    всегда, число различных значений - только если его записал писатель
+    файла, либо оно выводится из min/max (см. _merge_distinct).
+
+    :param parquet_file: pyarrow.parquet.ParquetFile.
+    :return: Список ColumnProfile по столбцам (см. data_fields); None на месте
+             столбцов, которые придётся прочитать.
+    """
+    import pyarrow.types as types
+
+    metadata = parquet_file.metadata
+    # Листовые столбцы футера по полям верхнего уровня
+    leaves = {}
+    for index in range(metadata.num_columns):
+        name = metadata.schema.column(index).path.split(".")[0]
+        leaves.setdefault(name, []).append(index)
+
+    groups = [metadata.row_group(index) for index in range(metadata.num_row_groups)]
+    columns = []
+    for field in data_fields(parquet_file.schema_arrow):
+        indices = leaves.get(field.name, [])
+        if types.is_nested(field.type) or len(indices) != 1:
+            columns.append(None)
+            continue
+        chunks = [
+            (group.column(indices[0]).statistics, group.num_rows)
+            for group in groups
+            if group.num_rows
+        ]
+        columns.append(_footer_column(field, chunks))
+    return columns
+
+
+def footer_profile(parquet_file):
+    """
+    Профиль Parquet-файла только по метаданным.
+
+    :param parquet_file: pyarrow.parquet.ParquetFile.
+    :return: TableProfile или None, если статистик футера недостаточно.
+    """
+    columns = footer_columns(parquet_file)
+    if None in columns:
+        return None
+    rows = parquet_file.metadata.num_rows
+    return TableProfile(rows=rows, columns=len(columns), column_profiles=columns)
+
+
+def profile_parquet(path, chunksize=None, precision=None):
+    """
+    Строит профиль Parquet-файла (профилировщик обработчика parquet).
+
+    Статистики берутся из футера; читаются только столбцы, для которых
+    их не хватает (с chunksize или precision - потоково, по группам строк). Если футера достаточно
+    для всех столбцов, данные не читаются вовсе.
+
+    :param path: Путь к файлу.
+    :param chunksize: Число строк в одной части при чтении данных.
+    :param precision: Точность HyperLogLog для приближённого режима (None - точный).
+    :return: TableProfile.
+    """
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    columns = footer_columns(parquet_file)
+    missing = [
+        field.name
+        for field, column in zip(data_fields(parquet_file.schema_arrow), columns)
+        if column is None
+    ]
+    if missing:
+        if chunksize or precision:
+            chunks = iter_parquet_chunks(
+                path, chunksize or DEFAULT_CHUNKSIZE, columns=missing
+            )
+            scanned = profile_chunks(chunks, precision)
+        else:
+            scanned = profile_table(parquet_file.read(columns=missing).to_pandas())
+        scanned = iter(scanned.column_profiles)
+        columns = [next(scanned) if column is None else column for column in columns]
+    rows = parquet_file.metadata.num_rows
+    return TableProfile(rows=rows, columns=len(columns), column_profiles=columns)
+
+
+def iter_parquet_chunks(path, chunksize=DEFAULT_CHUNKSIZE, columns=None):
+    """
+    Читает Parquet-файл потоково частями по chunksize строк.
+
+    :param path: Путь к файлу.
+    :param chunksize: Число строк в одной части.
+    :param columns: Читаемые столбцы (None - все).
+    :return: Итератор pandas.DataFrame.
+    """
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+        yield batch.to_pandas()
+
+
+def profile_feather(path, chunksize=None, precision=None):
+    """
+    Строит профиль Feather/Arrow-файла (профилировщик обработчика feather).
+
+    Файл отображается в память; пустые значения берутся из метаданных
+    массивов, число различных значений и диапазон считаются Arrow.
+
+    :param path: Путь к файлу.
+    :param chunksize: Не используется.
+    :param precision: Не используется: профиль всегда точный.
+    :return: TableProfile.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.feather as feather
+
+    table = feather.read_table(path, memory_map=True)
+    rows = table.num_rows
+    columns = []
+    for field in data_fields(table.schema):
+        column = table.column(field.name)
+        try:
+            # mode="all": пустое значение считается одним значением
+            distinct = pc.count_distinct(column, mode="all").as_py()
+        except pa.ArrowNotImplementedError:
+            # Вложенные типы сравниваются через pandas
+            return profile_table(table.to_pandas())
+        min_value = max_value = None
+        if _has_min_max(field.type):
+            bounds = pc.min_max(column).as_py()
+            min_value, max_value = bounds["min"], bounds["max"]
+        columns.append(
+            ColumnProfile(
+                name=field.name,
+                dtype=str(field.type),
+                duplicates=rows - distinct,
+                nulls=column.null_count,
+                distinct=distinct,
+                min=None if min_value is None else float(min_value),
+                max=None if max_value is None else float(max_value),
+            )
+        )
+    return TableProfile(rows=rows, columns=len(columns), column_profiles=columns)
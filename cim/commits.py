@@ -1,98 +1,554 @@
 import os
 import shutil
-import subprocess
 import tempfile
-
-import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
 from cim.utils import (
-    clone_and_prepare_repo,
-    pull_dvc_cache,
+    get_dvc_cache_dir,
     save_metrics_to_file,
     read_dvc_yaml,
-    get_file_diff_stats,
+    get_diff_numstat,
+    run_tasks,
 )
 from cim.analysis import calculate_risk
-from cim.consumer import load_table_as_numpy
+from cim.artifacts import (
+    artifact_dir,
+    collect_commit_hashes,
+    diff_dvc_locks,
+    fetch_missing_objects,
+    group_artifact_files,
+    link_cached_files,
+    read_dvc_lock,
+    unchanged_lock_entries,
+)
+from cim.cache import (
+    CACHE_DIR,
+    evict_cached_results,
+    load_cached_result,
+    make_cache_key,
+    store_cached_result,
+)
+from cim.handlers import directory_extensions, file_type, get_handler, resolve
+
+# Модули с numpy и pandas (cim.profile, cim.sparse, cim.sketches, обработчики
+# файлов) импортируются внутри функций: при изменениях только в коде
+# (deps_py) они не нужны.
+
+
+def load_file_profile(
+    file_path, content_hash=None, profile_dir=None, chunksize=None, precision=None
+):
+    """
+    Возвращает профиль таблицы, загружая файл только если профиля ещё нет.
+
+    :param file_path: Путь к файлу.
+    :param content_hash: Хэш содержимого файла.
+    :param profile_dir: Папка кэша DVC, рядом с которым хранятся профили.
+    :param chunksize: Если задан, файл читается потоково частями по chunksize строк.
+    :param precision: Точность HyperLogLog для приближённого режима (None - точный).
+    :return: TableProfile (пустой, если файла нет или его тип не поддерживается).
+    """
+    from cim.profile import TableProfile, load_profile, profile_mode, save_profile
+
+    if not os.path.exists(file_path):
+        return TableProfile(rows=0, columns=0)
+
+    mode = profile_mode(precision, chunksize)
+    kind = file_type(file_path)
+    use_profiles = profile_dir and content_hash
+    if use_profiles:
+        profile = load_profile(profile_dir, content_hash, mode, kind)
+        if profile is not None:
+            return profile
+
+    handler = get_handler(file_path)
+    if handler is None or handler.profiler is None:
+        file_extension = file_path.split(".")[-1].lower()
+        print(f"Unsupported file extension: {file_extension}; file {file_path} ignored")
+        profile = TableProfile(rows=0, columns=0)
+    else:
+        profiler = resolve(handler.profiler)
+        profile = profiler(file_path, chunksize=chunksize, precision=precision)
+    if use_profiles:
+        save_profile(profile_dir, content_hash, profile, mode, kind)
+    return profile
+
+
+def format_file_metric(risk, old_profile, new_profile):
+    """
+    Формирует запись метрики файла для итогового JSON.
+
+    Для точных профилей это само значение риска; в приближённом режиме рядом
+    с риском выводятся оценки дубликатов и их погрешность, для разреженных
+    матриц - их статистики (см. sparse.sparse_metric).
+
+    :param risk: Значение риска.
+    :param old_profile: Профиль старой версии (TableProfile).
+    :param new_profile: Профиль новой версии (TableProfile).
+    :return: float или словарь.
+    """
+    if old_profile.nonzero is not None or new_profile.nonzero is not None:
+        from cim.sparse import sparse_metric
+
+        return sparse_metric(risk, old_profile, new_profile)
+    if not (old_profile.approximate or new_profile.approximate):
+        return risk
+
+    errors = [
+        column.distinct_error
+        for profile in (old_profile, new_profile)
+        for column in profile.column_profiles
+        if column.distinct_error is not None
+    ]
+    return {
+        "risk": risk,
+        "duplicates": {
+            "old": old_profile.duplicates,
+            "new": new_profile.duplicates,
+            "old_error": round(old_profile.duplicates_error),
+            "new_error": round(new_profile.duplicates_error),
+        },
+        "relative_error": max(errors),
+    }
+
+
+def process_file_changes(
+    file: str,
+    temp_old_dir,
+    temp_new_dir,
+    old_hash=None,
+    new_hash=None,
+    cache_dir=None,
+    profile_dir=None,
+    chunksize=None,
+    precision=None,
+    sample=None,
+    jobs=1,
+    row_key=None,
+    drift=False,
+):
+    """
+    Рассчитывает риск изменения файла между двумя версиями.
+
+    Профиль строится обработчиком типа файла (см. cim.handlers); обработчик
+    может и сам сравнить версии (comparer), как для моделей.
+    Риск считается по профилям таблиц (см. cim.profile): профиль версии,
+    уже посчитанный ранее, берётся из profile_dir без загрузки файла.
+    Если задан cache_dir, результат ищется в кэше по хэшам содержимого
+    (см. cim.cache) и сохраняется туда вместе с профилями.
 
+    :param file: Путь к файлу относительно корня репозитория.
+    :param temp_old_dir: Папка с файлами старого коммита.
+    :param temp_new_dir: Папка с файлами нового коммита.
+    :param old_hash: Хэш старой версии файла.
+    :param new_hash: Хэш новой версии файла.
+    :param cache_dir: Папка кэша результатов.
+    :param profile_dir: Папка кэша DVC, рядом с которым хранятся профили.
+    :param chunksize: Если задан, таблицы читаются потоково частями по chunksize строк.
+    :param precision: Точность HyperLogLog для приближённого режима (None - точный).
+    :param sample: Выборка признаков для сравнения предсказаний моделей
+                   (см. models.process_model_changes).
+    :param jobs: n_jobs для предсказаний моделей.
+    :param row_key: Если задан, таблицы ещё и сравниваются построчно
+                    (см. cim.rowdiff): по ключевому столбцу row_key или,
+                    если это пустая строка, по хэшам строк.
+    :param drift: Добавить к метрике таблицы метрики дрейфа распределений
+                  столбцов (см. cim.drift).
+    :return: Метрика файла (см. format_file_metric) или None, если файла нет ни в одной версии.
+    """
+    from cim.profile import TableProfile, profile_mode
 
-def process_file_changes(file: str, temp_old_dir, temp_new_dir):
     old_file_path = os.path.join(temp_old_dir, file)
     new_file_path = os.path.join(temp_new_dir, file)
 
     if not os.path.exists(old_file_path) and not os.path.exists(new_file_path):
         return None
 
-    old_data = (
-        load_table_as_numpy(old_file_path)
-        if os.path.exists(old_file_path)
-        else np.empty((0, 0))
+    handler = get_handler(new_file_path if os.path.exists(new_file_path) else old_file_path)
+    if handler is not None and handler.comparer is not None:
+        # Например, модели сравниваются по структуре, а не как таблицы
+        metric = resolve(handler.comparer)(
+            file,
+            temp_old_dir,
+            temp_new_dir,
+            old_hash,
+            new_hash,
+            cache_dir,
+            profile_dir,
+            sample=sample,
+            jobs=jobs,
+        )
+        if metric is not None:
+            return metric
+
+    use_cache = cache_dir and (old_hash or new_hash)
+    if use_cache:
+        cache_key = make_cache_key(
+            old_hash,
+            new_hash,
+            mode=profile_mode(precision, chunksize),
+            kind=file_type(new_file_path if os.path.exists(new_file_path) else old_file_path),
+        )
+        cached = load_cached_result(cache_dir, cache_key)
+        if cached is not None:
+            metric = format_file_metric(
+                cached["risk"],
+                TableProfile.from_dict(cached["old"]),
+                TableProfile.from_dict(cached["new"]),
+            )
+            return _with_table_reports(
+                metric,
+                handler,
+                file,
+                temp_old_dir,
+                temp_new_dir,
+                old_hash,
+                new_hash,
+                cache_dir,
+                row_key,
+                drift,
+                profile_dir,
+                chunksize,
+            )
+
+    # Версии загружаются по очереди: в памяти не бывает двух таблиц сразу
+    old_profile = load_file_profile(
+        old_file_path, old_hash, profile_dir, chunksize, precision
     )
-    new_data = (
-        load_table_as_numpy(new_file_path)
-        if os.path.exists(new_file_path)
-        else np.empty((0, 0))
+    new_profile = load_file_profile(
+        new_file_path, new_hash, profile_dir, chunksize, precision
     )
 
     try:
-        risk = calculate_risk(old_data, new_data)
+        risk = calculate_risk(old_profile, new_profile)
     except Exception as e:
         print(f"Error calculating risk for {file}: {str(e)}")
         return 0
-    return risk
 
+    if use_cache:
+        store_cached_result(
+            cache_dir,
+            cache_key,
+            {
+                "file": file,
+                "risk": risk,
+                "old": old_profile.to_dict(),
+                "new": new_profile.to_dict(),
+            },
+        )
+    metric = format_file_metric(risk, old_profile, new_profile)
+    return _with_table_reports(
+        metric,
+        handler,
+        file,
+        temp_old_dir,
+        temp_new_dir,
+        old_hash,
+        new_hash,
+        cache_dir,
+        row_key,
+        drift,
+        profile_dir,
+        chunksize,
+    )
 
-def save_commit_files(repo_path, commit, temp_dir, dvc_yaml):
+
+def _with_table_reports(
+    metric,
+    handler,
+    file,
+    temp_old_dir,
+    temp_new_dir,
+    old_hash,
+    new_hash,
+    cache_dir,
+    row_key,
+    drift,
+    profile_dir,
+    chunksize,
+):
+    """
+    Добавляет к метрике таблицы построчное сравнение (rows) и метрики
+    дрейфа распределений (drift), если они запрошены.
+    """
+    if (row_key is None and not drift) or handler is None or handler.loader is None:
+        return metric
+    metric = dict(metric) if isinstance(metric, dict) else {"risk": metric}
+    if row_key is not None:
+        from cim.rowdiff import process_row_diff
+
+        metric["rows"] = process_row_diff(
+            file,
+            temp_old_dir,
+            temp_new_dir,
+            old_hash,
+            new_hash,
+            cache_dir,
+            key=row_key or None,
+            chunksize=chunksize,
+        )
+    if drift:
+        from cim.drift import process_drift
+
+        metric["drift"] = process_drift(
+            file,
+            temp_old_dir,
+            temp_new_dir,
+            old_hash,
+            new_hash,
+            profile_dir,
+            chunksize=chunksize,
+        )
+    return metric
+
+
+def save_commit_files(
+    repo_path, commit, temp_dir, dvc_yaml, unchanged=None, lock=None
+):
     """
     Сохраняет файлы для заданного коммита в временную папку.
 
+    Хэши deps и outs читаются из dvc.lock через git show, без checkout, а сами
+    файлы связываются ссылками прямо из кэша DVC. dvc fetch запускается только
+    для стадий, объектов которых нет в локальном кэше. Файлы неизменённых
+    записей dvc.lock (unchanged) не связываются и не загружаются - для них
+    возвращаются только хэши.
+
     :param repo_path: Путь к репозиторию.
     :param commit: Хэш коммита.
     :param temp_dir: Временная папка для сохранения файлов.
-    :return: Список сохраненных файлов.
+    :param unchanged: Словарь {стадия: множество путей неизменённых записей}.
+    :param lock: Уже прочитанный dvc.lock коммита.
+    :return: Словарь {стадия: {файл: md5}} сохраненных файлов.
     """
+    cache_dir = get_dvc_cache_dir(repo_path)
+    unchanged = unchanged or {}
+    files, missing = collect_commit_hashes(
+        repo_path, commit, dvc_yaml, cache_dir, unchanged, lock
+    )
+    if missing:
+        fetch_missing_objects(repo_path, commit, sorted(missing))
+        files, _ = collect_commit_hashes(
+            repo_path, commit, dvc_yaml, cache_dir, unchanged, lock
+        )
+
+    for stage, stage_files in files.items():
+        skipped = [
+            file
+            for file in stage_files
+            if _in_entries(file, unchanged.get(stage, ()))
+        ]
+        linked = link_cached_files(
+            {file: md5 for file, md5 in stage_files.items() if file not in skipped},
+            cache_dir,
+            temp_dir,
+        )
+        files[stage] = {file: stage_files[file] for file in sorted(linked + skipped)}
+    return files
 
-    subprocess.run(
-        ["git", "checkout", commit],
-        cwd=repo_path,
-        check=True,
-    ).stdout
-    pull_dvc_cache(repo_path)
 
-    files = {}
+def _in_entries(file, paths):
+    """Принадлежит ли file одной из записей dvc.lock (файлу или папке) из paths."""
+    return any(
+        file == path or file.startswith(path.rstrip("/") + "/") for path in paths
+    )
+
+
+def _model_sample(members, hashes, temp_dir, dvc_cache_dir, rows):
+    """
+    Выбирает матрицу признаков стадии для сравнения предсказаний моделей.
+
+    Файлы матрицы связываются из кэша DVC, даже если запись dvc.lock не
+    изменилась и файлы не сохранялись (см. save_commit_files).
+    """
+    matrices = sorted(
+        file
+        for file in hashes
+        if getattr(get_handler(file), "name", None) == "csr"
+    )
+    if not matrices:
+        return None
+    matrix = matrices[0]
+    extensions = directory_extensions()
+    link_cached_files(
+        {
+            file: md5
+            for file, md5 in members.items()
+            if artifact_dir(file, extensions) == matrix
+        },
+        dvc_cache_dir,
+        temp_dir,
+    )
+    return {"path": os.path.join(temp_dir, matrix), "hash": hashes[matrix], "rows": rows}
+
+
+def compare_commit_files(
+    repo_path: str,
+    old_commit: str,
+    new_commit: str,
+    dvc_yaml,
+    old_files,
+    new_files,
+    temp_old_dir,
+    temp_new_dir,
+    chunksize: int = None,
+    approx_error: float = None,
+    jobs: int = 1,
+    model_sample: int = 0,
+    row_key: str = None,
+    drift: bool = False,
+):
+    """
+    Рассчитывает метрики всех стадий для пары уже сохранённых коммитов.
+
+    Если задан model_sample, предсказания моделей (см. cim.models)
+    сравниваются на model_sample строках первой по порядку путей матрицы
+    признаков <имя>.csr из той же стадии нового коммита. Если задан
+    row_key, таблицы ещё и сравниваются построчно (см. cim.rowdiff), а при
+    drift - по распределениям столбцов (см. cim.drift).
+
+    :param repo_path: Путь к репозиторию.
+    :param old_commit: Хэш старого коммита.
+    :param new_commit: Хэш нового коммита.
+    :param dvc_yaml: Описание стадий (см. utils.read_dvc_yaml).
+    :param old_files: Файлы старого коммита {стадия: {файл: md5}} (см. save_commit_files).
+    :param new_files: Файлы нового коммита {стадия: {файл: md5}}.
+    :param temp_old_dir: Папка с файлами старого коммита.
+    :param temp_new_dir: Папка с файлами нового коммита.
+    :return: Словарь {стадия: {файл: метрика}}.
+    """
+    precision = None
+    if approx_error:
+        from cim.sketches import precision_for_error
+
+        precision = precision_for_error(approx_error)
+    cache_dir = os.path.join(repo_path, CACHE_DIR)
+    dvc_cache_dir = get_dvc_cache_dir(repo_path)
+
+    # Файлы папок-артефактов (например, матриц <имя>.csr) сравниваются
+    # как один артефакт
+    extensions = directory_extensions()
+    new_members = new_files
+    old_files = {
+        stage: group_artifact_files(files, extensions) for stage, files in old_files.items()
+    }
+    new_files = {
+        stage: group_artifact_files(files, extensions) for stage, files in new_files.items()
+    }
+
+    # Собираем задачи: один и тот же файл может входить в несколько
+    # стадий (outs одной и deps другой) - считаем его один раз
+    file_tasks = {}
+    stage_files = {}
     for stage in dvc_yaml["stages"]:
-        stage_files = (
-            dvc_yaml["stages"][stage]["deps"] + dvc_yaml["stages"][stage]["outs"]
-        )
-        files[stage] = []
-        for file in stage_files:
-            try:
-                full_path = os.path.join(repo_path, file)
-                print(full_path)
-                if os.path.isfile(full_path):
-                    shutil.copy2(full_path, os.path.join(temp_dir, file))
-                    files[stage].append(file)
-
-                elif os.path.isdir(full_path):
-                    shutil.copytree(full_path, os.path.join(temp_dir, file))
-                    files[stage].extend(
-                        [os.path.join(file, f) for f in os.listdir(full_path)]
+        old_hashes = old_files.get(stage, {})
+        new_hashes = new_files.get(stage, {})
+        stage_files[stage] = sorted(set(old_hashes) | set(new_hashes))
+        for file in stage_files[stage]:
+            task_key = (file, old_hashes.get(file), new_hashes.get(file))
+            # Одинаковый хэш - файл не изменился, читать его не нужно
+            if task_key[1] != task_key[2] and task_key not in file_tasks:
+                sample = None
+                handler = get_handler(file)
+                if model_sample and handler is not None and handler.comparer:
+                    sample = _model_sample(
+                        new_members.get(stage, {}),
+                        new_hashes,
+                        temp_new_dir,
+                        dvc_cache_dir,
+                        model_sample,
                     )
+                file_tasks[task_key] = dict(
+                    file=file,
+                    temp_old_dir=temp_old_dir,
+                    temp_new_dir=temp_new_dir,
+                    old_hash=task_key[1],
+                    new_hash=task_key[2],
+                    cache_dir=cache_dir,
+                    profile_dir=dvc_cache_dir,
+                    chunksize=chunksize,
+                    precision=precision,
+                    sample=sample,
+                    jobs=jobs,
+                    row_key=row_key,
+                    drift=drift,
+                )
+    # Каждый исполнитель пула и так занимает ядро: предсказания моделей в
+    # нём однопоточные, иначе при jobs исполнителях было бы jobs**2 потоков
+    if jobs > 1 and len(file_tasks) > 1:
+        for task in file_tasks.values():
+            task["jobs"] = 1
+    py_files = sorted(
+        {
+            file
+            for stage in dvc_yaml["stages"]
+            for file in dvc_yaml["stages"][stage]["deps_py"]
+        }
+    )
 
-            except Exception as e:
-                print(f"{commit} -- {file}: {str(e)}")
-    return files
+    print(f"Processing files: {sorted(task[0] for task in file_tasks)}")
+    file_results = dict(
+        zip(
+            file_tasks,
+            run_tasks(
+                process_file_changes,
+                list(file_tasks.values()),
+                jobs,
+                ProcessPoolExecutor,
+            ),
+        )
+    )
+    print(f"Processing source files: {py_files}")
+    diff_results = (
+        get_diff_numstat(repo_path, old_commit, new_commit, py_files)
+        if py_files
+        else {}
+    )
+
+    all_metrics = {}
+    for stage in dvc_yaml["stages"]:
+        old_hashes = old_files.get(stage, {})
+        new_hashes = new_files.get(stage, {})
+        all_metrics[stage] = {}
+        for file in stage_files[stage]:
+            task_key = (file, old_hashes.get(file), new_hashes.get(file))
+            all_metrics[stage][file] = file_results.get(task_key, 0.0)
+        for file in dvc_yaml["stages"][stage]["deps_py"]:
+            all_metrics[stage][file] = diff_results.get(
+                file, {"added": 0, "deleted": 0, "file": file}
+            )
+    return all_metrics
 
 
 def analyze_two_commits_with_cache(
-    repo_path: str, old_commit: str, new_commit: str, output_dir: str
+    repo_path: str,
+    old_commit: str,
+    new_commit: str,
+    output_dir: str,
+    chunksize: int = None,
+    approx_error: float = None,
+    jobs: int = 1,
+    model_sample: int = 0,
+    row_key: str = None,
+    drift: bool = False,
 ):
     """
     Анализирует изменения между двумя коммитами и записывает
     результаты в output_dir.
-    Работает с временным клоном репозитория.
+    Файлы берутся из кэша DVC по хэшам из dvc.lock; файлы с одинаковым
+    хэшем в обоих коммитах считаются неизменёнными и не загружаются.
+    Результаты по файлам кэшируются в .cim/cache репозитория (см. cim.cache).
+    Если задан chunksize, таблицы читаются потоково частями по chunksize строк.
+    Если задан approx_error, число различных значений оценивается скетчами
+    HyperLogLog с указанной относительной погрешностью (см. cim.sketches).
+    При jobs > 1 таблицы обрабатываются в пуле процессов (предсказания
+    моделей в нём однопоточные); порядок результатов от этого не зависит. Статистика по исходникам (deps_py) собирается одним
+    вызовом git diff на всю пару коммитов. Модели (.pkl) сравниваются по
+    структуре (см. cim.models), а при model_sample > 0 - ещё и по
+    предсказаниям на выборке из model_sample строк матрицы признаков.
+    Если задан row_key, таблицы ещё и сравниваются построчно (см. cim.rowdiff),
+    при drift - по распределениям столбцов (см. cim.drift).
     """
-    temp_repo = clone_and_prepare_repo(repo_path)
     temp_old_files = tempfile.mkdtemp()
     temp_new_files = tempfile.mkdtemp()
     try:
@@ -100,47 +556,48 @@ def analyze_two_commits_with_cache(
         print(f"Analyzing commit: {new_commit} (compare with {old_commit})")
 
         try:
-            dvc_yaml = read_dvc_yaml(temp_repo)
+            dvc_yaml = read_dvc_yaml(repo_path, new_commit)
+
+            # Предварительный проход: неизменённые записи dvc.lock не
+            # загружаются из кэша и получают Q=0
+            old_lock = read_dvc_lock(repo_path, old_commit)
+            new_lock = read_dvc_lock(repo_path, new_commit)
+            lock_diff = diff_dvc_locks(old_lock, new_lock, dvc_yaml)
+            statuses = {stage: diff["status"] for stage, diff in lock_diff.items()}
+            print(f"Stage status: {statuses}")
+            unchanged = unchanged_lock_entries(lock_diff)
 
             old_files = save_commit_files(
-                temp_repo, old_commit, temp_old_files, dvc_yaml
+                repo_path, old_commit, temp_old_files, dvc_yaml, unchanged, old_lock
             )
             print(f"Old commit files: {old_files}")
             new_files = save_commit_files(
-                temp_repo, new_commit, temp_new_files, dvc_yaml
+                repo_path, new_commit, temp_new_files, dvc_yaml, unchanged, new_lock
             )
             print(f"New commit files: {new_files}")
 
-            all_metrics = {}
-
-            for stage in dvc_yaml["stages"]:
-                stage_files = set()
-                stage_files.update(old_files[stage])
-                stage_files.update(new_files[stage])
-
-                print(f"Processing stage: {stage} files: {stage_files}")
-                all_metrics[stage] = {}
-                for file in stage_files:
-                    all_metrics[stage][file] = process_file_changes(
-                        file=file,
-                        temp_old_dir=temp_old_files,
-                        temp_new_dir=temp_new_files,
-                    )
-
-                print(
-                    f'Processing stage: {stage} files: {dvc_yaml["stages"][stage]["deps_py"]}'
-                )
-                for file in dvc_yaml["stages"][stage]["deps_py"]:
-                    all_metrics[stage][file] = get_file_diff_stats(
-                        file, old_commit, new_commit
-                    )
-
+            all_metrics = compare_commit_files(
+                repo_path,
+                old_commit,
+                new_commit,
+                dvc_yaml,
+                old_files,
+                new_files,
+                temp_old_files,
+                temp_new_files,
+                chunksize=chunksize,
+                approx_error=approx_error,
+                jobs=jobs,
+                model_sample=model_sample,
+                row_key=row_key,
+                drift=drift,
+            )
             save_metrics_to_file(new_commit, all_metrics, output_dir)
+            evict_cached_results(os.path.join(repo_path, CACHE_DIR))
 
         except Exception as e:
             print(f"Error analyzing commit {new_commit}: {str(e)}")
 
     finally:
-        shutil.rmtree(temp_repo)
         shutil.rmtree(temp_old_files)
         shutil.rmtree(temp_new_files)
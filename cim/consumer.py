@@ -1,56 +1,165 @@
 import pandas as pd
 import numpy as np
 
+from cim.handlers import get_handler, resolve
+from cim.profile import profile_chunks, profile_table
 
-def load_table_as_numpy(filepath, **kwargs):
+DEFAULT_CHUNKSIZE = 1_000_000
+STREAMING_EXTENSIONS = {"csv": ",", "tsv": "\t", "txt": None}
+
+
+def read_delimited(filepath, **kwargs):
     """
-    Загружает таблицу из файла и возвращает её в виде массива NumPy.
+    Читает CSV, TSV или TXT (разделитель определяется по расширению).
+
+    Параметры:
+    filepath (str): Путь к файлу.
+    **kwargs: Дополнительные аргументы pandas.read_csv.
+
+    Возвращает:
+    pandas.DataFrame: Данные таблицы.
+    """
+    file_extension = filepath.split(".")[-1].lower()
+    return pd.read_csv(
+        filepath, delimiter=STREAMING_EXTENSIONS.get(file_extension), **kwargs
+    )
+
+
+def load_table(filepath, **kwargs):
+    """
+    Загружает таблицу из файла и возвращает её в виде DataFrame.
 
-    Функция определяет тип файла по его расширению и использует соответствующую
-    функцию pandas для чтения файла в DataFrame, который затем преобразуется в массив NumPy.
+    Функция чтения выбирается по реестру обработчиков (см. cim.handlers) по
+    расширению файла или его сигнатуре. Типы столбцов сохраняются, поэтому
+    смешанные таблицы не превращаются в массив object.
 
-    Поддерживаемые расширения файлов:
-    - CSV (.csv)
-    - TSV (.tsv)
+    Встроенные обработчики поддерживают:
+    - CSV (.csv), TSV (.tsv), текст (.txt) - предполагается, что это таблица
     - Excel (.xlsx, .xls)
     - XML (.xml)
     - JSON (.json)
-    - Текст (.txt) - предполагается, что это таблица
+    - Parquet (.parquet, .pq) и Feather (.feather, .arrow)
 
     Параметры:
     filepath (str): Путь к файлу, который нужно загрузить.
     **kwargs: Дополнительные аргументы, передаваемые функции чтения pandas.
 
+    Возвращает:
+    pandas.DataFrame: Данные таблицы. Если тип файла не поддерживается,
+                      возвращается None.
+    """
+    handler = get_handler(filepath)
+    if handler is None or handler.loader is None:
+        file_extension = filepath.split(".")[-1].lower()
+        print(f"Unsupported file extension: {file_extension}; file {filepath} ignored")
+        return None
+    return resolve(handler.loader)(filepath, **kwargs)
+
+
+def load_table_as_numpy(filepath, **kwargs):
+    """
+    Загружает таблицу из файла и возвращает её в виде массива NumPy.
+
+    Параметры и поддерживаемые форматы - см. load_table.
+
     Возвращает:
     numpy.ndarray: Данные таблицы в виде массива NumPy. Если расширение файла не поддерживается,
                    возвращается пустой массив NumPy.
     """
-    # Определение типа файла по расширению
+    df = load_table(filepath, **kwargs)
+    if df is None:
+        return np.empty((0, 0))
+    return df.to_numpy()
+
+
+def iter_delimited_chunks(filepath, chunksize=DEFAULT_CHUNKSIZE, **kwargs):
+    """
+    Читает CSV, TSV или TXT потоково (pandas.read_csv с chunksize).
+
+    Параметры - см. iter_table_chunks.
+    """
     file_extension = filepath.split(".")[-1].lower()
+    with pd.read_csv(
+        filepath,
+        delimiter=STREAMING_EXTENSIONS.get(file_extension),
+        chunksize=chunksize,
+        **kwargs,
+    ) as reader:
+        yield from reader
 
-    if file_extension in ["csv", "tsv"]:
-        # CSV и TSV файлы
-        delimiter = "," if file_extension == "csv" else "\t"
-        df = pd.read_csv(filepath, delimiter=delimiter, **kwargs)
 
-    elif file_extension in ["xlsx", "xls"]:
-        # Excel файлы
-        df = pd.read_excel(filepath, **kwargs)
+def iter_table_chunks(filepath, chunksize=DEFAULT_CHUNKSIZE, **kwargs):
+    """
+    Читает таблицу из файла частями фиксированного размера.
 
-    elif file_extension == "xml":
-        # XML файлы
-        df = pd.read_xml(filepath, **kwargs)
+    Форматы, обработчик которых умеет читать частями (CSV, TSV, TXT,
+    Parquet - см. Handler.chunks), читаются потоково, поэтому пиковая
+    память определяется размером части, а не размером файла.
+    Остальные форматы возвращаются одной частью через load_table.
 
-    elif file_extension == "json":
-        # JSON файлы
-        df = pd.read_json(filepath, **kwargs)
+    Параметры:
+    filepath (str): Путь к файлу.
+    chunksize (int): Число строк в одной части.
+    **kwargs: Дополнительные аргументы, передаваемые функции чтения.
 
-    elif file_extension in ["txt"]:
-        # Текстовые файлы (предполагаем таблицу)
-        df = pd.read_csv(filepath, delimiter=None, **kwargs)
+    Возвращает:
+    Iterator[pandas.DataFrame]: Части таблицы. Для неподдерживаемых
+                                расширений итератор пуст.
+    """
+    handler = get_handler(filepath)
+    if handler is not None and handler.chunks is not None:
+        yield from resolve(handler.chunks)(filepath, chunksize, **kwargs)
+        return
 
-    else:
-        print(f"Unsupported file extension: {file_extension}; file {filepath} ignored")
-        return np.empty((0, 0))
+    df = load_table(filepath, **kwargs)
+    if df is not None:
+        yield df
 
-    return df.to_numpy()
+
+def _is_number(value):
+    try:
+        float(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def header_options(filepath):
+    """
+    Параметры чтения заголовка текстовой таблицы.
+
+    Если в первой строке CSV/TSV/TXT есть числа, это не заголовок, а данные
+    (например, data/prepared/*.tsv): таблица читается с header=None, а
+    столбцы называются по номерам "0", "1", ...
+
+    :param filepath: Путь к файлу.
+    :return: Словарь аргументов функции чтения (пустой, если заголовок есть).
+    """
+    handler = get_handler(filepath)
+    if handler is None or handler.name != "delimited":
+        return {}
+    first = next(
+        iter_table_chunks(
+            filepath, 1, header=None, nrows=1, dtype=str, keep_default_na=False
+        ),
+        None,
+    )
+    if first is None or not len(first) or not any(_is_number(v) for v in first.iloc[0]):
+        return {}
+    return {"header": None, "names": [str(i) for i in range(first.shape[1])]}
+
+
+def profile_file(filepath, chunksize=None, precision=None):
+    """
+    Строит профиль табличного файла (профилировщик встроенных обработчиков).
+
+    :param filepath: Путь к файлу.
+    :param chunksize: Если задан, файл читается потоково частями по chunksize строк.
+    :param precision: Точность HyperLogLog для приближённого режима (None - точный).
+    :return: TableProfile.
+    """
+    if chunksize or precision:
+        chunks = iter_table_chunks(filepath, chunksize=chunksize or DEFAULT_CHUNKSIZE)
+        return profile_chunks(chunks, precision)
+    df = load_table(filepath)
+    return profile_table(df if df is not None else pd.DataFrame())
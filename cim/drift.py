@@ -0,0 +1,622 @@
+"""
+Метрики дрейфа распределений столбцов: PSI, приближённая статистика
+Колмогорова-Смирнова, сдвиг числа категорий и самой свежей даты.
+
+Таблица читается по частям один раз; для каждого столбца копится
+скетч фиксированного размера:
+- числовые - логарифмическая гистограмма с относительной точностью
+  квантилей RELATIVE_ACCURACY (QuantileSketch, как DDSketch);
+- категориальные - частые значения (FrequentItems, Misra-Gries) и
+  HyperLogLog для числа категорий;
+- даты (datetime или строки вида YYYY-MM-DD...) - минимум и максимум.
+
+Все скетчи объединяются (merge), поэтому их можно считать по частям и в
+разных процессах. Скетч таблицы сохраняется рядом с кэшем DVC по хэшу
+содержимого, как профиль (см. cim.profile), и базовая версия не
+пересчитывается.
+"""
+import json
+import math
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_datetime64_any_dtype, is_numeric_dtype
+
+from cim.consumer import DEFAULT_CHUNKSIZE, header_options, iter_table_chunks
+from cim.profile import PROFILE_DIR
+from cim.sketches import HyperLogLog
+
+# Версия скетчей: входит в путь сохранённого скетча
+DRIFT_VERSION = 2
+RELATIVE_ACCURACY = 0.01
+MAX_BINS = 2048
+# Значения по модулю меньше считаются нулём
+MIN_MAGNITUDE = 1e-12
+TOP_K = 100
+DISTINCT_PRECISION = 12
+PSI_BINS = 10
+# Доля, подставляемая вместо пустой корзины в PSI
+PSI_EPSILON = 1e-4
+DATE_PATTERN = r"^\d{4}-\d{2}-\d{2}"
+# По скольким значениям первой части определяется, что строки - даты
+DATE_SAMPLE = 1000
+NANOSECONDS_PER_DAY = 86_400 * 10**9
+
+NUMERIC = "numeric"
+CATEGORICAL = "categorical"
+DATE = "date"
+
+
+class QuantileSketch:
+    """
+    Логарифмическая гистограмма для квантилей с относительной точностью.
+
+    Значение x попадает в корзину ceil(log_gamma |x|), где
+    gamma = (1 + a) / (1 - a): любой квантиль восстанавливается с
+    относительной погрешностью a. Скетчи с одинаковой точностью
+    объединяются сложением счётчиков корзин. Если корзин больше max_bins,
+    корзины самых малых по модулю значений сливаются.
+    """
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY, max_bins=MAX_BINS):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.zeros = 0
+        self.positive = {}
+        self.negative = {}
+
+    @property
+    def count(self):
+        return self.zeros + sum(self.positive.values()) + sum(self.negative.values())
+
+    def add(self, values):
+        """
+        Учитывает массив чисел (NaN и бесконечности пропускаются).
+
+        :param values: numpy.ndarray.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        self.zeros += int(np.count_nonzero(np.abs(values) < MIN_MAGNITUDE))
+        for bins, magnitudes in (
+            (self.positive, values[values >= MIN_MAGNITUDE]),
+            (self.negative, -values[values <= -MIN_MAGNITUDE]),
+        ):
+            if len(magnitudes) == 0:
+                continue
+            keys = np.ceil(np.log(magnitudes) / math.log(self.gamma)).astype(np.int64)
+            low = int(keys.min())
+            counts = np.bincount(keys - low)
+            for offset in np.flatnonzero(counts):
+                key = low + int(offset)
+                bins[key] = bins.get(key, 0) + int(counts[offset])
+        self._collapse()
+
+    def merge(self, other):
+        """
+        Объединяет скетч с другим скетчем той же точности.
+
+        :param other: QuantileSketch.
+        :return: self.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge quantile sketches of different accuracy")
+        self.zeros += other.zeros
+        for bins, other_bins in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in other_bins.items():
+                bins[key] = bins.get(key, 0) + count
+        self._collapse()
+        return self
+
+    def _collapse(self):
+        for bins in (self.positive, self.negative):
+            if len(bins) <= self.max_bins:
+                continue
+            keys = sorted(bins)
+            excess = keys[: len(keys) - self.max_bins + 1]
+            bins[excess[-1]] = sum(bins.pop(key) for key in excess[:-1]) + bins[excess[-1]]
+
+    def _value(self, key):
+        return 2 * self.gamma**key / (self.gamma + 1)
+
+    def buckets(self):
+        """
+        Корзины в порядке возрастания значений.
+
+        :return: (представители корзин, счётчики) - numpy.ndarray.
+        """
+        negative = sorted(self.negative, reverse=True)
+        positive = sorted(self.positive)
+        values = (
+            [-self._value(key) for key in negative]
+            + ([0.0] if self.zeros else [])
+            + [self._value(key) for key in positive]
+        )
+        counts = (
+            [self.negative[key] for key in negative]
+            + ([self.zeros] if self.zeros else [])
+            + [self.positive[key] for key in positive]
+        )
+        return np.asarray(values, dtype=np.float64), np.asarray(counts, dtype=np.float64)
+
+    def cdf(self, points):
+        """
+        Доля значений не больше каждой из точек.
+
+        :param points: Точки (значения, сравнимые с представителями корзин).
+        :return: numpy.ndarray долей.
+        """
+        values, counts = self.buckets()
+        total = counts.sum()
+        if total == 0:
+            return np.zeros(len(points))
+        cumulative = np.concatenate([[0.0], np.cumsum(counts)])
+        return cumulative[np.searchsorted(values, points, side="right")] / total
+
+    def quantiles(self, levels):
+        """
+        Квантили заданных уровней (представители корзин).
+
+        :param levels: Уровни от 0 до 1.
+        :return: numpy.ndarray значений.
+        """
+        values, counts = self.buckets()
+        if len(values) == 0:
+            return np.full(len(levels), np.nan)
+        cumulative = np.cumsum(counts)
+        ranks = np.asarray(levels) * (cumulative[-1] - 1)
+        return values[np.searchsorted(cumulative, ranks, side="right")]
+
+    def to_dict(self):
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "zeros": self.zeros,
+            "positive": sorted(self.positive.items()),
+            "negative": sorted(self.negative.items()),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["relative_accuracy"])
+        sketch.zeros = data["zeros"]
+        sketch.positive = {int(key): count for key, count in data["positive"]}
+        sketch.negative = {int(key): count for key, count in data["negative"]}
+        return sketch
+
+
+class FrequentItems:
+    """
+    Частые значения столбца (алгоритм Misra-Gries).
+
+    Хранит не больше capacity счётчиков; счётчик значения занижен не более
+    чем на total / capacity, поэтому все значения с долей больше
+    1 / capacity гарантированно присутствуют. Объединяется с другим
+    скетчем сложением счётчиков и повторным усечением.
+    """
+
+    def __init__(self, capacity=TOP_K):
+        self.capacity = capacity
+        self.counts = {}
+        self.total = 0
+
+    def _trim(self, counts):
+        """Усекает счётчики (pandas.Series по убыванию) до capacity."""
+        if len(counts) <= self.capacity:
+            return counts
+        threshold = counts.iloc[self.capacity]
+        counts = counts.iloc[: self.capacity] - threshold
+        return counts[counts > 0]
+
+    def add(self, values):
+        """
+        Учитывает непустые значения столбца.
+
+        :param values: pandas.Series.
+        """
+        self.total += len(values)
+        counts = self._trim(values.value_counts())
+        self._combine(zip(counts.index.astype(str), counts.to_numpy()))
+
+    def merge(self, other):
+        """
+        Объединяет скетч с другим скетчем.
+
+        :param other: FrequentItems.
+        :return: self.
+        """
+        self.total += other.total
+        self._combine(other.counts.items())
+        return self
+
+    def _combine(self, items):
+        for value, count in items:
+            self.counts[value] = self.counts.get(value, 0) + int(count)
+        if len(self.counts) > self.capacity:
+            counts = pd.Series(self.counts).sort_values(ascending=False, kind="stable")
+            self.counts = {key: int(count) for key, count in self._trim(counts).items()}
+
+    def to_dict(self):
+        return {"capacity": self.capacity, "counts": self.counts, "total": self.total}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["capacity"])
+        sketch.counts = dict(data["counts"])
+        sketch.total = data["total"]
+        return sketch
+
+
+def _column_kind(column):
+    """Вид столбца по первой части с непустыми значениями (или None)."""
+    if is_datetime64_any_dtype(column.dtype):
+        return DATE
+    if is_numeric_dtype(column.dtype) and not is_bool_dtype(column.dtype):
+        return NUMERIC
+    sample = column.head(DATE_SAMPLE)
+    if len(sample) and sample.astype(str).str.match(DATE_PATTERN).all():
+        return DATE
+    return CATEGORICAL
+
+
+def _timestamps(values):
+    """Даты столбца в наносекундах UTC (значения, не похожие на даты, пропускаются)."""
+    dates = pd.to_datetime(values, format="ISO8601", errors="coerce", utc=True).dropna()
+    return dates.dt.tz_convert(None).astype("datetime64[ns]").astype(np.int64)
+
+
+class ColumnSketch:
+    """Скетч распределения одного столбца (вид определяется по данным)."""
+
+    def __init__(self, kind=None):
+        self.kind = kind
+        self.values = QuantileSketch()
+        self.items = FrequentItems()
+        self.distinct = HyperLogLog(DISTINCT_PRECISION)
+        self.min_date = None
+        self.max_date = None
+
+    def update(self, column):
+        """
+        Учитывает очередную часть столбца.
+
+        :param column: pandas.Series.
+        """
+        values = column.dropna()
+        if len(values) == 0:
+            return
+        if self.kind is None:
+            self.kind = _column_kind(values)
+        if self.kind == NUMERIC:
+            self.values.add(pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64))
+        elif self.kind == DATE:
+            stamps = _timestamps(values)
+            if len(stamps):
+                self._add_dates(int(stamps.min()), int(stamps.max()))
+        else:
+            self.items.add(values)
+            self.distinct.add_hashes(pd.util.hash_array(values.astype(str).to_numpy()))
+
+    def _add_dates(self, low, high):
+        self.min_date = low if self.min_date is None else min(self.min_date, low)
+        self.max_date = high if self.max_date is None else max(self.max_date, high)
+
+    def merge(self, other):
+        """
+        Объединяет скетч со скетчем того же столбца.
+
+        Скетчи разных видов (например, числового и категориального столбца)
+        хранят несравнимые статистики и не объединяются.
+
+        :param other: ColumnSketch.
+        :return: self.
+        """
+        if self.kind is not None and other.kind is not None and self.kind != other.kind:
+            raise ValueError(
+                f"Cannot merge sketches of a {self.kind} and a {other.kind} column"
+            )
+        if self.kind is None:
+            self.kind = other.kind
+        self.values.merge(other.values)
+        self.items.merge(other.items)
+        self.distinct.merge(other.distinct)
+        if other.min_date is not None:
+            self._add_dates(other.min_date, other.max_date)
+        return self
+
+    def to_dict(self):
+        data = {"kind": self.kind}
+        if self.kind == NUMERIC:
+            data["values"] = self.values.to_dict()
+        elif self.kind == DATE:
+            data.update(min_date=self.min_date, max_date=self.max_date)
+        elif self.kind == CATEGORICAL:
+            data.update(items=self.items.to_dict(), distinct=self.distinct.to_dict())
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["kind"])
+        if "values" in data:
+            sketch.values = QuantileSketch.from_dict(data["values"])
+        if "items" in data:
+            sketch.items = FrequentItems.from_dict(data["items"])
+            sketch.distinct = HyperLogLog.from_dict(data["distinct"])
+        sketch.min_date = data.get("min_date")
+        sketch.max_date = data.get("max_date")
+        return sketch
+
+
+class DriftAccumulator:
+    """
+    Накопитель скетчей распределений всех столбцов таблицы.
+
+    Заполняется по частям таблицы (update) за один проход; накопители,
+    заполненные разными частями, объединяются методом merge.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.columns = {}
+
+    def update(self, chunk):
+        """
+        Учитывает очередную часть таблицы.
+
+        :param chunk: Часть таблицы (pandas.DataFrame).
+        """
+        self.rows += len(chunk)
+        for col_idx in range(chunk.shape[1]):
+            name = str(chunk.columns[col_idx])
+            self.columns.setdefault(name, ColumnSketch()).update(chunk.iloc[:, col_idx])
+
+    def merge(self, other):
+        """
+        Объединяет накопитель с другим накопителем той же таблицы.
+
+        :param other: DriftAccumulator.
+        :return: self.
+        """
+        self.rows += other.rows
+        for name, sketch in other.columns.items():
+            if name in self.columns:
+                self.columns[name].merge(sketch)
+            else:
+                self.columns[name] = sketch
+        return self
+
+    def to_dict(self):
+        return {
+            "rows": self.rows,
+            "columns": {name: sketch.to_dict() for name, sketch in self.columns.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        accumulator = cls()
+        accumulator.rows = data["rows"]
+        accumulator.columns = {
+            name: ColumnSketch.from_dict(sketch) for name, sketch in data["columns"].items()
+        }
+        return accumulator
+
+
+def _psi(old_shares, new_shares):
+    old_shares = np.maximum(np.asarray(old_shares, dtype=np.float64), PSI_EPSILON)
+    new_shares = np.maximum(np.asarray(new_shares, dtype=np.float64), PSI_EPSILON)
+    return float(np.sum((new_shares - old_shares) * np.log(new_shares / old_shares)))
+
+
+def numeric_psi(old, new, bins=PSI_BINS):
+    """
+    PSI числового столбца по корзинам-квантилям старой версии.
+
+    :param old: QuantileSketch старой версии.
+    :param new: QuantileSketch новой версии.
+    :param bins: Число корзин.
+    :return: PSI или None, если одна из версий пуста.
+    """
+    if old.count == 0 or new.count == 0:
+        return None
+    edges = np.unique(old.quantiles(np.arange(1, bins) / bins))
+    old_cdf = np.concatenate([[0.0], old.cdf(edges), [1.0]])
+    new_cdf = np.concatenate([[0.0], new.cdf(edges), [1.0]])
+    return _psi(np.diff(old_cdf), np.diff(new_cdf))
+
+
+def ks_distance(old, new):
+    """
+    Приближённая статистика Колмогорова-Смирнова: максимум разности
+    функций распределения на границах корзин обоих скетчей.
+
+    :return: Число от 0 до 1 или None, если одна из версий пуста.
+    """
+    if old.count == 0 or new.count == 0:
+        return None
+    points = np.union1d(old.buckets()[0], new.buckets()[0])
+    return float(np.max(np.abs(old.cdf(points) - new.cdf(points))))
+
+
+def categorical_psi(old, new):
+    """
+    PSI категориального столбца по частым значениям обеих версий;
+    остальные значения объединяются в одну корзину.
+
+    :param old: FrequentItems старой версии.
+    :param new: FrequentItems новой версии.
+    :return: PSI или None, если одна из версий пуста.
+    """
+    if old.total == 0 or new.total == 0:
+        return None
+    categories = sorted(set(old.counts) | set(new.counts))
+    shares = []
+    for items in (old, new):
+        counts = np.array([items.counts.get(category, 0) for category in categories], dtype=float)
+        shares.append(np.append(counts, items.total - counts.sum()) / items.total)
+    return _psi(*shares)
+
+
+def _iso(nanoseconds):
+    return None if nanoseconds is None else pd.Timestamp(nanoseconds).isoformat()
+
+
+def compare_column_sketches(old, new):
+    """
+    Метрики дрейфа одного столбца.
+
+    :param old: ColumnSketch старой версии (None, если столбца не было).
+    :param new: ColumnSketch новой версии (None, если столбец удалён).
+    :return: Словарь метрик.
+    """
+    old = old or ColumnSketch()
+    new = new or ColumnSketch()
+    kind = new.kind or old.kind
+    result = {"kind": kind}
+    if old.kind and new.kind and old.kind != new.kind:
+        result["kind"] = {"old": old.kind, "new": new.kind}
+        return result
+    if kind == NUMERIC:
+        result["psi"] = numeric_psi(old.values, new.values)
+        result["ks"] = ks_distance(old.values, new.values)
+    elif kind == CATEGORICAL:
+        result["psi"] = categorical_psi(old.items, new.items)
+        counts = [
+            sketch.distinct.count() if sketch.kind else 0 for sketch in (old, new)
+        ]
+        result["categories"] = {"old": counts[0], "new": counts[1], "delta": counts[1] - counts[0]}
+    elif kind == DATE:
+        delta = None
+        if old.max_date is not None and new.max_date is not None:
+            delta = (new.max_date - old.max_date) / NANOSECONDS_PER_DAY
+        result["max_date"] = {
+            "old": _iso(old.max_date),
+            "new": _iso(new.max_date),
+            "delta_days": delta,
+        }
+    return result
+
+
+def compare_drift(old, new):
+    """
+    Метрики дрейфа таблицы по скетчам двух версий.
+
+    :param old: DriftAccumulator старой версии.
+    :param new: DriftAccumulator новой версии.
+    :return: Словарь: максимальные PSI и KS по столбцам и метрики столбцов.
+    """
+    names = list(new.columns) + [name for name in old.columns if name not in new.columns]
+    columns = {
+        name: compare_column_sketches(old.columns.get(name), new.columns.get(name))
+        for name in names
+    }
+
+    def largest(metric):
+        values = [c[metric] for c in columns.values() if c.get(metric) is not None]
+        return max(values) if values else None
+
+    return {"psi_max": largest("psi"), "ks_max": largest("ks"), "columns": columns}
+
+
+def _sketch_path(cache_dir, content_hash, chunksize):
+    # Misra-Gries и сжатие корзин квантилей усекают скетч после каждой части,
+    # поэтому скетч зависит от размера части, а не только от содержимого
+    return os.path.join(
+        cache_dir,
+        PROFILE_DIR,
+        f"drift-v{DRIFT_VERSION}",
+        f"chunk-{chunksize}",
+        content_hash[:2],
+        content_hash[2:] + ".json",
+    )
+
+
+def load_drift_sketch(cache_dir, content_hash, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Читает сохранённый скетч таблицы по хэшу содержимого.
+
+    :param cache_dir: Папка кэша DVC.
+    :param content_hash: Хэш содержимого файла (md5 из dvc.lock).
+    :param chunksize: Число строк в одной части, по которым считался скетч.
+    :return: DriftAccumulator или None, если скетч ещё не посчитан.
+    """
+    try:
+        with open(_sketch_path(cache_dir, content_hash, chunksize), "r") as f:
+            return DriftAccumulator.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_drift_sketch(cache_dir, content_hash, accumulator, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Сохраняет скетч таблицы рядом с объектами кэша DVC.
+
+    :param cache_dir: Папка кэша DVC.
+    :param content_hash: Хэш содержимого файла (md5 из dvc.lock).
+    :param accumulator: DriftAccumulator.
+    :param chunksize: Число строк в одной части, по которым считался скетч.
+    """
+    path = _sketch_path(cache_dir, content_hash, chunksize)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(accumulator.to_dict(), f)
+    os.replace(temp_path, path)
+
+
+def sketch_file(file_path, content_hash=None, profile_dir=None, chunksize=None):
+    """
+    Скетч таблицы: из кэша по хэшу содержимого или одним проходом по файлу.
+
+    :param file_path: Путь к файлу.
+    :param content_hash: Хэш содержимого файла.
+    :param profile_dir: Папка кэша DVC, рядом с которым хранятся скетчи.
+    :param chunksize: Число строк в одной читаемой части.
+    :return: DriftAccumulator (пустой, если файла нет).
+    """
+    chunksize = chunksize or DEFAULT_CHUNKSIZE
+    use_cache = profile_dir and content_hash
+    if use_cache:
+        accumulator = load_drift_sketch(profile_dir, content_hash, chunksize)
+        if accumulator is not None:
+            return accumulator
+
+    accumulator = DriftAccumulator()
+    if not os.path.exists(file_path):
+        return accumulator
+    # Таблица без заголовка (data/prepared/*.tsv) читается со столбцами "0",
+    # "1", ..., как в построчном сравнении (cim.rowdiff)
+    for chunk in iter_table_chunks(file_path, chunksize, **header_options(file_path)):
+        accumulator.update(chunk)
+    if use_cache:
+        save_drift_sketch(profile_dir, content_hash, accumulator, chunksize)
+    return accumulator
+
+
+def process_drift(
+    file,
+    temp_old_dir,
+    temp_new_dir,
+    old_hash=None,
+    new_hash=None,
+    profile_dir=None,
+    chunksize=None,
+):
+    """
+    Метрики дрейфа распределений между двумя версиями таблицы.
+
+    :param file: Путь к файлу относительно корня репозитория.
+    :param temp_old_dir: Папка с файлами старого коммита.
+    :param temp_new_dir: Папка с файлами нового коммита.
+    :param old_hash: Хэш старой версии файла.
+    :param new_hash: Хэш новой версии файла.
+    :param profile_dir: Папка кэша DVC, рядом с которым хранятся скетчи.
+    :param chunksize: Число строк в одной читаемой части.
+    :return: Результат compare_drift.
+    """
+    old, new = (
+        sketch_file(os.path.join(directory, file), content_hash, profile_dir, chunksize)
+        for directory, content_hash in ((temp_old_dir, old_hash), (temp_new_dir, new_hash))
+    )
+    return compare_drift(old, new)
@@ -0,0 +1,204 @@
+"""
+Реестр обработчиков типов файлов.
+
+Обработчик связывает расширение файла (или его сигнатуру в первых байтах)
+с функциями загрузки и профилирования. Функции задаются строками
+"модуль:функция" и импортируются только при первом обращении, поэтому
+импорт cim не тянет pandas, pyarrow и другие тяжёлые зависимости, пока
+не встретится файл соответствующего типа.
+
+Сторонние пакеты добавляют обработчики через entry points группы
+"cim.handlers": объект точки входа - Handler или список Handler.
+"""
+import importlib
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+ENTRY_POINT_GROUP = "cim.handlers"
+MAGIC_BYTES = 8
+
+
+@dataclass(frozen=True)
+class Handler:
+    """
+    Обработчик одного типа файлов.
+
+    profiler(path, chunksize=None, precision=None) возвращает TableProfile,
+    loader(path, **kwargs) - pandas.DataFrame, chunks(path, chunksize,
+    **kwargs) - итератор pandas.DataFrame, comparer(file, temp_old_dir,
+    temp_new_dir, old_hash, new_hash, cache_dir, profile_dir, **options) -
+    готовую метрику файла или None, если файл ему не подходит.
+    """
+
+    name: str
+    extensions: Tuple[str, ...]
+    profiler: Optional[str] = None
+    loader: Optional[str] = None
+    chunks: Optional[str] = None
+    comparer: Optional[str] = None
+    magic: Optional[bytes] = None
+    # Артефакт - папка с расширением (например, train.csr), а не файл
+    directory: bool = False
+    # Умеет читать данные частями (учитывает chunksize, см. chunks)
+    streaming: bool = False
+    # Читает данные через отображение в память, без копирования
+    mmap: bool = False
+    # Профиль строится по метаданным файла, без чтения данных
+    profile_only: bool = False
+
+
+BUILTIN_HANDLERS = (
+    Handler(
+        "delimited",
+        ("csv", "tsv", "txt"),
+        profiler="cim.consumer:profile_file",
+        loader="cim.consumer:read_delimited",
+        chunks="cim.consumer:iter_delimited_chunks",
+        streaming=True,
+    ),
+    Handler(
+        "excel",
+        ("xlsx", "xls"),
+        profiler="cim.consumer:profile_file",
+        loader="pandas:read_excel",
+    ),
+    Handler(
+        "xml", ("xml",), profiler="cim.consumer:profile_file", loader="pandas:read_xml"
+    ),
+    Handler(
+        "json",
+        ("json",),
+        profiler="cim.consumer:profile_file",
+        loader="pandas:read_json",
+    ),
+    Handler(
+        "parquet",
+        ("parquet", "pq"),
+        profiler="cim.columnar:profile_parquet",
+        loader="pandas:read_parquet",
+        chunks="cim.columnar:iter_parquet_chunks",
+        magic=b"PAR1",
+        streaming=True,
+        profile_only=True,
+    ),
+    Handler(
+        "feather",
+        ("feather", "arrow"),
+        profiler="cim.columnar:profile_feather",
+        loader="pandas:read_feather",
+        magic=b"ARROW1",
+        mmap=True,
+    ),
+    Handler(
+        "csr",
+        ("csr",),
+        profiler="cim.sparse:profile_csr",
+        directory=True,
+        mmap=True,
+    ),
+    Handler("model", ("pkl", "pickle"), comparer="cim.models:process_model_changes"),
+)
+
+_registry = list(BUILTIN_HANDLERS)
+_entry_points_loaded = False
+_resolved = {}
+
+
+def register_handler(handler):
+    """
+    Регистрирует обработчик; он имеет приоритет над уже зарегистрированными.
+
+    :param handler: Handler.
+    """
+    _registry.insert(0, handler)
+
+
+def _load_entry_points():
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    from importlib.metadata import entry_points
+
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        try:
+            loaded = entry_point.load()
+        except Exception as e:
+            print(f"Warning: Could not load cim handler {entry_point.name}: {e}")
+            continue
+        for handler in loaded if isinstance(loaded, (list, tuple)) else [loaded]:
+            register_handler(handler)
+
+
+def get_handlers():
+    """Все обработчики в порядке приоритета (с учётом entry points)."""
+    _load_entry_points()
+    return list(_registry)
+
+
+def _read_magic(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(MAGIC_BYTES)
+    except OSError:
+        return b""
+
+
+def get_handler(path):
+    """
+    Находит обработчик файла по расширению, а если его нет - по сигнатуре.
+
+    :param path: Путь к файлу (сигнатура читается, только если файл существует).
+    :return: Handler или None.
+    """
+    extension = path.rstrip("/").split(".")[-1].lower()
+    handlers = get_handlers()
+    for handler in handlers:
+        if extension in handler.extensions:
+            return handler
+    if os.path.isfile(path):
+        head = _read_magic(path)
+        for handler in handlers:
+            if handler.magic and head.startswith(handler.magic):
+                return handler
+    return None
+
+
+def file_type(path):
+    """
+    Метка типа файла для ключей кэша: имя обработчика и расширение.
+
+    Одно и то же содержимое под разными расширениями (.csv и .tsv) или с
+    другим обработчиком читается по-разному, поэтому сохранённые профили и
+    результаты сравнения не должны переходить между ними.
+
+    :param path: Путь к файлу.
+    :return: Строка вида "delimited-tsv".
+    """
+    handler = get_handler(path)
+    extension = os.path.splitext(path.rstrip("/"))[1].lstrip(".").lower()
+    return f"{handler.name if handler else 'none'}-{extension}"
+
+
+def directory_extensions():
+    """Расширения артефактов-папок (см. Handler.directory)."""
+    return {
+        extension
+        for handler in get_handlers()
+        if handler.directory
+        for extension in handler.extensions
+    }
+
+
+def resolve(reference):
+    """
+    Импортирует функцию по строке "модуль:функция".
+
+    :param reference: Строка вида "cim.consumer:profile_file".
+    :return: Функция.
+    """
+    if reference not in _resolved:
+        module_name, _, attribute = reference.partition(":")
+        _resolved[reference] = getattr(importlib.import_module(module_name), attribute)
+    return _resolved[reference]
@@ -0,0 +1,196 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from cim.cache import CACHE_DIR, evict_cached_results
+from cim.commits import compare_commit_files, save_commit_files
+from cim.utils import read_dvc_yaml, resolve_refs, save_metrics_to_file
+
+SUMMARY_FILE = "summary.json"
+
+
+def list_range_commits(repo_path, commit_range):
+    """
+    Возвращает коммиты диапазона base..head от старых к новым.
+
+    Берётся только первая родительская линия head, поэтому соседние коммиты
+    списка - это всегда коммит и его родитель. Сам base идёт первым:
+    с ним сравнивается первый коммит диапазона.
+
+    :param repo_path: Путь к репозиторию.
+    :param commit_range: Диапазон в виде "base..head".
+    :return: Список хэшей коммитов.
+    """
+    base, sep, head = commit_range.partition("..")
+    if not sep or not base or not head:
+        raise ValueError(f"Invalid commit range: {commit_range!r} (expected base..head)")
+    refs = resolve_refs(repo_path, [base, head])
+    cmd = [
+        "git",
+        "rev-list",
+        "--reverse",
+        "--first-parent",
+        f"{refs[base]}..{refs[head]}",
+    ]
+    result = subprocess.run(cmd, cwd=repo_path, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Error running 'git rev-list': {result.stderr.strip()}")
+    return [refs[base]] + result.stdout.split()
+
+
+def list_last_commits(repo_path, n):
+    """
+    Возвращает последние n коммитов вместе с родителем самого старого из них.
+
+    Как и в list_range_commits, берётся только первая родительская линия HEAD:
+    коммиты влитых веток не попадают между коммитом слияния и его родителем.
+
+    :param repo_path: Путь к репозиторию.
+    :param n: Число анализируемых коммитов.
+    :return: Список хэшей коммитов от старых к новым (до n + 1 штук).
+    """
+    cmd = ["git", "rev-list", "--first-parent", f"-n{n + 1}", "HEAD"]
+    result = subprocess.run(cmd, cwd=repo_path, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Error running 'git rev-list': {result.stderr.strip()}")
+    # git rev-list выводит коммиты от новых к старым
+    return list(reversed(result.stdout.split()))
+
+
+def stage_risk(stage_metrics):
+    """
+    Средний риск стадии по её табличным файлам (так же, как в comb).
+
+    :param stage_metrics: Словарь {файл: метрика} одной стадии.
+    :return: Средний риск или None, если табличных файлов нет.
+    """
+    values = []
+    for value in stage_metrics.values():
+        if isinstance(value, dict):
+            value = value.get("risk")
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            values.append(value)
+    return sum(values) / len(values) if values else None
+
+
+def _materialize_commit(repo_path, commit):
+    """Сохраняет файлы коммита во временную папку (один раз на коммит)."""
+    temp_dir = tempfile.mkdtemp()
+    try:
+        dvc_yaml = read_dvc_yaml(repo_path, commit)
+        files = save_commit_files(repo_path, commit, temp_dir, dvc_yaml)
+    except Exception as e:
+        shutil.rmtree(temp_dir)
+        print(f"Error reading commit {commit}: {str(e)}")
+        return None
+    return {"commit": commit, "dvc_yaml": dvc_yaml, "files": files, "dir": temp_dir}
+
+
+def _release(materialized):
+    if materialized is not None:
+        shutil.rmtree(materialized["dir"], ignore_errors=True)
+
+
+def analyze_commit_history(
+    repo_path,
+    commits,
+    output_dir,
+    chunksize=None,
+    approx_error=None,
+    jobs=1,
+    model_sample=0,
+    row_key=None,
+    drift=False,
+):
+    """
+    Анализирует последовательность коммитов попарно (каждый с предыдущим).
+
+    Каждый коммит сохраняется из кэша DVC один раз и используется в двух
+    соседних парах; профили таблиц переиспользуются по хэшу содержимого
+    (см. cim.profile), так что файл, не менявшийся между коммитами, не
+    читается повторно. Пока считается пара (k-1, k), в фоновом потоке
+    готовятся файлы коммита k+1.
+
+    В output_dir записывается <коммит>.json для каждого коммита, кроме первого,
+    и summary.json с рядом рисков по стадиям.
+
+    :param repo_path: Путь к репозиторию.
+    :param commits: Список хэшей коммитов от старых к новым.
+    :param output_dir: Папка для сохранения результатов.
+    :param chunksize: Если задан, таблицы читаются потоково частями по chunksize строк.
+    :param approx_error: Если задан, дубликаты оцениваются приближённо (HyperLogLog).
+    :param jobs: Число параллельных процессов для обработки файлов.
+    :param model_sample: Размер выборки для сравнения предсказаний моделей (0 - не сравнивать).
+    :param row_key: Ключ построчного сравнения таблиц (None - не сравнивать, см. cim.rowdiff).
+    :param drift: Считать метрики дрейфа распределений столбцов (см. cim.drift).
+    :return: Содержимое summary.json.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    summary = {"commits": list(commits), "pairs": []}
+
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        pending = prefetcher.submit(_materialize_commit, repo_path, commits[0])
+        previous = None
+        for index, commit in enumerate(commits):
+            current = pending.result()
+            if index + 1 < len(commits):
+                pending = prefetcher.submit(
+                    _materialize_commit, repo_path, commits[index + 1]
+                )
+            try:
+                if previous is not None and current is not None:
+                    summary["pairs"].append(
+                        _analyze_pair(
+                            repo_path,
+                            previous,
+                            current,
+                            output_dir,
+                            chunksize=chunksize,
+                            approx_error=approx_error,
+                            jobs=jobs,
+                            model_sample=model_sample,
+                            row_key=row_key,
+                            drift=drift,
+                        )
+                    )
+            finally:
+                _release(previous)
+            previous = current
+        _release(previous)
+
+    with open(os.path.join(output_dir, SUMMARY_FILE), "w") as f:
+        json.dump(summary, f, indent=4)
+    evict_cached_results(os.path.join(repo_path, CACHE_DIR))
+    return summary
+
+
+def _analyze_pair(repo_path, old, new, output_dir, **options):
+    """Считает метрики пары сохранённых коммитов и возвращает запись ряда."""
+    old_commit, new_commit = old["commit"], new["commit"]
+    print(f"Analyzing commit: {new_commit} (compare with {old_commit})")
+    entry = {"old": old_commit, "new": new_commit, "stages": {}, "risk": None}
+    try:
+        metrics = compare_commit_files(
+            repo_path,
+            old_commit,
+            new_commit,
+            new["dvc_yaml"],
+            old["files"],
+            new["files"],
+            old["dir"],
+            new["dir"],
+            **options,
+        )
+    except Exception as e:
+        print(f"Error analyzing commit {new_commit}: {str(e)}")
+        entry["error"] = str(e)
+        return entry
+
+    save_metrics_to_file(new_commit, metrics, output_dir)
+    entry["stages"] = {stage: stage_risk(files) for stage, files in metrics.items()}
+    risks = [risk for risk in entry["stages"].values() if risk is not None]
+    entry["risk"] = sum(risks) / len(risks) if risks else None
+    return entry
@@ -0,0 +1,314 @@
+import json
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+from cim.cache import load_cached_result, make_cache_key, store_cached_result
+from cim.profile import PROFILE_DIR
+
+# Версия сводки модели: входит в путь сохранённой сводки
+MODEL_SUMMARY_VERSION = 1
+
+DEFAULT_MODEL_WEIGHTS = {"estimators": 0.2, "depth": 0.2, "nodes": 0.2, "importances": 0.4}
+
+# Сколько строк выборки предсказывать за один вызов predict_proba
+PREDICT_BATCH = 10_000
+
+
+def load_model(path):
+    """
+    Загружает модель из pickle.
+
+    :param path: Путь к файлу.
+    :return: Модель или None, если в файле не модель с feature_importances_
+             (например, старые матрицы признаков в .pkl).
+    """
+    with open(path, "rb") as f:
+        model = pickle.load(f)
+    return model if hasattr(model, "feature_importances_") else None
+
+
+def _trees(model):
+    """Деревья модели (tree_) - для одиночного дерева и ансамблей."""
+    if hasattr(model, "tree_"):
+        return [model.tree_]
+    estimators = getattr(model, "estimators_", None)
+    if estimators is None:
+        return []
+    return [e.tree_ for e in np.ravel(np.asarray(estimators, dtype=object)) if hasattr(e, "tree_")]
+
+
+def _distribution(values):
+    if not values:
+        return None
+    return {
+        "min": int(min(values)),
+        "mean": float(np.mean(values)),
+        "max": int(max(values)),
+    }
+
+
+def summarize_model(model):
+    """
+    Структурная сводка модели: число деревьев, распределения глубины, числа
+    узлов и листьев, важности признаков.
+
+    :param model: Обученная модель (sklearn).
+    :return: Словарь, сериализуемый в JSON.
+    """
+    trees = _trees(model)
+    importances = getattr(model, "feature_importances_", None)
+    return {
+        "type": type(model).__name__,
+        "estimators": len(trees),
+        "depth": _distribution([tree.max_depth for tree in trees]),
+        "nodes": _distribution([tree.node_count for tree in trees]),
+        "leaves": _distribution([tree.n_leaves for tree in trees]),
+        "n_features": getattr(model, "n_features_in_", None),
+        "importances": None if importances is None else np.asarray(importances).tolist(),
+    }
+
+
+def _summary_path(cache_dir, content_hash):
+    return os.path.join(
+        cache_dir,
+        PROFILE_DIR,
+        f"model-v{MODEL_SUMMARY_VERSION}",
+        content_hash[:2],
+        content_hash[2:] + ".json",
+    )
+
+
+def load_model_summary(cache_dir, content_hash):
+    """
+    Читает сохранённую сводку модели по хэшу содержимого.
+
+    :param cache_dir: Папка кэша DVC.
+    :param content_hash: Хэш содержимого файла (md5 из dvc.lock).
+    :return: Словарь или None, если сводка ещё не посчитана.
+    """
+    try:
+        with open(_summary_path(cache_dir, content_hash), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_model_summary(cache_dir, content_hash, summary):
+    """
+    Сохраняет сводку модели рядом с объектами кэша DVC.
+
+    :param cache_dir: Папка кэша DVC.
+    :param content_hash: Хэш содержимого файла (md5 из dvc.lock).
+    :param summary: Сводка (см. summarize_model).
+    """
+    path = _summary_path(cache_dir, content_hash)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(summary, f)
+    os.replace(temp_path, path)
+
+
+def importance_drift(old_summary, new_summary):
+    """
+    Дрейф важностей признаков: половина L1-расстояния между векторами
+    важностей (0 - без изменений, 1 - важности полностью сместились).
+
+    :return: Число от 0 до 1; None, если у одной из моделей нет важностей.
+    """
+    old = old_summary.get("importances")
+    new = new_summary.get("importances")
+    if old is None or new is None:
+        return None
+    if len(old) != len(new):
+        # Набор признаков изменился - сопоставить важности нельзя
+        return 1.0
+    return float(0.5 * np.abs(np.asarray(new) - np.asarray(old)).sum())
+
+
+def _relative(old, new):
+    return (new - old) / old if old else 0
+
+
+def calculate_model_risk(old_summary, new_summary, weights=None):
+    """
+    Рассчитывает уровень риска изменения модели по структурным сводкам.
+
+    Так же, как calculate_risk для таблиц: относительные изменения числа
+    деревьев, средней глубины и среднего числа узлов плюс дрейф важностей
+    признаков, взвешенные коэффициентами.
+
+    :param old_summary: Сводка старой модели (см. summarize_model).
+    :param new_summary: Сводка новой модели.
+    :param weights: Веса компонентов (None - DEFAULT_MODEL_WEIGHTS).
+    :return: Q (float).
+    """
+    if weights is None:
+        weights = DEFAULT_MODEL_WEIGHTS
+
+    def mean(summary, key):
+        return (summary.get(key) or {}).get("mean", 0)
+
+    delta_E = _relative(old_summary["estimators"], new_summary["estimators"])
+    delta_depth = _relative(mean(old_summary, "depth"), mean(new_summary, "depth"))
+    delta_nodes = _relative(mean(old_summary, "nodes"), mean(new_summary, "nodes"))
+    drift = importance_drift(old_summary, new_summary) or 0
+
+    return (
+        weights["estimators"] * abs(delta_E)
+        + weights["depth"] * abs(delta_depth)
+        + weights["nodes"] * abs(delta_nodes)
+        + weights["importances"] * drift
+    )
+
+
+def load_sample(path, rows, n_features):
+    """
+    Фиксированная выборка строк матрицы признаков для сравнения предсказаний.
+
+    Строки берутся равномерно по всей матрице (детерминированно), признаками
+    считаются последние n_features столбцов: первые столбцы матриц
+    featurize - id и метка (см. src/matrix_io.py).
+
+    :param path: Папка матрицы в формате CSR (см. cim.sparse).
+    :param rows: Размер выборки.
+    :param n_features: Число признаков модели.
+    :return: scipy.sparse.csr_matrix или None, если признаков в матрице меньше.
+    """
+    import scipy.sparse as sparse
+
+    from cim.sparse import load_csr_arrays
+
+    arrays = load_csr_arrays(path)
+    R, C = arrays.shape
+    if n_features is None or C < n_features or R == 0:
+        return None
+    matrix = sparse.csr_matrix(
+        (arrays.data, arrays.indices, arrays.indptr), shape=arrays.shape, copy=False
+    )
+    selected = np.unique(np.linspace(0, R - 1, min(rows, R)).astype(np.int64))
+    return matrix[selected][:, C - n_features :]
+
+
+def _predict_proba(model, sample, jobs):
+    if "n_jobs" in model.get_params():
+        model.set_params(n_jobs=jobs)
+    return np.vstack(
+        [
+            model.predict_proba(sample[start : start + PREDICT_BATCH])
+            for start in range(0, sample.shape[0], PREDICT_BATCH)
+        ]
+    )
+
+
+def compare_predictions(old_model, new_model, sample, jobs=1):
+    """
+    Сравнивает предсказания двух моделей на выборке (батчами по PREDICT_BATCH).
+
+    :param old_model: Старая модель.
+    :param new_model: Новая модель.
+    :param sample: Матрица признаков (см. load_sample).
+    :param jobs: n_jobs для predict_proba.
+    :return: Словарь: число строк, средняя разница вероятностей, доля смены класса.
+    """
+    old = _predict_proba(old_model, sample, jobs)
+    new = _predict_proba(new_model, sample, jobs)
+    if old.shape != new.shape:
+        return None
+    return {
+        "rows": int(sample.shape[0]),
+        "mean_abs_diff": float(np.abs(new - old).mean()),
+        "label_changes": float((old.argmax(axis=1) != new.argmax(axis=1)).mean()),
+    }
+
+
+def _model_side(path, content_hash, profile_dir, need_model):
+    """Сводка и (при необходимости) сама модель одной версии файла."""
+    summary = None
+    if profile_dir and content_hash:
+        summary = load_model_summary(profile_dir, content_hash)
+    model = None
+    if (summary is None or need_model) and os.path.exists(path):
+        model = load_model(path)
+        if model is None:
+            return None, None
+        summary = summarize_model(model)
+        if profile_dir and content_hash:
+            save_model_summary(profile_dir, content_hash, summary)
+    return summary, model
+
+
+def process_model_changes(
+    file,
+    temp_old_dir,
+    temp_new_dir,
+    old_hash=None,
+    new_hash=None,
+    cache_dir=None,
+    profile_dir=None,
+    sample=None,
+    jobs=1,
+):
+    """
+    Рассчитывает риск изменения модели между двумя версиями.
+
+    Сводка каждой версии считается один раз на хэш содержимого и хранится
+    рядом с кэшем DVC, а результат сравнения - в кэше результатов, поэтому
+    повторное сравнение с той же базовой моделью не загружает ни одну модель.
+
+    :param file: Путь к файлу относительно корня репозитория.
+    :param temp_old_dir: Папка с файлами старого коммита.
+    :param temp_new_dir: Папка с файлами нового коммита.
+    :param old_hash: Хэш старой версии файла.
+    :param new_hash: Хэш новой версии файла.
+    :param cache_dir: Папка кэша результатов.
+    :param profile_dir: Папка кэша DVC, рядом с которым хранятся сводки.
+    :param sample: Выборка для сравнения предсказаний: словарь path, hash, rows
+                   (None - предсказания не сравниваются).
+    :param jobs: n_jobs для предсказаний.
+    :return: Метрика модели (словарь) или None, если файл - не модель.
+
+    Сравнивающая функция (comparer) обработчика .pkl, см. cim.handlers.
+    """
+    mode = "model" if not sample else f"model-{sample['rows']}-{sample['hash']}"
+    use_cache = cache_dir and (old_hash or new_hash)
+    if use_cache:
+        cache_key = make_cache_key(
+            old_hash, new_hash, weights=DEFAULT_MODEL_WEIGHTS, mode=mode
+        )
+        cached = load_cached_result(cache_dir, cache_key)
+        if cached is not None:
+            return cached
+
+    need_model = bool(sample)
+    sides = [
+        _model_side(os.path.join(directory, file), content_hash, profile_dir, need_model)
+        for directory, content_hash in ((temp_old_dir, old_hash), (temp_new_dir, new_hash))
+    ]
+    (old_summary, old_model), (new_summary, new_model) = sides
+    if old_summary is None and new_summary is None:
+        return None
+
+    empty = {"estimators": 0, "depth": None, "nodes": None, "importances": None}
+    old_summary = old_summary or empty
+    new_summary = new_summary or empty
+    result = {
+        "risk": calculate_model_risk(old_summary, new_summary),
+        "estimators": {"old": old_summary["estimators"], "new": new_summary["estimators"]},
+        "depth": {"old": old_summary["depth"], "new": new_summary["depth"]},
+        "nodes": {"old": old_summary["nodes"], "new": new_summary["nodes"]},
+        "importance_drift": importance_drift(old_summary, new_summary),
+    }
+    if sample and old_model is not None and new_model is not None:
+        matrix = load_sample(sample["path"], sample["rows"], new_summary.get("n_features"))
+        if matrix is not None and old_summary.get("n_features") == new_summary.get(
+            "n_features"
+        ):
+            result["predictions"] = compare_predictions(old_model, new_model, matrix, jobs)
+
+    if use_cache:
+        store_cached_result(cache_dir, cache_key, result)
+    return result
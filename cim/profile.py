@@ -0,0 +1,409 @@
+import json
+import os
+import tempfile
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+from cim.sketches import HyperLogLog
+
+# Версия формата профиля: входит в путь сохранённого профиля, чтобы при
+# изменении расчёта статистик старые профили не переиспользовались.
+PROFILE_VERSION = 4
+PROFILE_DIR = "cim-profiles"
+
+
+@dataclass
+class ColumnProfile:
+    """Статистики одного столбца таблицы."""
+
+    name: str
+    dtype: str
+    duplicates: int = 0
+    nulls: int = 0
+    distinct: Optional[int] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    # Заполняются только в приближённом режиме (см. cim.sketches)
+    distinct_error: Optional[float] = None
+    sketch: Optional[dict] = None
+    # Заполняется только для разреженных матриц (см. cim.sparse)
+    nonzero: Optional[int] = None
+
+
+@dataclass
+class TableProfile:
+    """
+    Сводка таблицы, достаточная для расчёта метрики риска.
+
+    Хранит O(столбцов) данных вместо самой таблицы, поэтому профиль можно
+    посчитать один раз на хэш содержимого и переиспользовать между сравнениями.
+    """
+
+    rows: int
+    columns: int
+    column_profiles: List[ColumnProfile] = field(default_factory=list)
+    # Заполняются только для разреженных матриц (см. cim.sparse)
+    row_duplicates: Optional[int] = None
+    zero_rows: Optional[int] = None
+
+    @property
+    def duplicates(self):
+        """Дубликаты по столбцам; для разреженной матрицы - дубликаты строк."""
+        if self.row_duplicates is not None:
+            return self.row_duplicates
+        return sum(column.duplicates for column in self.column_profiles)
+
+    @property
+    def nulls(self):
+        return sum(column.nulls for column in self.column_profiles)
+
+    @property
+    def nonzero(self):
+        """Число ненулевых значений (None, если таблица не разреженная)."""
+        counts = [column.nonzero for column in self.column_profiles]
+        if not counts or None in counts:
+            return None
+        return sum(counts)
+
+    @property
+    def approximate(self):
+        return any(column.sketch is not None for column in self.column_profiles)
+
+    @property
+    def duplicates_error(self):
+        """Стандартная абсолютная погрешность числа дубликатов (0 для точного профиля)."""
+        return sum(
+            column.distinct * column.distinct_error
+            for column in self.column_profiles
+            if column.distinct_error is not None
+        )
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            rows=data["rows"],
+            columns=data["columns"],
+            column_profiles=[ColumnProfile(**c) for c in data["column_profiles"]],
+            row_duplicates=data.get("row_duplicates"),
+            zero_rows=data.get("zero_rows"),
+        )
+
+
+def _count_distinct(column, nulls):
+    """
+    Число различных значений столбца (пустое значение считается одним значением).
+
+    Для чисел фиксированной ширины векторизованная (SIMD) сортировка буфера
+    numpy оказывается быстрее хэш-таблицы, остальные типы считаются хэшированием.
+    """
+    if isinstance(column.dtype, np.dtype) and column.dtype.kind in "iuf":
+        # NaN при сортировке уходят в конец массива
+        ordered = np.sort(column.to_numpy())[: len(column) - nulls]
+        if len(ordered) == 0:
+            return int(nulls > 0)
+        return int(np.count_nonzero(ordered[1:] != ordered[:-1]) + 1 + (nulls > 0))
+    try:
+        return int(column.nunique(dropna=False))
+    except TypeError:
+        # Нехэшируемые значения (например, списки из JSON) сравниваем как строки
+        return int(column.astype(str).nunique(dropna=False))
+
+
+def profile_table(data):
+    """
+    Строит профиль таблицы с сохранением типов столбцов.
+
+    Пустые значения считаются для всех столбцов одним векторизованным проходом,
+    дубликаты - по числу различных значений без перевода таблицы в object-массив,
+    поэтому строковые, категориальные и смешанные (object) столбцы учитываются
+    наравне с числовыми.
+
+    :param data: Данные таблицы (pandas.DataFrame или numpy.ndarray).
+    :return: TableProfile.
+    """
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+    R, C = df.shape
+
+    nulls = df.isna().sum().to_numpy()
+
+    columns = []
+    for col_idx in range(C):
+        column = df.iloc[:, col_idx]
+        name = df.columns[col_idx]
+        distinct = _count_distinct(column, int(nulls[col_idx]))
+        min_value = max_value = None
+        if is_numeric_dtype(column.dtype) and not is_bool_dtype(column.dtype):
+            min_value, max_value = column.min(), column.max()
+        columns.append(
+            ColumnProfile(
+                name=str(name),
+                dtype=str(column.dtype),
+                duplicates=int(R - distinct),
+                nulls=int(nulls[col_idx]),
+                distinct=distinct,
+                min=None if pd.isna(min_value) else float(min_value),
+                max=None if pd.isna(max_value) else float(max_value),
+            )
+        )
+    return TableProfile(rows=int(R), columns=int(C), column_profiles=columns)
+
+
+def unique_sorted(values):
+    """
+    Отсортированные различные значения массива.
+
+    Эквивалент np.unique для одномерных массивов: для целых чисел (в том
+    числе 64-битных хэшей) np.unique в numpy 2.x заметно медленнее
+    сортировки с последующим сравнением соседних элементов.
+    """
+    ordered = np.sort(values)
+    if len(ordered) == 0:
+        return ordered
+    keep = np.empty(len(ordered), dtype=bool)
+    keep[0] = True
+    np.not_equal(ordered[1:], ordered[:-1], out=keep[1:])
+    return ordered[keep]
+
+
+def _hash_values(values):
+    """64-битные хэши значений столбца (без пустых значений)."""
+    try:
+        return pd.util.hash_array(values)
+    except TypeError:
+        return pd.util.hash_array(values.astype(str))
+
+
+class ProfileAccumulator:
+    """
+    Накопитель профиля таблицы, которая читается по частям.
+
+    Строки, пустые значения и min/max суммируются по частям. Различные значения
+    учитываются по 64-битным хэшам: в памяти хранится 8 байт на различное
+    значение столбца вместо самих данных, а число дубликатов получается
+    приближённым лишь в меру коллизий хэшей. Если задана precision, вместо
+    множества хэшей используется скетч HyperLogLog фиксированного размера.
+
+    Накопители одной таблицы, заполненные разными частями (или процессами),
+    объединяются методом merge.
+    """
+
+    # Сколько хэшей копить до слияния с уже накопленным множеством
+    MERGE_THRESHOLD = 1 << 20
+
+    def __init__(self, precision=None):
+        self.precision = precision
+        self.rows = 0
+        self.names = None
+        self.dtypes = None
+        self.nulls = None
+        self.minimums = None
+        self.maximums = None
+        self._hashes = None
+        self._pending = None
+
+    def update(self, chunk):
+        """
+        Учитывает очередную часть таблицы.
+
+        :param chunk: Часть таблицы (pandas.DataFrame).
+        """
+        if self.names is None:
+            C = chunk.shape[1]
+            self.names = [str(name) for name in chunk.columns]
+            self.dtypes = [str(dtype) for dtype in chunk.dtypes]
+            self.nulls = [0] * C
+            self.minimums = [None] * C
+            self.maximums = [None] * C
+            if self.precision:
+                self._hashes = [HyperLogLog(self.precision) for _ in range(C)]
+            else:
+                self._hashes = [np.empty(0, dtype=np.uint64) for _ in range(C)]
+            self._pending = [[] for _ in range(C)]
+
+        self.rows += len(chunk)
+        nulls = chunk.isna().sum().to_numpy()
+        for col_idx in range(len(self.names)):
+            column = chunk.iloc[:, col_idx]
+            self.nulls[col_idx] += int(nulls[col_idx])
+            valid = column.dropna()
+            if len(valid) == 0:
+                continue
+
+            if is_numeric_dtype(column.dtype) and not is_bool_dtype(column.dtype):
+                # Части одного файла могут прочитаться как int и как float -
+                # приводим к float64, чтобы хэши одинаковых чисел совпадали
+                values = valid.to_numpy(dtype=np.float64)
+                self.minimums[col_idx] = _combine(min, self.minimums[col_idx], values.min())
+                self.maximums[col_idx] = _combine(max, self.maximums[col_idx], values.max())
+            else:
+                values = valid.to_numpy()
+            self._add_hashes(col_idx, _hash_values(values))
+
+    def merge(self, other):
+        """
+        Объединяет накопитель с другим накопителем той же таблицы.
+
+        :param other: ProfileAccumulator, заполненный другими частями таблицы.
+        :return: self.
+        """
+        if other.names is None:
+            return self
+        if self.names is None:
+            self.__dict__.update(
+                {k: v for k, v in other.__dict__.items() if k != "precision"}
+            )
+            return self
+
+        self.rows += other.rows
+        for col_idx in range(len(self.names)):
+            self.nulls[col_idx] += other.nulls[col_idx]
+            for bounds, value, func in (
+                (self.minimums, other.minimums[col_idx], min),
+                (self.maximums, other.maximums[col_idx], max),
+            ):
+                if value is not None:
+                    bounds[col_idx] = _combine(func, bounds[col_idx], value)
+            if self.precision:
+                self._hashes[col_idx].merge(other._hashes[col_idx])
+            else:
+                other._merge_pending(col_idx)
+                self._pending[col_idx].append(other._hashes[col_idx])
+                self._merge_pending(col_idx)
+        return self
+
+    def _add_hashes(self, col_idx, hashes):
+        if self.precision:
+            self._hashes[col_idx].add_hashes(hashes)
+            return
+        self._pending[col_idx].append(unique_sorted(hashes))
+        pending = sum(len(h) for h in self._pending[col_idx])
+        if pending >= max(len(self._hashes[col_idx]), self.MERGE_THRESHOLD):
+            self._merge_pending(col_idx)
+
+    def _merge_pending(self, col_idx):
+        if self._pending[col_idx]:
+            self._hashes[col_idx] = unique_sorted(
+                np.concatenate([self._hashes[col_idx]] + self._pending[col_idx])
+            )
+            self._pending[col_idx] = []
+
+    def result(self):
+        """
+        Возвращает профиль по всем учтённым частям.
+
+        :return: TableProfile.
+        """
+        if self.names is None:
+            return TableProfile(rows=0, columns=0)
+
+        columns = []
+        for col_idx, name in enumerate(self.names):
+            has_nulls = int(self.nulls[col_idx] > 0)
+            sketch = distinct_error = None
+            if self.precision:
+                hll = self._hashes[col_idx]
+                # Оценка не может превышать число непустых значений
+                values = min(hll.count(), self.rows - self.nulls[col_idx])
+                sketch, distinct_error = hll.to_dict(), hll.relative_error
+            else:
+                self._merge_pending(col_idx)
+                values = len(self._hashes[col_idx])
+            distinct = values + has_nulls
+            columns.append(
+                ColumnProfile(
+                    name=name,
+                    dtype=self.dtypes[col_idx],
+                    duplicates=self.rows - distinct,
+                    nulls=self.nulls[col_idx],
+                    distinct=distinct,
+                    min=self.minimums[col_idx],
+                    max=self.maximums[col_idx],
+                    distinct_error=distinct_error,
+                    sketch=sketch,
+                )
+            )
+        return TableProfile(rows=self.rows, columns=len(self.names), column_profiles=columns)
+
+
+def _combine(func, current, value):
+    return float(value) if current is None else float(func(current, value))
+
+
+def profile_chunks(chunks, precision=None):
+    """
+    Строит профиль таблицы по итератору её частей.
+
+    :param chunks: Итератор pandas.DataFrame (см. consumer.iter_table_chunks).
+    :param precision: Точность HyperLogLog для приближённого режима (None - точный).
+    :return: TableProfile.
+    """
+    accumulator = ProfileAccumulator(precision)
+    for chunk in chunks:
+        accumulator.update(chunk)
+    return accumulator.result()
+
+
+def profile_mode(precision=None, chunksize=None):
+    """
+    Метка режима профиля: профили разных режимов хранятся раздельно.
+
+    Точный профиль, собранный по частям, считает различные значения иначе,
+    чем профиль всей таблицы (тип столбца выводится по каждой части),
+    поэтому размер части входит в метку.
+    """
+    if precision:
+        return f"hll{precision}"
+    return f"exact-chunk{chunksize}" if chunksize else "exact"
+
+
+def _profile_path(cache_dir, content_hash, mode, kind=None):
+    return os.path.join(
+        cache_dir,
+        PROFILE_DIR,
+        f"v{PROFILE_VERSION}-{mode}",
+        kind or "any",
+        content_hash[:2],
+        content_hash[2:] + ".json",
+    )
+
+
+def load_profile(cache_dir, content_hash, mode="exact", kind=None):
+    """
+    Читает сохранённый профиль по хэшу содержимого.
+
+    :param cache_dir: Папка кэша DVC.
+    :param content_hash: Хэш содержимого файла (md5 из dvc.lock).
+    :param mode: Режим профиля (см. profile_mode).
+    :param kind: Тип файла (см. cim.handlers.file_type).
+    :return: TableProfile или None, если профиль ещё не посчитан.
+    """
+    try:
+        with open(_profile_path(cache_dir, content_hash, mode, kind), "r") as f:
+            return TableProfile.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_profile(cache_dir, content_hash, profile, mode="exact", kind=None):
+    """
+    Сохраняет профиль рядом с объектами кэша DVC.
+
+    :param cache_dir: Папка кэша DVC.
+    :param content_hash: Хэш содержимого файла (md5 из dvc.lock).
+    :param profile: TableProfile.
+    :param mode: Режим профиля (см. profile_mode).
+    :param kind: Тип файла (см. cim.handlers.file_type).
+    """
+    path = _profile_path(cache_dir, content_hash, mode, kind)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(profile.to_dict(), f)
+    os.replace(temp_path, path)
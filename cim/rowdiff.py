@@ -0,0 +1,323 @@
+"""
+Построчное сравнение двух версий таблицы.
+
+Метрика риска сравнивает агрегаты (число строк, дубликаты, пустые
+значения), поэтому переписанные строки при том же их числе почти не
+меняют Q. Здесь строки сопоставляются: по ключевому столбцу (например, id
+в data/prepared/*.tsv) - тогда считаются добавленные, удалённые и
+изменённые строки с числом изменений по столбцам, - или, без ключа, по
+хэшам строк целиком (мультимножества строк).
+
+Ключ - имя столбца или его номер ("0" - первый столбец). Текстовые таблицы
+без строки заголовка (как data/prepared/*.tsv, которые пишет src/prepare.py)
+распознаются по первой строке: если в ней есть числа, это данные, а
+столбцы получают имена-номера "0", "1", ...; ключ "id" в такой таблице -
+первый столбец.
+
+Обе версии читаются потоково и раскладываются по корзинам хэша ключа;
+если таблицы не помещаются в MEMORY_BUDGET, корзины пишутся на диск, и в
+памяти одновременно находится только одна пара корзин.
+"""
+import math
+import os
+import pickle
+import shutil
+import tempfile
+
+import pandas as pd
+
+from cim.cache import load_cached_result, make_cache_key, store_cached_result
+from cim.consumer import DEFAULT_CHUNKSIZE, header_options, iter_table_chunks
+from cim.handlers import file_type, get_handler
+
+ROW_DIFF_VERSION = 2
+# Сколько памяти может занимать одна пара корзин
+MEMORY_BUDGET = 256 * 1024 * 1024
+# Во сколько раз таблица в pandas больше файла (оценка сверху для строк)
+EXPANSION = 4
+OCCURRENCE = "__occurrence"
+ROW_HASH = "__row_hash"
+
+
+# Ключ "id" в таблице без заголовка - её первый столбец
+HEADERLESS_ID = "id"
+
+
+class _MissingKey(Exception):
+    """В таблице нет ключевого столбца."""
+
+
+class _Partitions:
+    """
+    Части таблицы, разложенные по корзинам.
+
+    Без папки (одна корзина) части хранятся в памяти, иначе каждая корзина -
+    файл на диске, в который части дописываются по мере чтения таблицы.
+    """
+
+    def __init__(self, buckets, directory=None):
+        self.buckets = buckets
+        self.directory = directory
+        self.parts = []
+        self.columns = None
+
+    def _path(self, bucket):
+        return os.path.join(self.directory, f"{bucket}.pkl")
+
+    def add(self, frame, bucket_ids):
+        if self.columns is None:
+            self.columns = list(frame.columns)
+        if self.directory is None:
+            self.parts.append(frame)
+            return
+        for bucket, part in frame.groupby(bucket_ids, sort=False):
+            with open(self._path(bucket), "ab") as f:
+                pickle.dump(part, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def read(self, bucket):
+        parts = self.parts
+        if self.directory is not None:
+            parts = []
+            if os.path.exists(self._path(bucket)):
+                with open(self._path(bucket), "rb") as f:
+                    while True:
+                        try:
+                            parts.append(pickle.load(f))
+                        except EOFError:
+                            break
+        if not parts:
+            return pd.DataFrame(columns=self.columns or [])
+        return pd.concat(parts, ignore_index=True)
+
+
+def _reader_options(path):
+    """
+    Параметры чтения таблицы.
+
+    Текстовые таблицы сравниваются как текст: тип столбца, выведенный по
+    отдельной части файла, не должен влиять на совпадение строк. Если в
+    первой строке есть числа, это не заголовок, а данные (см. header_options).
+    """
+    handler = get_handler(path)
+    if handler is None or handler.name != "delimited":
+        return {}
+    return {"dtype": str, "keep_default_na": False, **header_options(path)}
+
+
+def _resolve_key(key, columns, headerless):
+    """Ключевой столбец таблицы (по имени или номеру) или None."""
+    names = [str(column) for column in columns]
+    if key in names:
+        return columns[names.index(key)]
+    if key.isdigit() and int(key) < len(columns):
+        return columns[int(key)]
+    if headerless and key.lower() == HEADERLESS_ID and columns:
+        return columns[0]
+    return None
+
+
+def _partition(path, key, partitions, chunksize):
+    """
+    Раскладывает строки файла по корзинам хэша ключа (или всей строки).
+
+    :return: Число строк и имя ключевого столбца в таблице.
+    """
+    if path is None:
+        return 0, key
+    rows = 0
+    options = _reader_options(path)
+    for chunk in iter_table_chunks(path, chunksize, **options):
+        rows += len(chunk)
+        if key is None:
+            hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+            frame = pd.DataFrame({ROW_HASH: hashes})
+        else:
+            if rows == len(chunk):
+                key = _resolve_key(key, list(chunk.columns), "header" in options)
+                if key is None:
+                    raise _MissingKey()
+            hashes = pd.util.hash_pandas_object(chunk[key], index=False).to_numpy()
+            frame = chunk.reset_index(drop=True)
+        partitions.add(frame, hashes % partitions.buckets)
+    return rows, key
+
+
+def _changed(old, new):
+    """Маска различающихся значений двух столбцов (пустые равны пустым)."""
+    equal = old.to_numpy() == new.to_numpy()
+    both_null = old.isna().to_numpy() & new.isna().to_numpy()
+    return ~(equal | both_null)
+
+
+def _diff_keyed(old, new, key, columns, counts):
+    """Сравнивает корзину по ключу; строки с повторным ключом - по порядку."""
+    for frame in (old, new):
+        frame[OCCURRENCE] = frame.groupby(key, sort=False, dropna=False).cumcount()
+    merged = pd.merge(
+        old[[key, OCCURRENCE, *columns]],
+        new[[key, OCCURRENCE, *columns]],
+        on=[key, OCCURRENCE],
+        how="inner",
+        suffixes=("_old", "_new"),
+    )
+    counts["inserted"] += len(new) - len(merged)
+    counts["deleted"] += len(old) - len(merged)
+    updated = None
+    for column in columns:
+        changed = _changed(merged[f"{column}_old"], merged[f"{column}_new"])
+        counts["columns"][column] += int(changed.sum())
+        updated = changed if updated is None else updated | changed
+    changed_rows = 0 if updated is None else int(updated.sum())
+    counts["updated"] += changed_rows
+    counts["unchanged"] += len(merged) - changed_rows
+
+
+def _diff_hashed(old, new, counts):
+    """Сравнивает корзину как мультимножества хэшей строк."""
+    old_hashes = old[ROW_HASH] if ROW_HASH in old else pd.Series(dtype="uint64")
+    new_hashes = new[ROW_HASH] if ROW_HASH in new else pd.Series(dtype="uint64")
+    difference = new_hashes.value_counts().sub(old_hashes.value_counts(), fill_value=0)
+    inserted = int(difference[difference > 0].sum())
+    counts["inserted"] += inserted
+    counts["deleted"] += int(-difference[difference < 0].sum())
+    counts["unchanged"] += len(new_hashes) - inserted
+
+
+def _size(path):
+    return os.path.getsize(path) if path is not None else 0
+
+
+def diff_tables(old_path, new_path, key=None, chunksize=None, buckets=None, temp_dir=None):
+    """
+    Построчно сравнивает две версии таблицы.
+
+    :param old_path: Путь к старой версии (None, если файла не было).
+    :param new_path: Путь к новой версии (None, если файл удалён).
+    :param key: Ключевой столбец (имя или номер); None - сравнение по хэшам
+                строк целиком. Если столбца нет в таблице, выводится
+                предупреждение и строки тоже сравниваются по хэшам.
+    :param chunksize: Число строк в одной читаемой части.
+    :param buckets: Число корзин (None - по размеру файлов и MEMORY_BUDGET).
+    :param temp_dir: Папка для корзин на диске (None - системная временная).
+    :return: Словарь: key (запрошенный ключ), mode ("key" - сравнение по ключу,
+             "rows" - по хэшам строк), old_rows, new_rows, inserted, deleted,
+             updated, unchanged и, при сравнении по ключу, число изменений по столбцам
+             (columns), добавленные и удалённые столбцы.
+    """
+    chunksize = chunksize or DEFAULT_CHUNKSIZE
+    if buckets is None:
+        total = EXPANSION * (_size(old_path) + _size(new_path))
+        buckets = max(1, math.ceil(total / MEMORY_BUDGET))
+
+    directory = tempfile.mkdtemp(dir=temp_dir) if buckets > 1 else None
+    try:
+        old_parts = _Partitions(buckets, directory and os.path.join(directory, "old"))
+        new_parts = _Partitions(buckets, directory and os.path.join(directory, "new"))
+        for parts in (old_parts, new_parts):
+            if parts.directory is not None:
+                os.makedirs(parts.directory)
+        try:
+            old_rows, old_key = _partition(old_path, key, old_parts, chunksize)
+            new_rows, new_key = _partition(new_path, key, new_parts, chunksize)
+            if old_path and new_path and old_key != new_key:
+                raise _MissingKey()
+        except _MissingKey:
+            if directory is not None:
+                shutil.rmtree(directory)
+                directory = None
+            path = new_path or old_path
+            print(
+                f"Warning: key column {key!r} not found in {path}; "
+                "comparing whole rows by their hashes"
+            )
+            result = diff_tables(old_path, new_path, None, chunksize, buckets, temp_dir)
+            result["key"] = key
+            return result
+
+        requested, key = key, (new_key if new_path else old_key)
+        old_columns = [c for c in old_parts.columns or [] if c != key]
+        new_columns = [c for c in new_parts.columns or [] if c != key]
+        keyed = bool(key is not None and old_parts.columns and new_parts.columns)
+        columns = [c for c in new_columns if c in old_columns] if keyed else []
+        counts = {
+            "inserted": 0,
+            "deleted": 0,
+            "updated": 0,
+            "unchanged": 0,
+            "columns": dict.fromkeys(columns, 0),
+        }
+        for bucket in range(buckets):
+            old, new = old_parts.read(bucket), new_parts.read(bucket)
+            if keyed:
+                _diff_keyed(old, new, key, columns, counts)
+            elif key is None:
+                _diff_hashed(old, new, counts)
+            else:
+                # Одной из версий нет: все строки добавлены или удалены
+                counts["inserted"] += len(new)
+                counts["deleted"] += len(old)
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    result = {
+        "key": requested,
+        "mode": "rows" if key is None else "key",
+        "old_rows": old_rows,
+        "new_rows": new_rows,
+        "inserted": counts["inserted"],
+        "deleted": counts["deleted"],
+        "updated": counts["updated"],
+        "unchanged": counts["unchanged"],
+    }
+    if keyed:
+        # Имена-номера столбцов таблицы без заголовка - строки, как в JSON
+        result["columns"] = {str(c): n for c, n in counts["columns"].items()}
+        result["added_columns"] = [str(c) for c in new_columns if c not in old_columns]
+        result["removed_columns"] = [str(c) for c in old_columns if c not in new_columns]
+    return result
+
+
+def process_row_diff(
+    file,
+    temp_old_dir,
+    temp_new_dir,
+    old_hash=None,
+    new_hash=None,
+    cache_dir=None,
+    key=None,
+    chunksize=None,
+):
+    """
+    Построчное сравнение версий файла с кэшированием по хэшам содержимого.
+
+    :param file: Путь к файлу относительно корня репозитория.
+    :param temp_old_dir: Папка с файлами старого коммита.
+    :param temp_new_dir: Папка с файлами нового коммита.
+    :param old_hash: Хэш старой версии файла.
+    :param new_hash: Хэш новой версии файла.
+    :param cache_dir: Папка кэша результатов.
+    :param key: Ключевой столбец (None - сравнение по хэшам строк).
+    :param chunksize: Число строк в одной читаемой части.
+    :return: Результат diff_tables.
+    """
+    paths = [os.path.join(directory, file) for directory in (temp_old_dir, temp_new_dir)]
+    old_path, new_path = (path if os.path.exists(path) else None for path in paths)
+
+    use_cache = cache_dir and (old_hash or new_hash)
+    if use_cache:
+        cache_key = make_cache_key(
+            old_hash,
+            new_hash,
+            mode=f"rows-v{ROW_DIFF_VERSION}-{key or ''}",
+            kind=file_type(new_path or old_path or file),
+        )
+        cached = load_cached_result(cache_dir, cache_key)
+        if cached is not None:
+            return cached
+
+    result = diff_tables(old_path, new_path, key=key, chunksize=chunksize)
+
+    if use_cache:
+        store_cached_result(cache_dir, cache_key, result)
+    return result
@@ -0,0 +1,112 @@
+import base64
+import math
+import zlib
+
+import numpy as np
+
+MIN_PRECISION = 4
+MAX_PRECISION = 18
+
+
+def precision_for_error(relative_error):
+    """
+    Подбирает точность HyperLogLog под заданную относительную погрешность.
+
+    :param relative_error: Допустимая относительная погрешность (например, 0.01).
+    :return: Точность p (число регистров 2**p).
+    """
+    precision = math.ceil(math.log2((1.04 / relative_error) ** 2))
+    return min(max(precision, MIN_PRECISION), MAX_PRECISION)
+
+
+def _bit_length(values):
+    """Длина в битах для массива uint64 (0 для нуля), без потери точности."""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    # frexp возвращает точный показатель степени для целых < 2**53
+    high_bits = np.frexp(high)[1]
+    low_bits = np.frexp(low)[1]
+    return np.where(high_bits > 0, high_bits + 32, low_bits)
+
+
+class HyperLogLog:
+    """
+    Скетч HyperLogLog для оценки числа различных значений.
+
+    Занимает 2**precision байт независимо от объёма данных; скетчи с одинаковой
+    точностью объединяются (merge), поэтому их можно считать по частям таблицы
+    и в разных процессах, а затем слить. Принимает готовые 64-битные хэши
+    значений (см. pandas.util.hash_array).
+    """
+
+    def __init__(self, precision=14):
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError(f"Unsupported HyperLogLog precision: {precision}")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def relative_error(self):
+        """Стандартная относительная погрешность оценки."""
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add_hashes(self, hashes):
+        """
+        Учитывает массив 64-битных хэшей значений.
+
+        :param hashes: numpy.ndarray dtype uint64.
+        """
+        if len(hashes) == 0:
+            return
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.intp)
+        # Позиция первой единицы в оставшихся 64 - p битах
+        rest = hashes << p
+        rank = (65 - _bit_length(rest)).clip(max=64 - self.precision + 1)
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def merge(self, other):
+        """
+        Объединяет скетч с другим скетчем той же точности.
+
+        :param other: HyperLogLog.
+        :return: self.
+        """
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        """
+        Оценивает число различных значений.
+
+        :return: Оценка (int).
+        """
+        m = len(self.registers)
+        if m >= 128:
+            alpha = 0.7213 / (1 + 1.079 / m)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(int)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros > 0:
+            # Поправка для малых мощностей (linear counting)
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_dict(self):
+        return {
+            "precision": self.precision,
+            "registers": base64.b64encode(zlib.compress(self.registers.tobytes())).decode(
+                "ascii"
+            ),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["precision"])
+        raw = zlib.decompress(base64.b64decode(data["registers"]))
+        sketch.registers = np.frombuffer(raw, dtype=np.uint8).copy()
+        return sketch
@@ -0,0 +1,220 @@
+import json
+import math
+import os
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+
+from cim.profile import ColumnProfile, TableProfile, unique_sorted
+
+# Формат матриц признаков, которые пишет src/matrix_io.save_csr:
+# папка <имя>.csr с массивами indptr/indices/data в .npy и заголовком header.json.
+# feature_offset в заголовке - число первых столбцов, которые не являются
+# признаками (у матриц featurize - id и метка)
+CSR_ARRAYS = ("indptr", "indices", "data")
+HEADER_FILE = "header.json"
+FORMAT_VERSION = 1
+
+# Сколько ненулевых значений хэшировать за один проход по строкам
+ROW_BLOCK = 1 << 22
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+@dataclass
+class CsrArrays:
+    """Буферы разреженной матрицы CSR, отображённые в память (без scipy)."""
+
+    indptr: np.ndarray
+    indices: np.ndarray
+    data: np.ndarray
+    shape: tuple
+    columns: List[str]
+    feature_offset: int = 0
+
+    @property
+    def nnz(self):
+        return int(self.indptr[-1])
+
+
+def load_csr_arrays(path):
+    """
+    Открывает матрицу CSR через np.load(mmap_mode="r"), не копируя данные.
+
+    Длины массивов берутся из заголовка: прерванное дописывание оставляет
+    массивы длиннее, и их хвост отбрасывается.
+
+    :param path: Папка матрицы (<имя>.csr).
+    :return: CsrArrays.
+    """
+    with open(os.path.join(path, HEADER_FILE), "r") as f:
+        header = json.load(f)
+    if header.get("format") != "csr" or header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported matrix format in {path}: {header}")
+    indptr, indices, data = (
+        np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        for name in CSR_ARRAYS
+    )
+    shape = tuple(header["shape"])
+    if len(indptr) < shape[0] + 1:
+        raise ValueError(f"The arrays of {path} are shorter than its header")
+    indptr = indptr[: shape[0] + 1]
+    nnz = int(indptr[-1])
+    if len(indices) < nnz or len(data) < nnz:
+        raise ValueError(f"The arrays of {path} are shorter than its header")
+    indices, data = indices[:nnz], data[:nnz]
+    columns = header.get("columns") or []
+    if len(columns) != shape[1]:
+        columns = [str(col_idx) for col_idx in range(shape[1])]
+    feature_offset = min(int(header.get("feature_offset", 0)), shape[1])
+    return CsrArrays(indptr, indices, data, shape, columns, feature_offset)
+
+
+def _mix(values):
+    """Финальное перемешивание splitmix64 для массива uint64."""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def hash_csr_rows(matrix, block=ROW_BLOCK):
+    """
+    64-битные хэши строк матрицы CSR без её уплотнения.
+
+    Хэш строки - сумма (по модулю 2**64) хэшей пар (столбец, значение) её
+    ненулевых элементов, перемешанная с их числом; суммы по строкам берутся
+    разностью префиксных сумм по indptr. Учитываются только столбцы
+    признаков (начиная с matrix.feature_offset). Строки обрабатываются
+    блоками примерно по block ненулевых значений, поэтому в память
+    одновременно попадает только часть буферов.
+
+    :param matrix: CsrArrays.
+    :param block: Число ненулевых значений в одном блоке.
+    :return: Кортеж numpy.ndarray длиной в число строк: хэши (uint64) и
+        число ненулевых признаков строки.
+    """
+    R = matrix.shape[0]
+    indptr = np.asarray(matrix.indptr, dtype=np.int64)
+    offset = np.uint64(matrix.feature_offset)
+    hashes = np.empty(R, dtype=np.uint64)
+    lengths = np.empty(R, dtype=np.int64)
+    start = 0
+    while start < R:
+        # Конец блока: хотя бы одна строка и не больше block значений
+        stop = int(np.searchsorted(indptr, indptr[start] + block, side="right")) - 1
+        stop = min(max(stop, start + 1), R)
+        lo, hi = indptr[start], indptr[stop]
+        columns = np.asarray(matrix.indices[lo:hi], dtype=np.uint64)
+        values = np.asarray(matrix.data[lo:hi], dtype=np.float64).view(np.uint64)
+        features = columns >= offset
+        entries = np.where(features, _mix(values ^ columns * _GOLDEN), np.uint64(0))
+        sums = np.concatenate([np.zeros(1, dtype=np.uint64), np.cumsum(entries)])
+        counts = np.concatenate([np.zeros(1, dtype=np.int64), np.cumsum(features)])
+        bounds = indptr[start : stop + 1] - lo
+        lengths[start:stop] = counts[bounds[1:]] - counts[bounds[:-1]]
+        hashes[start:stop] = _mix(
+            sums[bounds[1:]] - sums[bounds[:-1]] + lengths[start:stop].astype(np.uint64)
+        )
+        start = stop
+    return hashes, lengths
+
+
+def profile_csr(path, chunksize=None, precision=None):
+    """
+    Строит профиль матрицы CSR прямо по отображённым в память буферам.
+
+    Число ненулевых значений каждого столбца считается одним np.bincount по
+    indices, пустые значения - по NaN в data; матрица не уплотняется.
+    Дубликаты для разреженной матрицы считаются по строкам целиком (через
+    хэши строк, см. hash_csr_rows): по столбцам почти все значения - нули.
+    Профилируются только столбцы признаков: id и метка из первых
+    feature_offset столбцов сделали бы каждую строку уникальной и ненулевой.
+
+    :param path: Папка матрицы (<имя>.csr).
+    :param chunksize: Не используется (буферы читаются через mmap блоками, см. ROW_BLOCK).
+    :param precision: Не используется: профиль всегда точный.
+    :return: TableProfile.
+    """
+    matrix = load_csr_arrays(path)
+    R, C = matrix.shape
+    offset = matrix.feature_offset
+    nonzero = np.bincount(matrix.indices, minlength=C)
+    if matrix.data.dtype.kind == "f":
+        nulls = np.bincount(matrix.indices[np.isnan(matrix.data)], minlength=C)
+    else:
+        nulls = np.zeros(C, dtype=np.int64)
+
+    columns = [
+        ColumnProfile(
+            name=name,
+            dtype=str(matrix.data.dtype),
+            nulls=int(nulls[col_idx]),
+            nonzero=int(nonzero[col_idx]),
+        )
+        for col_idx, name in enumerate(matrix.columns)
+        if col_idx >= offset
+    ]
+    row_hashes, row_lengths = hash_csr_rows(matrix)
+    return TableProfile(
+        rows=int(R),
+        columns=int(C - offset),
+        column_profiles=columns,
+        row_duplicates=int(R - len(unique_sorted(row_hashes))),
+        zero_rows=int(np.count_nonzero(row_lengths == 0)),
+    )
+
+
+def _nonzero_rates(profile):
+    """Доля ненулевых значений по столбцам: {имя: доля}."""
+    if not profile.rows:
+        return {}
+    return {
+        column.name: column.nonzero / profile.rows
+        for column in profile.column_profiles
+        if column.nonzero is not None
+    }
+
+
+def sparse_metric(risk, old_profile, new_profile):
+    """
+    Запись метрики разреженной матрицы для итогового JSON.
+
+    Рядом с риском выводятся nnz, пустые (нулевые) строки, дубликаты строк и
+    дрейф доли ненулевых значений по признакам (столбцам с одинаковым именем;
+    отсутствующий в одной из версий признак считается нулевым).
+
+    :param risk: Значение риска.
+    :param old_profile: Профиль старой версии (TableProfile).
+    :param new_profile: Профиль новой версии (TableProfile).
+    :return: Словарь.
+    """
+    old_rates = _nonzero_rates(old_profile)
+    new_rates = _nonzero_rates(new_profile)
+    # Порядок признаков фиксирован: сумма float зависит от порядка слагаемых,
+    # а порядок множества строк - от PYTHONHASHSEED
+    drift = {
+        name: abs(new_rates.get(name, 0.0) - old_rates.get(name, 0.0))
+        for name in sorted(set(old_rates) | set(new_rates))
+    }
+    top = max(drift, key=drift.get) if drift else None
+
+    def pair(attribute):
+        return {
+            "old": getattr(old_profile, attribute),
+            "new": getattr(new_profile, attribute),
+        }
+
+    return {
+        "risk": risk,
+        "nnz": pair("nonzero"),
+        "zero_rows": pair("zero_rows"),
+        "duplicate_rows": pair("row_duplicates"),
+        "nnz_drift": {
+            "mean": math.fsum(drift.values()) / len(drift) if drift else 0.0,
+            "max": drift[top] if drift else 0.0,
+            "feature": top,
+        },
+    }
@@ -1,27 +1,169 @@
+import hashlib
+import json
 import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from cim.utils import count_lines_in_file
+# Индекс состояний файлов: (размер, mtime, inode) -> число строк и хэш
+STATE_INDEX = os.path.join(".cim", "state-index.json")
+STATE_INDEX_VERSION = 1
+READ_BLOCK = 1 << 20
+# Файлы, изменённые позже, чем за столько наносекунд до записи индекса,
+# в индекс не попадают: изменение в ту же единицу mtime не было бы замечено
+RACY_NS = 2_000_000_000
 
 
-def collect_file_states(repo_path):
+def scan_file(file_path):
     """
-    Собирает состояние файлов в репозитории.
+    Считает строки и md5 файла за один проход блоками по READ_BLOCK байт.
+
+    Файл читается в двоичном режиме, поэтому двоичные файлы и файлы
+    в любой кодировке обрабатываются одинаково. Последняя строка без
+    перевода строки тоже считается строкой.
+
+    :param file_path: Путь к файлу.
+    :return: Словарь: lines, hash.
+    """
+    digest = hashlib.md5()
+    lines = 0
+    last = b"\n"
+    with open(file_path, "rb") as f:
+        while True:
+            block = f.read(READ_BLOCK)
+            if not block:
+                break
+            digest.update(block)
+            lines += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        lines += 1
+    return {"lines": lines, "hash": digest.hexdigest()}
+
+
+def _stat_key(stat):
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def load_state_index(index_path):
+    """
+    Читает индекс состояний файлов.
+
+    :param index_path: Путь к файлу индекса.
+    :return: Словарь {путь: запись}; пустой, если индекса нет или он другой версии.
+    """
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if index.get("version") != STATE_INDEX_VERSION:
+        return {}
+    return index.get("files", {})
+
+
+def save_state_index(index_path, entries):
+    """
+    Сохраняет индекс состояний файлов (через временный файл).
+
+    :param index_path: Путь к файлу индекса.
+    :param entries: Словарь {путь: запись}.
+    """
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(index_path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump({"version": STATE_INDEX_VERSION, "files": entries}, f)
+    os.replace(temp_path, index_path)
+
+
+def _file_state(file_path, stat, cached):
+    """Состояние файла: из индекса, если stat не изменился, иначе - чтением."""
+    key = _stat_key(stat)
+    if cached is not None and cached.get("stat") == key:
+        return cached
+    try:
+        scanned = scan_file(file_path)
+    except OSError as e:
+        print(f"Error reading file {file_path}: {e}")
+        return None
+    return {
+        "lines": scanned["lines"],
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "hash": scanned["hash"],
+        "stat": key,
+    }
+
+
+def collect_file_states(repo_path, jobs=None, use_index=True):
+    """
+    Собирает состояние файлов в папке data репозитория.
+
+    Файлы читаются параллельно в пуле потоков (чтение и md5 отпускают GIL).
+    Файлы с теми же размером, mtime и inode, что и в прошлом запуске,
+    не читаются: их состояние берётся из индекса .cim/state-index.json.
 
     :param repo_path: Путь к репозиторию.
-    :return: Словарь с состоянием файлов.
+    :param jobs: Число потоков (None - по умолчанию ThreadPoolExecutor).
+    :param use_index: Использовать и обновлять индекс состояний.
+    :return: Словарь {путь к файлу: {lines, size, mtime, hash, stat}}.
     """
-    file_states = {}
-    for root, _, files in os.walk(os.path.join(repo_path, "data")):
-        for file in files:
-            file_path = os.path.join(root, file)
-            file_states[file_path] = count_lines_in_file(file_path)
+    files = []
+    for root, _, names in os.walk(os.path.join(repo_path, "data")):
+        for name in names:
+            file_path = os.path.join(root, name)
+            try:
+                files.append((file_path, os.stat(file_path)))
+            except OSError as e:
+                print(f"Error reading file {file_path}: {e}")
+
+    index_path = os.path.join(repo_path, STATE_INDEX)
+    index = load_state_index(index_path) if use_index else {}
+    relative = {file_path: os.path.relpath(file_path, repo_path) for file_path, _ in files}
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        states = executor.map(
+            lambda item: _file_state(item[0], item[1], index.get(relative[item[0]])),
+            files,
+        )
+        file_states = {
+            file_path: state
+            for (file_path, _), state in zip(files, states)
+            if state is not None
+        }
+
+    if use_index:
+        racy = time.time_ns() - RACY_NS
+        save_state_index(
+            index_path,
+            {
+                relative[file_path]: state
+                for file_path, state in file_states.items()
+                if state["mtime"] < racy
+            },
+        )
     return file_states
 
 
+def _lines(state):
+    """Число строк из состояния (словаря или, в старом формате, числа)."""
+    if state is None:
+        return 0
+    return state["lines"] if isinstance(state, dict) else state
+
+
+def _hash(state):
+    return state.get("hash") if isinstance(state, dict) else None
+
+
 def analyze_changes_between_states(old_state, new_state):
     """
     Анализирует изменения между двумя состояниями файлов.
 
+    Если в состояниях есть хэши, файл с тем же числом строк, но другим
+    содержимым считается изменённым, а с тем же хэшем - неизменённым
+    (даже если его mtime другой).
+
     :param old_state: Состояние файлов в старом коммите.
     :param new_state: Состояние файлов в новом коммите.
     :return: Метрики изменений.
@@ -29,11 +171,16 @@ def analyze_changes_between_states(old_state, new_state):
     added = 0
     deleted = 0
     modified = 0
+    modified_files = 0
+    unchanged_files = 0
 
     all_files = set(old_state.keys()).union(set(new_state.keys()))
     for file_path in all_files:
-        old_lines = old_state.get(file_path, 0)
-        new_lines = new_state.get(file_path, 0)
+        old = old_state.get(file_path)
+        new = new_state.get(file_path)
+        old_lines = _lines(old)
+        new_lines = _lines(new)
+        old_hash, new_hash = _hash(old), _hash(new)
 
         if old_lines == 0 and new_lines > 0:
             added += new_lines
@@ -42,8 +189,21 @@ def analyze_changes_between_states(old_state, new_state):
         elif old_lines != new_lines:
             modified += abs(new_lines - old_lines)
 
+        if old is None or new is None:
+            continue
+        if old_hash is not None and new_hash is not None:
+            changed = old_hash != new_hash
+        else:
+            changed = old_lines != new_lines
+        if changed:
+            modified_files += 1
+        else:
+            unchanged_files += 1
+
     return {
         "added_lines": added,
         "deleted_lines": deleted,
         "modified_lines": modified,
+        "modified_files": modified_files,
+        "unchanged_files": unchanged_files,
     }
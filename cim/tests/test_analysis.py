@@ -0,0 +1,20 @@
+import numpy as np
+
+from cim.analysis import calculate_risk
+from cim.profile import profile_table
+
+
+def test_calculate_risk_from_profiles():
+    old_data = np.array([[1.0, 2.0], [3.0, 4.0]])
+    new_data = np.array([[1.0, 2.0], [3.0, 4.0], [3.0, 5.0], [7.0, 8.0]])
+    expected = 0.2 * 1.0 + 0.4 * 0.5
+    assert np.isclose(calculate_risk(old_data, new_data), expected)
+    assert calculate_risk(profile_table(old_data), profile_table(new_data)) == (
+        calculate_risk(old_data, new_data)
+    )
+
+
+def test_calculate_risk_nulls():
+    old_data = np.array([[1.0, 2.0], [3.0, 4.0]])
+    new_data = np.array([[1.0, np.nan], [3.0, 4.0]])
+    assert np.isclose(calculate_risk(old_data, new_data), 0.2 * 0.25)
@@ -0,0 +1,235 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from unittest import mock
+
+from cim.artifacts import (
+    ADDED,
+    MODIFIED,
+    UNCHANGED,
+    collect_commit_hashes,
+    diff_dvc_locks,
+    expand_lock_entry,
+    fetch_missing_objects,
+    find_cache_object,
+    group_artifact_files,
+    link_cached_files,
+    unchanged_lock_entries,
+)
+
+
+def put_object(cache_dir, md5, content):
+    path = os.path.join(cache_dir, "files", "md5", md5[:2], md5[2:])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+    return path
+
+
+def test_find_cache_object():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        path = put_object(cache_dir, "aabbcc", "data")
+        assert find_cache_object(cache_dir, "aabbcc") == path
+        assert find_cache_object(cache_dir, "ddeeff") is None
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_expand_lock_entry_dir():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        manifest = [
+            {"md5": "111111", "relpath": "train.tsv"},
+            {"md5": "222222", "relpath": "test.tsv"},
+        ]
+        put_object(cache_dir, "abcdef.dir", json.dumps(manifest))
+        put_object(cache_dir, "111111", "a")
+
+        files, missing = expand_lock_entry(
+            {"path": "data/prepared", "md5": "abcdef.dir"}, cache_dir
+        )
+        assert files == {
+            os.path.join("data/prepared", "train.tsv"): "111111",
+            os.path.join("data/prepared", "test.tsv"): "222222",
+        }
+        assert missing == {"222222"}
+
+        files, missing = expand_lock_entry(
+            {"path": "data/features", "md5": "999999.dir"}, cache_dir
+        )
+        assert files == {}
+        assert missing == {"999999.dir"}
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+@mock.patch("cim.artifacts.read_dvc_lock")
+def test_collect_commit_hashes(mock_read_dvc_lock):
+    cache_dir = tempfile.mkdtemp()
+    try:
+        put_object(cache_dir, "111111", "a")
+        mock_read_dvc_lock.return_value = {
+            "stages": {
+                "train": {
+                    "deps": [
+                        {"path": "features.csv", "md5": "111111"},
+                        {"path": "train.py", "md5": "333333"},
+                    ],
+                    "outs": [{"path": "model.pkl", "md5": "222222"}],
+                }
+            }
+        }
+        dvc_yaml = {
+            "stages": {
+                "train": {
+                    "deps": ["features.csv"],
+                    "deps_py": ["train.py"],
+                    "outs": ["model.pkl"],
+                },
+                "evaluate": {"deps": ["model.pkl"], "deps_py": [], "outs": []},
+            }
+        }
+        files, missing = collect_commit_hashes("/repo", "commit", dvc_yaml, cache_dir)
+        assert files == {
+            "train": {"features.csv": "111111", "model.pkl": "222222"},
+            "evaluate": {},
+        }
+        assert missing == {"train": {"222222"}}
+        mock_read_dvc_lock.assert_called_once_with("/repo", "commit")
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_diff_dvc_locks():
+    dvc_yaml = {
+        "stages": {
+            "prepare": {"deps": ["data.xml"], "outs": ["data/prepared"]},
+            "featurize": {"deps": ["data/prepared"], "outs": ["data/features"]},
+            "train": {"deps": ["data/features"], "outs": ["model.pkl"]},
+        }
+    }
+    old_lock = {
+        "stages": {
+            "prepare": {
+                "deps": [{"path": "data.xml", "md5": "aa"}],
+                "outs": [{"path": "data/prepared", "md5": "bb.dir"}],
+            },
+            "featurize": {
+                "deps": [{"path": "data/prepared", "md5": "bb.dir"}],
+                "outs": [{"path": "data/features", "md5": "cc.dir"}],
+            },
+        }
+    }
+    new_lock = {
+        "stages": {
+            "prepare": old_lock["stages"]["prepare"],
+            "featurize": {
+                "deps": [{"path": "data/prepared", "md5": "bb.dir"}],
+                "outs": [{"path": "data/features", "md5": "dd.dir"}],
+            },
+            "train": {
+                "deps": [{"path": "data/features", "md5": "dd.dir"}],
+                "outs": [{"path": "model.pkl", "md5": "ee"}],
+            },
+        }
+    }
+    diff = diff_dvc_locks(old_lock, new_lock, dvc_yaml)
+    assert diff["prepare"]["status"] == UNCHANGED
+    assert diff["featurize"] == {
+        "status": MODIFIED,
+        "entries": {"data/features": MODIFIED, "data/prepared": UNCHANGED},
+    }
+    assert diff["train"]["status"] == ADDED
+    assert unchanged_lock_entries(diff) == {
+        "prepare": {"data.xml", "data/prepared"},
+        "featurize": {"data/prepared"},
+        "train": set(),
+    }
+
+
+def test_collect_commit_hashes_skips_unchanged():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        lock = {
+            "stages": {
+                "train": {
+                    "deps": [{"path": "data/features", "md5": "ffffff.dir"}],
+                    "outs": [{"path": "model.pkl", "md5": "222222"}],
+                }
+            }
+        }
+        dvc_yaml = {"stages": {"train": {"deps": ["data/features"], "outs": ["model.pkl"]}}}
+        # Ни манифеста, ни модели нет в кэше, но неизменённые записи не догружаются
+        files, missing = collect_commit_hashes(
+            "/repo",
+            "commit",
+            dvc_yaml,
+            cache_dir,
+            unchanged={"train": {"data/features", "model.pkl"}},
+            lock=lock,
+        )
+        assert files == {"train": {"data/features": "ffffff.dir", "model.pkl": "222222"}}
+        assert missing == {}
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_link_cached_files():
+    cache_dir = tempfile.mkdtemp()
+    target_dir = tempfile.mkdtemp()
+    try:
+        put_object(cache_dir, "111111", "a\tb\n")
+        linked = link_cached_files(
+            {"data/train.tsv": "111111", "data/test.tsv": "222222"},
+            cache_dir,
+            target_dir,
+        )
+        assert linked == ["data/train.tsv"]
+        assert os.path.islink(os.path.join(target_dir, "data/train.tsv"))
+        assert not os.path.exists(os.path.join(target_dir, "data/test.tsv"))
+    finally:
+        shutil.rmtree(cache_dir)
+        shutil.rmtree(target_dir)
+
+
+def test_group_artifact_files():
+    files = {
+        "data/features/train.csr/indptr.npy": "a1",
+        "data/features/train.csr/indices.npy": "a2",
+        "data/features/train.csr/data.npy": "a3",
+        "data/features/train.csr/header.json": "a4",
+        "data/prepared/train.tsv": "b1",
+    }
+    grouped = group_artifact_files(files, {"csr"})
+    assert sorted(grouped) == ["data/features/train.csr", "data/prepared/train.tsv"]
+    assert grouped["data/features/train.csr"].endswith(".csr")
+
+    changed = dict(files, **{"data/features/train.csr/data.npy": "a5"})
+    assert (
+        group_artifact_files(changed, {"csr"})["data/features/train.csr"]
+        != grouped["data/features/train.csr"]
+    )
+    # Хэш не зависит от порядка файлов
+    assert group_artifact_files(dict(reversed(list(files.items()))), {"csr"}) == grouped
+    # Без обработчика-папки файлы не группируются
+    assert group_artifact_files(files, set()) == files
+
+
+@mock.patch("cim.artifacts.subprocess.run")
+@mock.patch("cim.artifacts.acquire_worktree")
+def test_fetch_missing_objects_with_deps(mock_worktree, mock_run):
+    mock_worktree.return_value.__enter__.return_value = "/worktree"
+    fetch_missing_objects("repo", "commit", ["featurize", "train"])
+    mock_worktree.assert_called_once_with("repo", "commit")
+    # deps стадий (например, отслеживаемые через .dvc файлы) тоже загружаются
+    mock_run.assert_called_once_with(
+        ["dvc", "fetch", "--with-deps", "featurize", "train"],
+        cwd="/worktree",
+        check=True,
+    )
+
+    mock_run.side_effect = subprocess.CalledProcessError(1, "dvc")
+    fetch_missing_objects("repo", "commit", ["train"])
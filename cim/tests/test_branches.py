@@ -5,40 +5,30 @@ from unittest import mock
 from cim.branches import compare_branches
 
 
-@mock.patch("cim.branches.clone_and_prepare_repo")
+@mock.patch("cim.branches.resolve_refs")
 @mock.patch("cim.branches.analyze_two_commits_with_cache")
-@mock.patch("cim.branches.subprocess.run")
-@mock.patch("shutil.rmtree")
-def test_compare_branches(mock_rmtree, mock_run, mock_analyze, mock_clone):
+def test_compare_branches(mock_analyze, mock_resolve_refs):
     repo_path = tempfile.mkdtemp()
     branch1 = "branch1"
     branch2 = "branch2"
     output_dir = tempfile.mkdtemp()
-    temp_repo = "/tmp/repo"
-    mock_clone.return_value = temp_repo
-    mock_run.side_effect = [
-        mock.Mock(stdout="commit1"),
-        mock.Mock(stdout="commit2"),
-        mock.Mock(stdout="commit1"),
-        mock.Mock(stdout="commit2"),
-    ]
+    mock_resolve_refs.return_value = {branch1: "commit1", branch2: "commit2"}
 
     try:
         compare_branches(repo_path, branch1, branch2, output_dir)
 
-        mock_clone.assert_called_once_with(repo_path)
-        assert mock_run.call_count == 4
-        mock_run.assert_any_call(
-            ["git", "checkout", branch1], cwd=temp_repo, check=True
-        )
-        mock_run.assert_any_call(
-            ["git", "rev-parse", "HEAD"], cwd=temp_repo, capture_output=True, text=True
-        )
-        mock_run.assert_any_call(
-            ["git", "checkout", branch2], cwd=temp_repo, check=True
-        )
-        mock_run.assert_any_call(
-            ["git", "rev-parse", "HEAD"], cwd=temp_repo, capture_output=True, text=True
+        mock_resolve_refs.assert_called_once_with(repo_path, [branch1, branch2])
+        mock_analyze.assert_called_once_with(
+            repo_path,
+            "commit1",
+            "commit2",
+            output_dir,
+            chunksize=None,
+            approx_error=None,
+            jobs=1,
+            model_sample=0,
+            row_key=None,
+            drift=False,
         )
     finally:
         shutil.rmtree(repo_path)
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+
+from cim.cache import (
+    evict_cached_results,
+    load_cached_result,
+    make_cache_key,
+    store_cached_result,
+)
+
+
+def test_make_cache_key():
+    key = make_cache_key("old", "new")
+    assert key == make_cache_key("old", "new")
+    assert key != make_cache_key("new", "old")
+    assert key != make_cache_key(
+        "old", "new", {"rows": 1, "columns": 0, "duplicates": 0, "nulls": 0}
+    )
+    # Одно содержимое под разными расширениями и обработчиками
+    assert make_cache_key("old", "new", kind="delimited-tsv") != make_cache_key(
+        "old", "new", kind="delimited-csv"
+    )
+    assert make_cache_key("old", "new", kind="delimited-tsv") != make_cache_key(
+        "old", "new", kind="parquet-parquet"
+    )
+
+
+def test_store_and_load_cached_result():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        key = make_cache_key("old", "new")
+        assert load_cached_result(cache_dir, key) is None
+        store_cached_result(cache_dir, key, {"risk": 0.5})
+        assert load_cached_result(cache_dir, key) == {"risk": 0.5}
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_evict_cached_results_lru():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        keys = [make_cache_key(str(i), "new") for i in range(3)]
+        for i, key in enumerate(keys):
+            store_cached_result(cache_dir, key, {"risk": i})
+            path = os.path.join(cache_dir, key[:2], key[2:] + ".json")
+            os.utime(path, (1000 + i, 1000 + i))
+        # Первая запись использована последней - вытесняются остальные
+        load_cached_result(cache_dir, keys[0])
+        size = os.path.getsize(os.path.join(cache_dir, keys[0][:2], keys[0][2:] + ".json"))
+
+        assert evict_cached_results(cache_dir, max_bytes=size) == 2
+        assert load_cached_result(cache_dir, keys[0]) == {"risk": 0}
+        assert load_cached_result(cache_dir, keys[1]) is None
+    finally:
+        shutil.rmtree(cache_dir)
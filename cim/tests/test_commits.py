@@ -2,20 +2,21 @@ import os
 import tempfile
 import shutil
 from unittest import mock
-import numpy as np
+import pandas as pd
 from cim.commits import (
     process_file_changes,
     save_commit_files,
     analyze_two_commits_with_cache,
+    compare_commit_files,
 )
 
 
-@mock.patch("cim.commits.load_table_as_numpy")
+@mock.patch("cim.consumer.load_table")
 @mock.patch("cim.commits.calculate_risk")
-def test_process_file_changes(mock_calculate_risk, mock_load_table_as_numpy):
-    mock_load_table_as_numpy.side_effect = [
-        np.array([[1, 2], [3, 4]]),
-        np.array([[1, 2], [3, 5]]),
+def test_process_file_changes(mock_calculate_risk, mock_load_table):
+    mock_load_table.side_effect = [
+        pd.DataFrame([[1, 2], [3, 4]]),
+        pd.DataFrame([[1, 2], [3, 5]]),
     ]
     mock_calculate_risk.return_value = 0.5
 
@@ -36,19 +37,22 @@ def test_process_file_changes(mock_calculate_risk, mock_load_table_as_numpy):
         shutil.rmtree(temp_new_dir)
 
 
-@mock.patch("cim.commits.pull_dvc_cache")
-@mock.patch("cim.commits.shutil.copy2")
-@mock.patch("cim.commits.shutil.copytree")
-@mock.patch("cim.commits.subprocess.run")
-def test_save_commit_files(mock_run, mock_copytree, mock_copy2, mock_pull_dvc_cache):
-    mock_run.return_value = mock.Mock(stdout="")
-    mock_pull_dvc_cache.return_value = None
-    mock_copy2.return_value = None
-    mock_copytree.return_value = None
-
+@mock.patch("cim.commits.fetch_missing_objects")
+@mock.patch("cim.commits.collect_commit_hashes")
+@mock.patch("cim.commits.get_dvc_cache_dir")
+def test_save_commit_files(mock_cache_dir, mock_collect, mock_fetch):
     repo_path = tempfile.mkdtemp()
     temp_dir = tempfile.mkdtemp()
     try:
+        cache_dir = os.path.join(repo_path, ".dvc", "cache")
+        os.makedirs(os.path.join(cache_dir, "files", "md5", "aa"))
+        with open(os.path.join(cache_dir, "files", "md5", "aa", "bb"), "w") as f:
+            f.write("data")
+        mock_cache_dir.return_value = cache_dir
+        mock_collect.side_effect = [
+            ({"stage1": {"file1.csv": "aabb", "dir1/f.csv": "ccdd"}}, {"stage1": {"ccdd"}}),
+            ({"stage1": {"file1.csv": "aabb", "dir1/f.csv": "ccdd"}}, {"stage1": {"ccdd"}}),
+        ]
         dvc_yaml = {
             "stages": {
                 "stage1": {
@@ -57,33 +61,29 @@ def test_save_commit_files(mock_run, mock_copytree, mock_copy2, mock_pull_dvc_ca
                 }
             }
         }
-        os.makedirs(os.path.join(repo_path, "dir1"))
-        with open(os.path.join(repo_path, "file1.csv"), "w") as f:
-            f.write("data")
 
         files = save_commit_files(repo_path, "commit", temp_dir, dvc_yaml)
-        assert "stage1" in files
-        assert "file1.csv" in files["stage1"]
+        mock_fetch.assert_called_once_with(repo_path, "commit", ["stage1"])
+        assert files == {"stage1": {"file1.csv": "aabb"}}
+        with open(os.path.join(temp_dir, "file1.csv")) as f:
+            assert f.read() == "data"
     finally:
         shutil.rmtree(repo_path)
         shutil.rmtree(temp_dir)
 
 
-@mock.patch("cim.commits.clone_and_prepare_repo")
 @mock.patch("cim.commits.save_commit_files")
 @mock.patch("cim.commits.read_dvc_yaml")
 @mock.patch("cim.commits.process_file_changes")
-@mock.patch("cim.commits.get_file_diff_stats")
+@mock.patch("cim.commits.get_diff_numstat")
 @mock.patch("cim.commits.save_metrics_to_file")
 def test_analyze_two_commits_with_cache(
     mock_save_metrics_to_file,
-    mock_get_file_diff_stats,
+    mock_get_diff_numstat,
     mock_process_file_changes,
     mock_read_dvc_yaml,
     mock_save_commit_files,
-    mock_clone_and_prepare_repo,
 ):
-    mock_clone_and_prepare_repo.return_value = tempfile.mkdtemp()
     mock_read_dvc_yaml.return_value = {
         "stages": {
             "stage1": {
@@ -94,17 +94,76 @@ def test_analyze_two_commits_with_cache(
         }
     }
     mock_save_commit_files.side_effect = [
-        {"stage1": ["file1.csv", "file2.csv", "script.py"]},
-        {"stage1": ["file1.csv", "file2.csv", "script.py"]},
+        {"stage1": {"file1.csv": "hash1", "file2.csv": "hash2"}},
+        {"stage1": {"file1.csv": "hash1", "file2.csv": "hash3"}},
     ]
     mock_process_file_changes.return_value = 0.5
-    mock_get_file_diff_stats.return_value = {"added": 10, "deleted": 5, "file": "script.py"}
+    mock_get_diff_numstat.return_value = {
+        "script.py": {"added": 10, "deleted": 5, "file": "script.py"}
+    }
 
     repo_path = tempfile.mkdtemp()
     output_dir = tempfile.mkdtemp()
     try:
         analyze_two_commits_with_cache(repo_path, "commit1", "commit2", output_dir)
         mock_save_metrics_to_file.assert_called_once()
+        # file1.csv не изменился - загружается только file2.csv
+        mock_process_file_changes.assert_called_once()
+        metrics = mock_save_metrics_to_file.call_args[0][1]
+        assert metrics["stage1"]["file1.csv"] == 0.0
+        assert metrics["stage1"]["file2.csv"] == 0.5
+        assert metrics["stage1"]["script.py"]["added"] == 10
+        mock_get_diff_numstat.assert_called_once_with(
+            repo_path, "commit1", "commit2", ["script.py"]
+        )
     finally:
         shutil.rmtree(repo_path)
         shutil.rmtree(output_dir)
+
+
+def test_process_file_changes_cache_depends_on_file_type():
+    temp_dir = tempfile.mkdtemp()
+    try:
+        old_dir, new_dir, cache_dir = (
+            os.path.join(temp_dir, name) for name in ("old", "new", "cache")
+        )
+        os.makedirs(old_dir)
+        os.makedirs(new_dir)
+        # Одинаковые байты: в CSV добавлен столбец, в TSV столбец один
+        for name in ("t.csv", "t.tsv"):
+            with open(os.path.join(old_dir, name), "w") as f:
+                f.write("a,b\n1,2\n3,4\n")
+            with open(os.path.join(new_dir, name), "w") as f:
+                f.write("a,b,c\n1,2,5\n3,4,6\n")
+        args = (old_dir, new_dir, "h1", "h2", cache_dir, cache_dir)
+        expected = process_file_changes("t.tsv", old_dir, new_dir)
+        assert process_file_changes("t.csv", *args) != expected
+        # Результат и профили CSV с теми же хэшами не используются для TSV
+        assert process_file_changes("t.tsv", *args) == expected
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+@mock.patch("cim.commits.get_diff_numstat", return_value={})
+@mock.patch("cim.commits.run_tasks")
+def test_compare_commit_files_single_threaded_predictions_in_pool(
+    mock_run_tasks, mock_get_diff_numstat
+):
+    dvc_yaml = {"stages": {"train": {"deps": [], "outs": [], "deps_py": []}}}
+    old_files = {"train": {"a.pkl": "h1", "b.pkl": "h2"}}
+    new_files = {"train": {"a.pkl": "h3", "b.pkl": "h4"}}
+    mock_run_tasks.side_effect = lambda func, tasks, jobs, executor: [0.0] * len(tasks)
+    repo_path = tempfile.mkdtemp()
+    try:
+        args = (repo_path, "c1", "c2", dvc_yaml, old_files, new_files, "old", "new")
+        # Файлы обрабатываются в пуле из 4 процессов - модели предсказывают в один поток
+        compare_commit_files(*args, jobs=4)
+        tasks = mock_run_tasks.call_args[0][1]
+        assert mock_run_tasks.call_args[0][2] == 4
+        assert [task["jobs"] for task in tasks] == [1, 1]
+        # Один файл обрабатывается без пула - предсказания используют все jobs
+        new_files["train"]["b.pkl"] = "h2"
+        compare_commit_files(*args, jobs=4)
+        assert [task["jobs"] for task in mock_run_tasks.call_args[0][1]] == [4]
+    finally:
+        shutil.rmtree(repo_path)
@@ -1,8 +1,9 @@
 import os
+import tempfile
 import pandas as pd
 import numpy as np
 from unittest import mock
-from cim.consumer import load_table_as_numpy
+from cim.consumer import iter_table_chunks, load_table, load_table_as_numpy
 
 
 @mock.patch("pandas.read_csv")
@@ -54,3 +55,25 @@ def test_load_table_as_numpy_unsupported():
     result = load_table_as_numpy("data.unsupported")
     expected = np.empty((0, 0))
     np.testing.assert_array_equal(result, expected)
+
+
+@mock.patch("pandas.read_csv")
+def test_load_table_keeps_dtypes(mock_read_csv):
+    mock_read_csv.return_value = pd.DataFrame({"id": [1, 2], "text": ["a", "b"]})
+    result = load_table("data.tsv")
+    assert list(result.dtypes.astype(str))[0] == "int64"
+    mock_read_csv.assert_called_once_with("data.tsv", delimiter="\t", **{})
+
+
+def test_load_table_unsupported():
+    assert load_table("data.unsupported") is None
+
+
+def test_iter_table_chunks_tsv():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "data.tsv")
+        with open(path, "w") as f:
+            f.write("id\tlabel\n" + "".join(f"{i}\t{i % 2}\n" for i in range(5)))
+        chunks = list(iter_table_chunks(path, chunksize=2))
+        assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+        assert list(chunks[0].columns) == ["id", "label"]
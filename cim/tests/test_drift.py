@@ -0,0 +1,138 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cim.drift import (
+    ColumnSketch,
+    DriftAccumulator,
+    FrequentItems,
+    QuantileSketch,
+    compare_drift,
+    ks_distance,
+    numeric_psi,
+    process_drift,
+)
+
+
+def make_sketch(values):
+    sketch = QuantileSketch()
+    sketch.add(values)
+    return sketch
+
+
+def test_quantile_sketch_merge_and_accuracy():
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(size=20000) * rng.choice([-1, 1], size=20000)
+    whole = make_sketch(values)
+    parts = QuantileSketch()
+    for part in np.array_split(values, 7):
+        parts.merge(QuantileSketch.from_dict(make_sketch(part).to_dict()))
+    assert parts.to_dict() == whole.to_dict()
+
+    levels = [0.1, 0.5, 0.9]
+    expected = np.quantile(values, levels)
+    assert whole.quantiles(levels) == pytest.approx(expected, rel=0.03)
+    assert ks_distance(whole, parts) == 0
+    assert numeric_psi(whole, parts) == pytest.approx(0)
+
+
+def test_frequent_items_keeps_heavy_hitters():
+    items = FrequentItems(capacity=3)
+    values = pd.Series(["a"] * 50 + ["b"] * 30 + list("cdefghij") * 2)
+    for part in np.array_split(np.arange(len(values)), 4):
+        items.add(values.iloc[part])
+    assert items.total == len(values)
+    assert {"a", "b"} <= set(items.counts)
+    assert len(items.counts) <= 3
+
+
+def test_compare_drift():
+    rng = np.random.default_rng(1)
+    n = 5000
+    old = pd.DataFrame(
+        {
+            "x": rng.normal(0, 1, n),
+            "tag": rng.choice(list("abc"), n),
+            "date": ["2024-01-01"] * (n - 1) + ["2024-03-01"],
+        }
+    )
+    new = old.assign(
+        x=rng.normal(1, 1, n),
+        tag=rng.choice(list("abcd"), n),
+        date=["2024-03-11"] * n,
+    )
+    old_sketch, new_sketch = DriftAccumulator(), DriftAccumulator()
+    for start in range(0, n, 1000):
+        old_sketch.update(old.iloc[start : start + 1000])
+    new_sketch.update(new)
+    # Скетч переживает сохранение в JSON
+    old_sketch = DriftAccumulator.from_dict(json.loads(json.dumps(old_sketch.to_dict())))
+
+    result = compare_drift(old_sketch, new_sketch)
+    columns = result["columns"]
+    assert columns["x"]["kind"] == "numeric"
+    assert columns["x"]["ks"] == pytest.approx(0.38, abs=0.05)
+    assert columns["x"]["psi"] > 0.25
+    assert columns["tag"]["categories"] == {"old": 3, "new": 4, "delta": 1}
+    assert columns["date"]["max_date"]["delta_days"] == 10
+    assert result["psi_max"] == max(columns["x"]["psi"], columns["tag"]["psi"])
+
+    same = compare_drift(old_sketch, old_sketch)
+    assert same["ks_max"] == 0
+    assert same["psi_max"] == pytest.approx(0)
+
+
+def test_process_drift_cached():
+    temp_dir = tempfile.mkdtemp()
+    try:
+        old_dir, new_dir, profile_dir = (
+            os.path.join(temp_dir, name) for name in ("old", "new", "profiles")
+        )
+        for directory, values in ((old_dir, [1, 2, 3, 4]), (new_dir, [3, 4, 5, 6])):
+            os.makedirs(directory)
+            pd.DataFrame({"x": values}).to_csv(
+                os.path.join(directory, "t.csv"), index=False
+            )
+        args = ("t.csv", old_dir, new_dir, "aa11", "bb22", profile_dir)
+        result = process_drift(*args)
+        assert result["columns"]["x"]["ks"] == 0.5
+
+        # Базовая версия берётся из сохранённого скетча
+        os.remove(os.path.join(old_dir, "t.csv"))
+        assert process_drift(*args) == result
+        # Скетч, посчитанный по частям другого размера, не используется
+        assert process_drift(*args, chunksize=3) != result
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_process_drift_headerless_tsv():
+    temp_dir = tempfile.mkdtemp()
+    try:
+        old_dir, new_dir = (os.path.join(temp_dir, name) for name in ("old", "new"))
+        for directory, first_id in ((old_dir, 1), (new_dir, 7)):
+            os.makedirs(directory)
+            with open(os.path.join(directory, "train.tsv"), "w") as f:
+                for pid in range(first_id, first_id + 5):
+                    f.write(f"{pid}\t{pid % 2}\tsome text {pid}\n")
+        result = process_drift("train.tsv", old_dir, new_dir)
+        # Первая строка - данные, а не заголовок: столбцы называются по номерам
+        assert sorted(result["columns"]) == ["0", "1", "2"]
+        assert result["columns"]["0"]["ks"] == 1.0
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_column_sketch_merge_of_different_kinds():
+    numbers, labels = ColumnSketch(), ColumnSketch()
+    numbers.update(pd.Series([1.0, 2.0]))
+    labels.update(pd.Series(["a", "b"]))
+    with pytest.raises(ValueError, match="numeric and a categorical"):
+        numbers.merge(labels)
+    # Скетч без значений принимает вид другого скетча
+    assert ColumnSketch().merge(labels).kind == "categorical"
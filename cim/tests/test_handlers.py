@@ -0,0 +1,172 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+
+import pandas as pd
+import pytest
+
+from cim.handlers import Handler, directory_extensions, get_handler, register_handler
+from cim.profile import profile_table
+
+
+def test_get_handler_by_extension_and_magic():
+    assert get_handler("data/train.tsv").name == "delimited"
+    assert get_handler("model.PKL").name == "model"
+    assert get_handler("data/features/train.csr").name == "csr"
+    assert "csr" in directory_extensions()
+    assert get_handler("script.py") is None
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(temp_dir, "part-0000")
+        with open(path, "wb") as f:
+            f.write(b"PAR1" + b"\0" * 16)
+        assert get_handler(path).name == "parquet"
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_register_handler_has_priority():
+    handler = Handler("custom", ("csv",), profiler="custom:profile")
+    with mock.patch("cim.handlers._registry", []):
+        register_handler(Handler("delimited", ("csv",)))
+        register_handler(handler)
+        assert get_handler("a.csv") is handler
+
+
+def test_import_without_pandas():
+    # Для изменений только в коде pandas и numpy не нужны
+    code = (
+        "import sys, cim.commits, cim.history, cim.branches;"
+        "print(sorted(m for m in ('pandas', 'numpy') if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "[]"
+
+
+def sample_frame():
+    return pd.DataFrame(
+        {
+            "a": [1, 2, 2, None, 5, 6],
+            "b": list("xyzxyq"),
+            "c": [0.5, 0.5, 0.5, 0.5, 0.5, 0.5],
+        }
+    )
+
+
+def assert_same_stats(profile, expected):
+    assert (profile.rows, profile.columns) == (expected.rows, expected.columns)
+    for column, reference in zip(profile.column_profiles, expected.column_profiles):
+        assert column.name == reference.name
+        assert (column.nulls, column.distinct, column.duplicates) == (
+            reference.nulls,
+            reference.distinct,
+            reference.duplicates,
+        )
+        assert (column.min, column.max) == (reference.min, reference.max)
+
+
+def test_profile_parquet_and_feather():
+    pq = pytest.importorskip("pyarrow.parquet")
+    from cim.columnar import profile_feather, profile_parquet
+
+    df = sample_frame()
+    expected = profile_table(df)
+    temp_dir = tempfile.mkdtemp()
+    try:
+        parquet_path = os.path.join(temp_dir, "data.parquet")
+        df.to_parquet(parquet_path, row_group_size=4)
+        assert_same_stats(profile_parquet(parquet_path), expected)
+        assert_same_stats(profile_parquet(parquet_path, chunksize=2), expected)
+
+        feather_path = os.path.join(temp_dir, "data.feather")
+        df.to_feather(feather_path)
+        assert_same_stats(profile_feather(feather_path), expected)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_profile_parquet_scans_only_missing_columns():
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    from cim.columnar import footer_profile, profile_parquet
+
+    df = pd.DataFrame(
+        {
+            "a": [1.0, 2.0, 2.0, None, 5.0, 6.0],
+            "constant": [7] * 6,
+            "empty": [None] * 6,
+        }
+    )
+    temp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(temp_dir, "data.parquet")
+        df.to_parquet(path, row_group_size=4)
+        # pyarrow не записывает distinct_count - столбец a читается,
+        # остальные выводятся из null_count и min/max
+        assert footer_profile(pq.ParquetFile(path)) is None
+        with mock.patch.object(
+            pq.ParquetFile, "read", autospec=True, side_effect=pq.ParquetFile.read
+        ) as mock_read:
+            profile = profile_parquet(path)
+        assert mock_read.call_args.kwargs["columns"] == ["a"]
+        assert_same_stats(profile, profile_table(df))
+        assert_same_stats(profile_parquet(path, chunksize=2), profile_table(df))
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def footer_statistics(nulls, distinct, low, high):
+    return mock.Mock(
+        has_null_count=True,
+        has_distinct_count=distinct is not None,
+        has_min_max=True,
+        null_count=nulls,
+        distinct_count=distinct,
+        min=low,
+        max=high,
+    )
+
+
+def test_footer_profile_distinct_counts():
+    pa = pytest.importorskip("pyarrow")
+    from cim.columnar import footer_profile
+
+    schema = pa.schema([("id", pa.int64()), ("tag", pa.string())])
+    # Две группы по 4 строки: id отсортирован (диапазоны не пересекаются),
+    # tag - с пересекающимися диапазонами
+    statistics = {
+        (0, 0): footer_statistics(1, 3, 1, 3),
+        (1, 0): footer_statistics(0, 4, 10, 13),
+        (0, 1): footer_statistics(0, 2, "a", "b"),
+        (1, 1): footer_statistics(0, 2, "a", "c"),
+    }
+    parquet_file = mock.Mock(schema_arrow=schema)
+    metadata = parquet_file.metadata
+    metadata.num_columns = 2
+    metadata.num_row_groups = 2
+    metadata.num_rows = 8
+    metadata.schema.column.side_effect = lambda i: mock.Mock(path=schema[i].name)
+
+    def row_group(group):
+        return mock.Mock(
+            num_rows=4,
+            column=lambda i: mock.Mock(statistics=statistics[group, i]),
+        )
+
+    metadata.row_group.side_effect = row_group
+    assert footer_profile(parquet_file) is None
+
+    statistics[1, 1] = footer_statistics(0, 1, "c", "c")
+    profile = footer_profile(parquet_file)
+    assert (profile.rows, profile.columns, profile.nulls) == (8, 2, 1)
+    # id: 3 + 4 значения и пустое; tag: 2 + 1
+    assert [c.distinct for c in profile.column_profiles] == [8, 3]
+    assert profile.duplicates == 5
+    assert (profile.column_profiles[0].min, profile.column_profiles[0].max) == (1.0, 13.0)
+    assert profile.column_profiles[1].min is None
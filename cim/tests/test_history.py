@@ -0,0 +1,115 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from unittest import mock
+
+import pytest
+
+from cim.history import (
+    analyze_commit_history,
+    list_last_commits,
+    list_range_commits,
+    stage_risk,
+)
+
+
+def make_repo(n):
+    repo_path = tempfile.mkdtemp()
+    subprocess.run(["git", "init", "-q"], cwd=repo_path, check=True)
+    for i in range(n):
+        with open(os.path.join(repo_path, "file.txt"), "w") as f:
+            f.write(str(i))
+        subprocess.run(["git", "add", "file.txt"], cwd=repo_path, check=True)
+        subprocess.run(
+            ["git", "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", str(i)],
+            cwd=repo_path,
+            check=True,
+        )
+    log = subprocess.run(
+        ["git", "log", "--reverse", "--format=%H"],
+        cwd=repo_path,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return repo_path, log.stdout.split()
+
+
+def test_list_commits_oldest_first():
+    repo_path, commits = make_repo(4)
+    try:
+        assert list_range_commits(repo_path, "HEAD~2..HEAD") == commits[1:]
+        assert list_last_commits(repo_path, 2) == commits[1:]
+        assert list_last_commits(repo_path, 10) == commits
+    finally:
+        shutil.rmtree(repo_path)
+
+
+def test_list_last_commits_follows_first_parent():
+    repo_path, commits = make_repo(2)
+    def git(*args):
+        result = subprocess.run(
+            ["git", "-c", "user.name=t", "-c", "user.email=t@t", *args],
+            cwd=repo_path,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return result.stdout.strip()
+
+    try:
+        git("checkout", "-qb", "side", commits[0])
+        with open(os.path.join(repo_path, "side.txt"), "w") as f:
+            f.write("side")
+        git("add", "side.txt")
+        git("commit", "-qm", "side")
+        git("checkout", "-q", "-")
+        git("merge", "-q", "--no-ff", "-m", "merge", "side")
+        merge = git("rev-parse", "HEAD")
+
+        # Коммит side новее commits[1], но лежит не на первой родительской линии
+        assert list_last_commits(repo_path, 1) == [commits[1], merge]
+        assert list_last_commits(repo_path, 2) == commits + [merge]
+        assert list_last_commits(repo_path, 2) == list_range_commits(
+            repo_path, f"{commits[0]}..HEAD"
+        )
+    finally:
+        shutil.rmtree(repo_path)
+
+
+def test_stage_risk():
+    metrics = {"a.csv": 0.2, "b.csv": {"risk": 0.4}, "s.py": {"added": 1}}
+    assert stage_risk(metrics) == pytest.approx(0.3)
+    assert stage_risk({"s.py": {"added": 1, "deleted": 0}}) is None
+
+
+@mock.patch("cim.history.compare_commit_files")
+@mock.patch("cim.history.save_commit_files")
+@mock.patch("cim.history.read_dvc_yaml")
+def test_analyze_commit_history(mock_read_dvc_yaml, mock_save, mock_compare):
+    output_dir = tempfile.mkdtemp()
+    try:
+        mock_read_dvc_yaml.return_value = {"stages": {"s": {"deps_py": []}}}
+        mock_save.side_effect = lambda repo, commit, temp_dir, dvc_yaml: {
+            "s": {"data.csv": commit}
+        }
+        mock_compare.side_effect = lambda repo, old, new, *args, **kwargs: {
+            "s": {"data.csv": 0.5 if new == "c2" else 0.1}
+        }
+
+        summary = analyze_commit_history("repo", ["c0", "c1", "c2"], output_dir)
+
+        # Каждый коммит сохраняется один раз, пары - соседние коммиты
+        assert [c.args[1] for c in mock_save.call_args_list] == ["c0", "c1", "c2"]
+        assert [(c.args[1], c.args[2]) for c in mock_compare.call_args_list] == [
+            ("c0", "c1"),
+            ("c1", "c2"),
+        ]
+        assert [pair["risk"] for pair in summary["pairs"]] == [0.1, 0.5]
+        assert sorted(os.listdir(output_dir)) == ["c1.json", "c2.json", "summary.json"]
+        with open(os.path.join(output_dir, "summary.json")) as f:
+            assert json.load(f) == summary
+    finally:
+        shutil.rmtree(output_dir)
@@ -0,0 +1,83 @@
+import os
+import pickle
+import shutil
+import tempfile
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from cim.models import (
+    calculate_model_risk,
+    importance_drift,
+    process_model_changes,
+    summarize_model,
+)
+from cim.tests.test_sparse import write_csr
+
+ensemble = pytest.importorskip("sklearn.ensemble")
+
+
+def train_forest(n_estimators, seed):
+    rng = np.random.default_rng(seed)
+    x = rng.random((200, 4))
+    y = (x[:, 0] + rng.random(200) * 0.2 > 0.6).astype(int)
+    return ensemble.RandomForestClassifier(
+        n_estimators=n_estimators, max_depth=4, random_state=seed
+    ).fit(x, y)
+
+
+def test_summarize_model_and_risk():
+    old = summarize_model(train_forest(10, 0))
+    new = summarize_model(train_forest(20, 1))
+    assert old["estimators"] == 10
+    assert old["depth"]["max"] <= 4
+    assert len(old["importances"]) == 4
+
+    assert calculate_model_risk(old, old) == 0
+    assert importance_drift(old, new) > 0
+    assert calculate_model_risk(old, new) >= 0.2
+
+
+def test_process_model_changes_cached():
+    old_dir, new_dir, cache_dir, profile_dir = (tempfile.mkdtemp() for _ in range(4))
+    try:
+        for directory, model in ((old_dir, train_forest(5, 0)), (new_dir, train_forest(8, 1))):
+            with open(os.path.join(directory, "model.pkl"), "wb") as f:
+                pickle.dump(model, f)
+        # Выборка признаков: id, метка и 4 признака модели
+        rng = np.random.default_rng(2)
+        dense = np.hstack([np.arange(50)[:, None], np.zeros((50, 1)), rng.random((50, 4))])
+        indptr = np.arange(0, dense.size + 1, dense.shape[1])
+        indices = np.tile(np.arange(dense.shape[1]), 50)
+        sample_path = os.path.join(new_dir, "test.csr")
+        write_csr(sample_path, indptr, indices, dense.ravel(), dense.shape)
+        sample = {"path": sample_path, "hash": "abc.csr", "rows": 30}
+
+        args = ("model.pkl", old_dir, new_dir, "aa11", "bb22", cache_dir, profile_dir)
+        result = process_model_changes(*args, sample=sample)
+        assert result["estimators"] == {"old": 5, "new": 8}
+        assert result["predictions"]["rows"] == 30
+        assert 0 <= result["predictions"]["label_changes"] <= 1
+
+        # Повторное сравнение берётся из кэша без загрузки моделей
+        with mock.patch("cim.models.load_model") as mock_load_model:
+            assert process_model_changes(*args, sample=sample) == result
+            structural = process_model_changes(*args)
+            mock_load_model.assert_not_called()
+        assert structural["risk"] == result["risk"]
+        assert "predictions" not in structural
+    finally:
+        for directory in (old_dir, new_dir, cache_dir, profile_dir):
+            shutil.rmtree(directory)
+
+
+def test_process_model_changes_not_a_model():
+    old_dir, new_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    try:
+        with open(os.path.join(new_dir, "train.pkl"), "wb") as f:
+            pickle.dump(([1, 2], ["a"]), f)
+        assert process_model_changes("train.pkl", old_dir, new_dir) is None
+    finally:
+        shutil.rmtree(old_dir)
+        shutil.rmtree(new_dir)
@@ -0,0 +1,109 @@
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from cim.profile import (
+    ProfileAccumulator,
+    TableProfile,
+    load_profile,
+    profile_mode,
+    profile_chunks,
+    profile_table,
+    save_profile,
+)
+
+
+def test_profile_table():
+    data = np.array([[1.0, 2.0], [1.0, np.nan], [3.0, 4.0]])
+    profile = profile_table(data)
+    assert (profile.rows, profile.columns) == (3, 2)
+    assert profile.duplicates == 1
+    assert profile.nulls == 1
+    assert profile.column_profiles[1].min == 2.0
+    assert profile.column_profiles[1].max == 4.0
+    assert profile.column_profiles[0].distinct == 2
+    assert profile.column_profiles[1].distinct == 3
+
+
+def test_save_and_load_profile():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        profile = profile_table(np.array([[1, 2], [3, 4]]))
+        assert load_profile(cache_dir, "abcdef") is None
+        save_profile(cache_dir, "abcdef", profile)
+        loaded = load_profile(cache_dir, "abcdef")
+        assert isinstance(loaded, TableProfile)
+        assert loaded == profile
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_profile_cache_keys():
+    assert profile_mode() == "exact"
+    assert profile_mode(chunksize=1000) != profile_mode()
+    assert profile_mode(12, chunksize=1000) == profile_mode(12)
+    cache_dir = tempfile.mkdtemp()
+    try:
+        profile = profile_table(np.array([[1, 2], [3, 4]]))
+        save_profile(cache_dir, "abcdef", profile, kind="delimited-tsv")
+        assert load_profile(cache_dir, "abcdef", kind="delimited-tsv") == profile
+        assert load_profile(cache_dir, "abcdef", kind="delimited-csv") is None
+        assert load_profile(cache_dir, "abcdef", profile_mode(chunksize=1000)) is None
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_profile_table_mixed_dtypes():
+    df = pd.DataFrame(
+        {
+            "id": [1, 2, 2, 4],
+            "text": ["a", None, "a", "b"],
+            "tag": pd.Categorical(["x", "y", "x", None]),
+        }
+    )
+    profile = profile_table(df)
+    id_col, text_col, tag_col = profile.column_profiles
+    assert (id_col.duplicates, id_col.nulls, id_col.min, id_col.max) == (1, 0, 1.0, 4.0)
+    assert (text_col.duplicates, text_col.nulls, text_col.min) == (1, 1, None)
+    assert (tag_col.duplicates, tag_col.nulls) == (1, 1)
+    assert profile.duplicates == 3
+    assert profile.nulls == 2
+
+
+def test_profile_table_object_array():
+    data = np.array([[1, "a"], [1, None]], dtype=object)
+    profile = profile_table(data)
+    assert profile.duplicates == 1
+    assert profile.nulls == 1
+
+
+def test_profile_chunks_matches_profile_table():
+    df = pd.DataFrame(
+        {"a": [1, 2, 2, None, 5] * 3, "b": ["x", "y", None, "x", "z"] * 3}
+    )
+    chunks = [df.iloc[i : i + 4] for i in range(0, len(df), 4)]
+    assert profile_chunks(chunks) == profile_table(df)
+    assert profile_chunks([]) == TableProfile(rows=0, columns=0)
+
+
+def test_profile_chunks_approximate():
+    df = pd.DataFrame({"a": np.arange(20000) % 5000, "b": ["x"] * 20000})
+    chunks = [df.iloc[i : i + 7000] for i in range(0, len(df), 7000)]
+    profile = profile_chunks(chunks, precision=12)
+    a_col, b_col = profile.column_profiles
+    assert profile.approximate
+    assert abs(a_col.distinct - 5000) <= 3 * a_col.distinct_error * 5000
+    assert b_col.distinct == 1
+    assert a_col.sketch is not None
+    assert TableProfile.from_dict(profile.to_dict()) == profile
+
+
+def test_profile_accumulator_merge():
+    df = pd.DataFrame({"a": [1, 2, 2, None, 5, 6], "b": list("xyzxyq")})
+    left = ProfileAccumulator()
+    right = ProfileAccumulator()
+    left.update(df.iloc[:3])
+    right.update(df.iloc[3:])
+    assert left.merge(right).result() == profile_table(df)
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+import pytest
+
+from cim.rowdiff import diff_tables, process_row_diff
+
+
+@pytest.fixture
+def tables():
+    temp_dir = tempfile.mkdtemp()
+    old = pd.DataFrame(
+        {
+            "id": [1, 2, 3, 4, 5, 5],
+            "text": ["a", "b", "c", "d", "e", "f"],
+            "label": [0, 1, 0, 1, 0, 1],
+        }
+    )
+    # id 1 удалён, 6 добавлен, у 2 изменён text, у 3 - text и label;
+    # повторный id 5 сопоставляется по порядку
+    new = pd.DataFrame(
+        {
+            "id": [2, 3, 4, 5, 5, 6],
+            "text": ["B", "C", "d", "e", "f", "g"],
+            "label": [1, 1, 1, 0, 1, 0],
+        }
+    )
+    old_path = os.path.join(temp_dir, "old", "train.tsv")
+    new_path = os.path.join(temp_dir, "new", "train.tsv")
+    for path, frame in ((old_path, old), (new_path, new)):
+        os.makedirs(os.path.dirname(path))
+        frame.to_csv(path, sep="\t", index=False)
+    yield temp_dir, old_path, new_path
+    shutil.rmtree(temp_dir)
+
+
+@pytest.mark.parametrize("buckets", [None, 3])
+def test_diff_tables_keyed(tables, buckets):
+    temp_dir, old_path, new_path = tables
+    result = diff_tables(
+        old_path, new_path, key="id", chunksize=2, buckets=buckets, temp_dir=temp_dir
+    )
+    assert result == {
+        "key": "id",
+        "mode": "key",
+        "old_rows": 6,
+        "new_rows": 6,
+        "inserted": 1,
+        "deleted": 1,
+        "updated": 2,
+        "unchanged": 3,
+        "columns": {"text": 2, "label": 1},
+        "added_columns": [],
+        "removed_columns": [],
+    }
+    # Корзины на диске удаляются
+    assert sorted(os.listdir(temp_dir)) == ["new", "old"]
+
+
+def test_diff_tables_hashed(tables):
+    _, old_path, new_path = tables
+    for key in (None, "missing"):
+        result = diff_tables(old_path, new_path, key=key, buckets=2)
+        # Запрошенный ключ сохраняется, даже если его нет в таблице
+        assert (result["key"], result["mode"]) == (key, "rows")
+        # Изменённая строка - это удалённая старая и добавленная новая
+        assert (result["inserted"], result["deleted"], result["unchanged"]) == (3, 3, 3)
+        assert "columns" not in result
+
+    assert diff_tables(None, new_path, key="id")["inserted"] == 6
+    assert diff_tables(old_path, None)["deleted"] == 6
+
+
+def test_diff_tables_headerless(tables, capsys):
+    temp_dir, old_path, new_path = tables
+    # Как data/prepared/*.tsv: без строки заголовка
+    headerless = []
+    for path in (old_path, new_path):
+        target = path.replace("train.tsv", "headerless.tsv")
+        frame = pd.read_csv(path, sep="\t")
+        frame.to_csv(target, sep="\t", index=False, header=False)
+        headerless.append(target)
+
+    for key in ("id", "0"):
+        result = diff_tables(*headerless, key=key, chunksize=2)
+        assert result["key"] == key
+        assert result["mode"] == "key"
+        assert (result["inserted"], result["deleted"], result["updated"]) == (1, 1, 2)
+        assert result["columns"] == {"1": 2, "2": 1}
+
+    result = diff_tables(*headerless, key="label")
+    assert (result["key"], result["mode"]) == ("label", "rows")
+    assert "Warning: key column 'label' not found" in capsys.readouterr().out
+
+
+def test_process_row_diff_cached(tables):
+    temp_dir, _, _ = tables
+    cache_dir = os.path.join(temp_dir, "cache")
+    args = (
+        "train.tsv",
+        os.path.join(temp_dir, "old"),
+        os.path.join(temp_dir, "new"),
+        "aa11",
+        "bb22",
+        cache_dir,
+    )
+    result = process_row_diff(*args, key="id")
+    assert result["updated"] == 2
+    os.remove(os.path.join(temp_dir, "new", "train.tsv"))
+    assert process_row_diff(*args, key="id") == result
+    assert process_row_diff(*args)["deleted"] == 6
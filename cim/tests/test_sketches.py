@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from cim.sketches import HyperLogLog, precision_for_error
+
+
+def hashes(values):
+    return pd.util.hash_array(np.asarray(values))
+
+
+def test_precision_for_error():
+    assert precision_for_error(0.01) == 14
+    assert HyperLogLog(precision_for_error(0.01)).relative_error <= 0.01
+
+
+def test_hyperloglog_count():
+    sketch = HyperLogLog(14)
+    assert sketch.count() == 0
+    sketch.add_hashes(hashes(np.arange(100000)))
+    sketch.add_hashes(hashes(np.arange(50000)))
+    assert abs(sketch.count() - 100000) <= 3 * sketch.relative_error * 100000
+
+
+def test_hyperloglog_merge_and_serialize():
+    left = HyperLogLog(12)
+    right = HyperLogLog(12)
+    left.add_hashes(hashes(np.arange(0, 50000)))
+    right.add_hashes(hashes(np.arange(25000, 75000)))
+
+    restored = HyperLogLog.from_dict(left.merge(right).to_dict())
+    assert restored.count() == left.count()
+    assert abs(restored.count() - 75000) <= 3 * restored.relative_error * 75000
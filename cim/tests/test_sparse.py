@@ -0,0 +1,180 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse as sparse
+
+import matrix_io
+from featurization import save_matrix
+from cim import sparse as cim_sparse
+from cim.analysis import calculate_risk
+from cim.sparse import (
+    hash_csr_rows,
+    load_csr_arrays,
+    profile_csr,
+    sparse_metric,
+)
+
+
+def write_csr(path, indptr, indices, data, shape, columns=None):
+    os.makedirs(path)
+    for name, values in (("indptr", indptr), ("indices", indices), ("data", data)):
+        np.save(os.path.join(path, f"{name}.npy"), np.asarray(values))
+    header = {"format": "csr", "version": 1, "shape": list(shape)}
+    if columns is not None:
+        header["columns"] = columns
+    with open(os.path.join(path, "header.json"), "w") as f:
+        json.dump(header, f)
+
+
+def test_format_matches_writer():
+    # cim читает матрицы чужих репозиториев и не импортирует src/matrix_io.py,
+    # поэтому описание формата продублировано
+    assert cim_sparse.CSR_ARRAYS == matrix_io.CSR_ARRAYS
+    assert cim_sparse.HEADER_FILE == matrix_io.HEADER_FILE
+    assert cim_sparse.FORMAT_VERSION == matrix_io.FORMAT_VERSION
+
+
+def test_load_csr_arrays_is_memory_mapped():
+    temp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(temp_dir, "train.csr")
+        write_csr(path, [0, 2, 3], [0, 2, 1], [1.0, 2.0, 3.0], (2, 3))
+
+        matrix = load_csr_arrays(path)
+        assert isinstance(matrix.data, np.memmap)
+        assert matrix.nnz == 3
+        assert matrix.columns == ["0", "1", "2"]
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_profile_csr():
+    temp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(temp_dir, "train.csr")
+        # [[1, 0, 2], [0, nan, 0], [4, 0, 0]]
+        write_csr(
+            path,
+            [0, 2, 3, 4],
+            [0, 2, 1, 0],
+            [1.0, 2.0, np.nan, 4.0],
+            (3, 3),
+            ["id", "label", "python"],
+        )
+        profile = profile_csr(path)
+        assert (profile.rows, profile.columns) == (3, 3)
+        assert [c.name for c in profile.column_profiles] == ["id", "label", "python"]
+        assert [c.nonzero for c in profile.column_profiles] == [2, 1, 1]
+        assert [c.nulls for c in profile.column_profiles] == [0, 1, 0]
+        assert profile.nonzero == 4
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_hash_csr_rows_blocks():
+    temp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(temp_dir, "m.csr")
+        # Строки: [1, 0, 2], [], [1, 0, 2], [0, 1, 0], [], [2, 0, 1]
+        write_csr(
+            path,
+            [0, 2, 2, 4, 5, 5, 7],
+            [0, 2, 0, 2, 1, 0, 2],
+            [1.0, 2.0, 1.0, 2.0, 1.0, 2.0, 1.0],
+            (6, 3),
+        )
+        matrix = load_csr_arrays(path)
+        hashes, lengths = hash_csr_rows(matrix)
+        assert hashes[0] == hashes[2]
+        assert hashes[1] == hashes[4]
+        assert len(set(hashes.tolist())) == 4
+        assert lengths.tolist() == [2, 0, 2, 1, 0, 2]
+        # Результат не зависит от размера блока
+        assert (hash_csr_rows(matrix, block=1)[0] == hashes).all()
+
+        profile = profile_csr(path)
+        assert profile.zero_rows == 2
+        assert profile.duplicates == 2
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_profile_csr_skips_id_and_label():
+    temp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(temp_dir, "train.csr")
+        df = pd.DataFrame({"id": [1, 2, 3, 4], "label": [0, 1, 1, 0], "text": [""] * 4})
+        # Строки 0 и 2 совпадают по признакам, строка 3 - без признаков
+        features = sparse.csr_matrix(
+            [[0.5, 0.0, 1.0], [0.0, 0.3, 0.0], [0.5, 0.0, 1.0], [0.0, 0.0, 0.0]]
+        )
+        save_matrix(df, features, ["r", "python", "data"], path)
+
+        profile = profile_csr(path)
+        assert [c.name for c in profile.column_profiles] == ["r", "python", "data"]
+        assert profile.columns == 3
+        assert profile.nonzero == 5
+        assert profile.duplicates == 1
+        assert profile.zero_rows == 1
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_sparse_risk_and_metric():
+    temp_dir = tempfile.mkdtemp()
+    try:
+        old_path = os.path.join(temp_dir, "old.csr")
+        new_path = os.path.join(temp_dir, "new.csr")
+        write_csr(old_path, [0, 1, 2], [0, 1], [1.0, 1.0], (2, 2), ["a", "b"])
+        # Добавлены строки-дубликаты и нулевая строка, признак b пропал
+        write_csr(
+            new_path, [0, 1, 2, 3, 3], [0, 0, 0], [1.0, 1.0, 1.0], (4, 2), ["a", "b"]
+        )
+        old, new = profile_csr(old_path), profile_csr(new_path)
+
+        risk = calculate_risk(old, new)
+        # rows: 0.2 * 2/2, duplicates: 0.4 * 2/2
+        assert risk == pytest.approx(0.6)
+
+        metric = sparse_metric(risk, old, new)
+        assert metric["nnz"] == {"old": 2, "new": 3}
+        assert metric["duplicate_rows"] == {"old": 0, "new": 2}
+        assert metric["zero_rows"] == {"old": 0, "new": 1}
+        assert metric["nnz_drift"]["feature"] == "b"
+        assert metric["nnz_drift"]["max"] == pytest.approx(0.5)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_sparse_metric_does_not_depend_on_hash_seed():
+    # Доли ненулевых значений, сумма которых зависит от порядка слагаемых
+    code = """
+import numpy as np
+from cim.profile import ColumnProfile, TableProfile
+from cim.sparse import sparse_metric
+
+rng = np.random.default_rng(0)
+def profile(rows):
+    nonzero = rng.integers(0, rows, 500)
+    columns = [
+        ColumnProfile(name=f"f{i}", dtype="float64", nonzero=int(n))
+        for i, n in enumerate(nonzero)
+    ]
+    return TableProfile(rows=rows, columns=500, column_profiles=columns)
+print(repr(sparse_metric(0.0, profile(7), profile(13))["nnz_drift"]))
+"""
+    outputs = set()
+    for seed in ("1", "2", "3"):
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True
+        )
+        outputs.add(result.stdout)
+    assert len(outputs) == 1
@@ -1,28 +1,80 @@
 import os
+import shutil
+import tempfile
 from unittest import mock
 
-from cim.state import collect_file_states, analyze_changes_between_states
+from cim.state import (
+    STATE_INDEX,
+    analyze_changes_between_states,
+    collect_file_states,
+    scan_file,
+)
 
 
-@mock.patch("cim.state.os.walk")
-@mock.patch("cim.state.count_lines_in_file")
-def test_collect_file_states(mock_count_lines, mock_walk):
-    repo_path = "/path/to/repo"
-    mock_walk.return_value = [
-        ("/path/to/repo/data", ("subdir",), ("file1.txt", "file2.txt")),
-        ("/path/to/repo/data/subdir", (), ("file3.txt",)),
-    ]
-    mock_count_lines.side_effect = [10, 20, 30]
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def test_scan_file():
+    temp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(temp_dir, "file")
+        write_file(path, b"line1\nline2\nline3")
+        assert scan_file(path)["lines"] == 3
+        write_file(path, b"line1\nline2\n")
+        assert scan_file(path)["lines"] == 2
+        write_file(path, b"")
+        assert scan_file(path)["lines"] == 0
+        # Двоичный файл не вызывает ошибок декодирования
+        write_file(path, bytes(range(256)) * 3)
+        expected = scan_file(path)
+        assert expected["lines"] == 4
+        # Результат не зависит от размера блока
+        with mock.patch("cim.state.READ_BLOCK", 7):
+            assert scan_file(path) == expected
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_collect_file_states():
+    repo_path = tempfile.mkdtemp()
+    try:
+        write_file(os.path.join(repo_path, "data", "file1.txt"), b"a\nb\n")
+        write_file(os.path.join(repo_path, "data", "subdir", "file2.bin"), b"\x00\xff\n\x01")
+        write_file(os.path.join(repo_path, "src", "code.py"), b"x = 1\n")
+
+        states = collect_file_states(repo_path, jobs=2)
+        assert sorted(os.path.relpath(path, repo_path) for path in states) == [
+            os.path.join("data", "file1.txt"),
+            os.path.join("data", "subdir", "file2.bin"),
+        ]
+        state = states[os.path.join(repo_path, "data", "file1.txt")]
+        assert (state["lines"], state["size"]) == (2, 4)
+        assert os.path.exists(os.path.join(repo_path, STATE_INDEX))
+    finally:
+        shutil.rmtree(repo_path)
 
-    result = collect_file_states(repo_path)
-    expected = {
-        "/path/to/repo/data/file1.txt": 10,
-        "/path/to/repo/data/file2.txt": 20,
-        "/path/to/repo/data/subdir/file3.txt": 30,
-    }
-    assert result == expected
-    mock_walk.assert_called_once_with(os.path.join(repo_path, "data"))
-    assert mock_count_lines.call_count == 3
+
+def test_collect_file_states_reuses_index():
+    repo_path = tempfile.mkdtemp()
+    try:
+        path = os.path.join(repo_path, "data", "file1.txt")
+        write_file(path, b"a\nb\n")
+        # mtime в прошлом, чтобы запись попала в индекс
+        os.utime(path, ns=(10**18, 10**18))
+        first = collect_file_states(repo_path)
+        with mock.patch("cim.state.scan_file") as mock_scan:
+            assert collect_file_states(repo_path) == first
+            mock_scan.assert_not_called()
+
+        # Другой размер - файл читается заново
+        write_file(path, b"a\nc\nd\n")
+        os.utime(path, ns=(10**18, 10**18))
+        assert collect_file_states(repo_path)[path]["lines"] == 3
+    finally:
+        shutil.rmtree(repo_path)
 
 
 def test_analyze_changes_between_states():
@@ -40,5 +92,22 @@ def test_analyze_changes_between_states():
         "added_lines": 30,
         "deleted_lines": 10,
         "modified_lines": 5,
+        "modified_files": 1,
+        "unchanged_files": 0,
     }
     assert result == expected
+
+
+def test_analyze_changes_between_states_uses_hashes():
+    old_state = {
+        "a.csv": {"lines": 10, "hash": "aa"},
+        "b.csv": {"lines": 10, "hash": "bb"},
+    }
+    new_state = {
+        "a.csv": {"lines": 10, "hash": "a2"},
+        "b.csv": {"lines": 10, "hash": "bb"},
+    }
+
+    result = analyze_changes_between_states(old_state, new_state)
+    assert result["modified_lines"] == 0
+    assert (result["modified_files"], result["unchanged_files"]) == (1, 1)
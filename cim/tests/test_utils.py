@@ -1,37 +1,17 @@
 import os
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 from unittest import mock
 
 from cim.utils import (
-    clone_and_prepare_repo,
-    pull_dvc_cache,
     save_metrics_to_file,
-    get_git_commits,
-    count_lines_in_file,
+    resolve_refs,
+    run_tasks,
     read_dvc_yaml,
-    get_file_diff_stats,
+    get_diff_numstat,
 )
 
 
-@mock.patch("cim.utils.subprocess.run")
-@mock.patch("cim.utils.tempfile.mkdtemp", return_value="/tmp/repo")
-def test_clone_and_prepare_repo(mock_mkdtemp, mock_run):
-    repo_path = "https://github.com/user/repo.git"
-    branch = "main"
-    result = clone_and_prepare_repo(repo_path, branch)
-    assert result == "/tmp/repo"
-    mock_run.assert_any_call(["git", "clone", repo_path, "/tmp/repo"], check=True)
-    mock_run.assert_any_call(["git", "checkout", branch], cwd="/tmp/repo", check=True)
-
-
-@mock.patch("cim.utils.subprocess.run")
-def test_pull_dvc_cache(mock_run):
-    repo_dir = "/path/to/repo"
-    pull_dvc_cache(repo_dir)
-    mock_run.assert_called_once_with(["dvc", "pull"], cwd=repo_dir, check=True)
-
-
 @mock.patch("cim.utils.os.makedirs")
 @mock.patch("cim.utils.open", new_callable=mock.mock_open)
 def test_save_metrics_to_file(mock_open, mock_makedirs):
@@ -55,32 +35,19 @@ def test_save_metrics_to_file(mock_open, mock_makedirs):
 
 
 @mock.patch("cim.utils.subprocess.run")
-def test_get_git_commits(mock_run):
+def test_resolve_refs(mock_run):
     repo_path = "/path/to/repo"
-    n = 5
-    mock_run.return_value = mock.Mock(
-        returncode=0, stdout="commit1\ncommit2\ncommit3\ncommit4\ncommit5\n"
-    )
-    result = get_git_commits(repo_path, n)
-    assert result == ["commit1", "commit2", "commit3", "commit4", "commit5"]
+    mock_run.return_value = mock.Mock(returncode=0, stdout="sha1\nsha2\n")
+    result = resolve_refs(repo_path, ["main", "v1.0", "main"])
+    assert result == {"main": "sha1", "v1.0": "sha2"}
     mock_run.assert_called_once_with(
-        ["git", "log", "--format=%H", f"-n{n}"],
+        ["git", "rev-parse", "main^{commit}", "v1.0^{commit}"],
         cwd=repo_path,
         capture_output=True,
         text=True,
     )
 
 
-@mock.patch(
-    "cim.utils.open", new_callable=mock.mock_open, read_data="line1\nline2\nline3\n"
-)
-def test_count_lines_in_file(mock_open):
-    file_path = "/path/to/file"
-    result = count_lines_in_file(file_path)
-    assert result == 3
-    mock_open.assert_called_once_with(file_path, "r")
-
-
 @mock.patch(
     "cim.utils.open",
     new_callable=mock.mock_open,
@@ -94,19 +61,42 @@ def test_read_dvc_yaml(mock_open):
     mock_open.assert_called_once_with(os.path.join(repo_dir, "dvc.yaml"), "r")
 
 
+@mock.patch(
+    "cim.utils.open",
+    new_callable=mock.mock_open,
+    read_data=(
+        "stages:\n  stage1:\n    deps:\n      - data.csv\n"
+        "    outs:\n      - data/prepared:\n          persist: true\n      - model.pkl\n"
+    ),
+)
+def test_read_dvc_yaml_entries_with_options(mock_open):
+    result = read_dvc_yaml("/path/to/repo")
+    assert result["stages"]["stage1"]["outs"] == ["data/prepared", "model.pkl"]
+
+
+def test_run_tasks_keeps_order():
+    tasks = [{"a": i, "b": 10} for i in range(20)]
+    expected = [i + 10 for i in range(20)]
+    add = lambda a, b: a + b
+    assert run_tasks(add, tasks) == expected
+    assert run_tasks(add, tasks, jobs=4, executor_class=ThreadPoolExecutor) == expected
+
+
 @mock.patch("cim.utils.subprocess.run")
-def test_get_file_diff_stats(mock_run):
-    file_path = "file.txt"
-    commit1 = "abc123"
-    commit2 = "def456"
-    mock_run.return_value = mock.Mock(returncode=0, stdout="10\t5\tfile.txt")
-    result = get_file_diff_stats(file_path, commit1, commit2)
-    expected = {"added": 10, "deleted": 5, "file": file_path}
-    assert result == expected
+def test_get_diff_numstat(mock_run):
+    mock_run.return_value = mock.Mock(
+        returncode=0,
+        stdout="10\t5\tsrc/a.py\x00-\t-\tmodel.bin\x003\t1\t\x00src/old.py\x00src/new.py\x00",
+    )
+    result = get_diff_numstat("/repo", "abc123", "def456", ["src"])
+    assert result == {
+        "src/a.py": {"added": 10, "deleted": 5, "file": "src/a.py"},
+        "model.bin": {"added": 0, "deleted": 0, "file": "model.bin"},
+        "src/new.py": {"added": 3, "deleted": 1, "file": "src/new.py"},
+    }
     mock_run.assert_called_once_with(
-        ["git", "diff", "--numstat", commit1, commit2, "--", file_path],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
+        ["git", "diff", "--numstat", "-z", "abc123", "def456", "--", "src"],
+        cwd="/repo",
+        capture_output=True,
         text=True,
-        check=True,
     )
@@ -0,0 +1,55 @@
+import os
+import shutil
+import subprocess
+import tempfile
+
+from cim.worktrees import acquire_worktree, evict_worktrees, get_pool_dir
+
+
+def make_repo():
+    repo_path = tempfile.mkdtemp()
+    subprocess.run(["git", "init", "-q"], cwd=repo_path, check=True)
+    for content in ("v1", "v2"):
+        with open(os.path.join(repo_path, "file.txt"), "w") as f:
+            f.write(content)
+        subprocess.run(["git", "add", "file.txt"], cwd=repo_path, check=True)
+        subprocess.run(
+            ["git", "-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", content],
+            cwd=repo_path,
+            check=True,
+        )
+    return repo_path
+
+
+def test_acquire_worktree_reuses_slot():
+    repo_path = make_repo()
+    pool_root = tempfile.mkdtemp()
+    try:
+        with acquire_worktree(repo_path, "HEAD~1", pool_root=pool_root) as first:
+            with open(os.path.join(first, "file.txt")) as f:
+                assert f.read() == "v1"
+        with acquire_worktree(repo_path, "HEAD", pool_root=pool_root) as second:
+            with open(os.path.join(second, "file.txt")) as f:
+                assert f.read() == "v2"
+        assert first == second
+        assert os.path.dirname(first) == get_pool_dir(repo_path, pool_root)
+    finally:
+        shutil.rmtree(repo_path)
+        shutil.rmtree(pool_root)
+
+
+def test_acquire_worktree_evicts_lru():
+    repo_path = make_repo()
+    pool_root = tempfile.mkdtemp()
+    try:
+        with acquire_worktree(repo_path, pool_root=pool_root, max_worktrees=1) as first:
+            with acquire_worktree(
+                repo_path, pool_root=pool_root, max_worktrees=1
+            ) as second:
+                assert first != second
+        assert os.path.isdir(first) != os.path.isdir(second)
+        assert evict_worktrees(repo_path, pool_root, max_worktrees=0)
+        assert not os.path.isdir(first) and not os.path.isdir(second)
+    finally:
+        shutil.rmtree(repo_path)
+        shutil.rmtree(pool_root)
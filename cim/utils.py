@@ -1,25 +1,25 @@
+import configparser
 import json
 import os
-import tempfile
 import subprocess
 import yaml
 
 
-def clone_and_prepare_repo(repo_path, branch=None):
-    """Клонирует репозиторий в временную папку."""
-    temp_dir = tempfile.mkdtemp()
-    subprocess.run(["git", "clone", repo_path, temp_dir], check=True)
-    if branch:
-        subprocess.run(["git", "checkout", branch], cwd=temp_dir, check=True)
-    return temp_dir
-
+def get_dvc_cache_dir(repo_path):
+    """
+    Определяет папку локального кэша DVC с учётом .dvc/config и .dvc/config.local.
 
-def pull_dvc_cache(repo_dir):
-    """Пытается загрузить кэш DVC, если возможно."""
-    try:
-        subprocess.run(["dvc", "pull"], cwd=repo_dir, check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Warning: Could not pull DVC cache. Error: {e}")
+    :param repo_path: Путь к репозиторию.
+    :return: Абсолютный путь к кэшу DVC.
+    """
+    dvc_dir = os.path.join(os.path.abspath(repo_path), ".dvc")
+    config = configparser.ConfigParser()
+    config.read(
+        [os.path.join(dvc_dir, "config"), os.path.join(dvc_dir, "config.local")]
+    )
+    cache_dir = config.get("cache", "dir", fallback="cache")
+    # Относительный путь в конфиге DVC задаётся от папки .dvc
+    return os.path.normpath(os.path.join(dvc_dir, cache_dir))
 
 
 def save_metrics_to_file(commit, metrics, output_dir):
@@ -36,50 +36,73 @@ def save_metrics_to_file(commit, metrics, output_dir):
         json.dump(metrics, f, indent=4)
 
 
-def get_git_commits(repo_path, n):
+def resolve_refs(repo_path, refs):
     """
-    Получает последние n коммитов в репозитории.
+    Разрешает ветки, теги и коммиты в хэши одним вызовом git rev-parse.
+
+    Работает напрямую с исходным репозиторием, без клонирования и checkout.
 
     :param repo_path: Путь к репозиторию.
-    :param n: Количество последних коммитов.
-    :return: Список хэшей коммитов (от старых к новым).
+    :param refs: Список имён веток, тегов или коммитов.
+    :return: Словарь {ссылка: хэш коммита} в порядке refs.
     """
-    cmd = ["git", "log", "--format=%H", f"-n{n}"]
+    refs = list(dict.fromkeys(refs))
+    if not refs:
+        return {}
+    cmd = ["git", "rev-parse"] + [f"{ref}^{{commit}}" for ref in refs]
     result = subprocess.run(cmd, cwd=repo_path, capture_output=True, text=True)
 
     if result.returncode != 0:
-        raise RuntimeError(f"Error running 'git log': {result.stderr.strip()}")
+        raise RuntimeError(f"Error running 'git rev-parse': {result.stderr.strip()}")
 
-    return result.stdout.strip().split("\n")
+    return dict(zip(refs, result.stdout.split()))
 
 
-def count_lines_in_file(file_path):
+def read_file_at_commit(repo_path, commit, path):
     """
-    Подсчитывает количество строк в файле.
+    Читает содержимое файла в заданном коммите через git show, без checkout.
 
-    :param file_path: Путь к файлу.
-    :return: Количество строк.
+    :param repo_path: Путь к репозиторию.
+    :param commit: Хэш коммита.
+    :param path: Путь к файлу относительно корня репозитория.
+    :return: Содержимое файла (bytes) или None, если файла нет в коммите.
     """
-    try:
-        with open(file_path, "r") as f:
-            return sum(1 for _ in f)
-    except Exception as e:
-        print(f"Error reading file {file_path}: {e}")
-        return 0
+    result = subprocess.run(
+        ["git", "show", f"{commit}:{path}"],
+        cwd=repo_path,
+        capture_output=True,
+    )
+    if result.returncode != 0:
+        return None
+    return result.stdout
 
 
-def read_dvc_yaml(repo_dir: str = "."):
+def read_dvc_yaml(repo_dir: str = ".", commit: str = None):
     """
     Читает файл dvc.yaml и возвращает его содержимое, разделяя зависимости на данные и py файлы.
 
     :param repo_dir: Путь к репозиторию.
+    :param commit: Если указан, dvc.yaml читается из этого коммита через git show.
     :return: Содержимое dvc.yaml в виде словаря с разделенными зависимостями.
     """
-    dvc_yaml_path = os.path.join(repo_dir, "dvc.yaml")
-    with open(dvc_yaml_path, "r") as f:
-        dvc_yaml_content = yaml.safe_load(f)
+    if commit:
+        content = read_file_at_commit(repo_dir, commit, "dvc.yaml")
+        if content is None:
+            raise RuntimeError(f"dvc.yaml not found in commit {commit}")
+        dvc_yaml_content = yaml.safe_load(content)
+    else:
+        dvc_yaml_path = os.path.join(repo_dir, "dvc.yaml")
+        with open(dvc_yaml_path, "r") as f:
+            dvc_yaml_content = yaml.safe_load(f)
 
     for stage in dvc_yaml_content.get("stages", {}).values():
+        # Запись с параметрами (- data/prepared: {persist: true}) - словарь
+        for key in ("deps", "outs"):
+            if key in stage:
+                stage[key] = [
+                    next(iter(entry)) if isinstance(entry, dict) else entry
+                    for entry in stage[key]
+                ]
         deps = stage.get("deps", [])
         stage["deps_py"] = [dep for dep in deps if dep.endswith(".py")]
         stage["deps"] = [dep for dep in deps if not dep.endswith(".py")]
@@ -87,37 +110,62 @@ def read_dvc_yaml(repo_dir: str = "."):
     return dvc_yaml_content
 
 
-def get_file_diff_stats(file_path, commit1, commit2):
+def run_tasks(func, tasks, jobs=1, executor_class=None):
     """
-    Возвращает статистику изменений строк в файле между двумя коммитами.
+    Выполняет func для каждого набора именованных аргументов из tasks.
+
+    При jobs > 1 задачи выполняются в пуле executor_class (ProcessPoolExecutor
+    для вычислений, ThreadPoolExecutor для внешних процессов и ввода-вывода).
+    Порядок результатов всегда совпадает с порядком задач.
+
+    :param func: Функция (для пула процессов - объявленная на уровне модуля).
+    :param tasks: Список словарей с аргументами.
+    :param jobs: Число параллельных исполнителей.
+    :param executor_class: Класс пула из concurrent.futures.
+    :return: Список результатов.
+    """
+    if jobs <= 1 or len(tasks) <= 1 or executor_class is None:
+        return [func(**task) for task in tasks]
+    with executor_class(max_workers=jobs) as pool:
+        futures = [pool.submit(func, **task) for task in tasks]
+        return [future.result() for future in futures]
+
+
+def get_diff_numstat(repo_path, commit1, commit2, paths=None):
+    """
+    Возвращает статистику изменений строк для всех файлов пары коммитов
+    одним вызовом git diff --numstat -z.
 
     Args:
-        file_path (str): Путь к файлу.
+        repo_path (str): Путь к репозиторию.
         commit1 (str): Хэш или идентификатор первого коммита.
         commit2 (str): Хэш или идентификатор второго коммита.
+        paths (list): Если задан, статистика собирается только по этим путям.
 
     Returns:
-        dict: Статистика с количеством добавленных и удаленных строк.
+        dict: {путь: {"added", "deleted", "file"}}. Переименованные файлы
+              учитываются под новым путём, бинарные - с нулевыми счётчиками.
     """
-    try:
-        # Выполняем команду git diff --numstat
-        result = subprocess.run(
-            ["git", "diff", "--numstat", commit1, commit2, "--", file_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=True,
-        )
-
-        # Проверяем вывод
-        output = result.stdout.strip()
-        if not output:
-            return {"added": 0, "deleted": 0, "file": file_path}
-
-        # Разбираем вывод (формат: добавленные удаленные файл)
-        added, deleted, _ = output.split("\t")
-        return {"added": int(added), "deleted": int(deleted), "file": file_path}
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Ошибка выполнения git diff: {e.stderr}")
-    except ValueError:
-        raise RuntimeError(f"Неверный формат вывода git diff: {result.stdout}")
+    cmd = ["git", "diff", "--numstat", "-z", commit1, commit2]
+    if paths:
+        cmd += ["--"] + list(paths)
+    result = subprocess.run(cmd, cwd=repo_path, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Ошибка выполнения git diff: {result.stderr}")
+
+    stats = {}
+    fields = result.stdout.split("\0")
+    i = 0
+    while i < len(fields) - 1:
+        added, deleted, path = fields[i].split("\t", 2)
+        i += 1
+        if not path:
+            # Переименование: за счётчиками следуют старый и новый путь
+            path = fields[i + 1]
+            i += 2
+        stats[path] = {
+            "added": 0 if added == "-" else int(added),
+            "deleted": 0 if deleted == "-" else int(deleted),
+            "file": path,
+        }
+    return stats
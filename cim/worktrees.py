@@ -0,0 +1,184 @@
+import contextlib
+import fcntl
+import hashlib
+import os
+import shutil
+import subprocess
+
+from cim.utils import get_dvc_cache_dir, resolve_refs
+
+POOL_ROOT = os.environ.get(
+    "CIM_WORKTREE_POOL",
+    os.path.join(os.path.expanduser("~"), ".cache", "cim", "worktrees"),
+)
+MAX_WORKTREES = 4
+
+
+def get_pool_dir(repo_path, pool_root=None):
+    """
+    Возвращает папку пула worktree для заданного репозитория.
+
+    :param repo_path: Путь к исходному репозиторию.
+    :param pool_root: Корень пула (по умолчанию POOL_ROOT).
+    :return: Путь к папке пула.
+    """
+    real_path = os.path.realpath(repo_path)
+    key = hashlib.sha1(real_path.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(pool_root or POOL_ROOT, key)
+
+
+def _try_lock(lock_path, blocking=False):
+    """Захватывает файловую блокировку; возвращает дескриптор или None."""
+    fd = open(lock_path, "a+")
+    flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+    try:
+        fcntl.flock(fd, flags)
+    except BlockingIOError:
+        fd.close()
+        return None
+    return fd
+
+
+@contextlib.contextmanager
+def _pool_lock(pool_dir):
+    fd = _try_lock(os.path.join(pool_dir, "pool.lock"), blocking=True)
+    try:
+        yield
+    finally:
+        fd.close()
+
+
+def _list_slots(pool_dir):
+    """Возвращает слоты пула, отсортированные от самых свежих к самым старым."""
+    slots = [
+        os.path.join(pool_dir, name)
+        for name in os.listdir(pool_dir)
+        if name.startswith("wt-") and os.path.isdir(os.path.join(pool_dir, name))
+    ]
+    return sorted(slots, key=os.path.getmtime, reverse=True)
+
+
+def _share_dvc_cache(repo_path, worktree):
+    """Направляет кэш DVC worktree в кэш исходного репозитория."""
+    dvc_dir = os.path.join(worktree, ".dvc")
+    if not os.path.isdir(dvc_dir):
+        return
+    cache_dir = get_dvc_cache_dir(os.path.realpath(repo_path))
+    with open(os.path.join(dvc_dir, "config.local"), "w") as f:
+        f.write(f"[cache]\n    dir = {cache_dir}\n")
+
+
+def _create_slot(repo_path, pool_dir):
+    index = 0
+    while os.path.exists(os.path.join(pool_dir, f"wt-{index}")):
+        index += 1
+    worktree = os.path.join(pool_dir, f"wt-{index}")
+    lock = _try_lock(worktree + ".lock")
+    subprocess.run(
+        ["git", "worktree", "add", "--detach", "--force", worktree],
+        cwd=repo_path,
+        check=True,
+    )
+    _share_dvc_cache(repo_path, worktree)
+    return worktree, lock
+
+
+def _claim_slot(repo_path, pool_dir):
+    """Занимает свободный слот пула или создаёт новый."""
+    for worktree in _list_slots(pool_dir):
+        lock = _try_lock(worktree + ".lock")
+        if lock is None:
+            continue
+        if os.path.exists(os.path.join(worktree, ".git")):
+            return worktree, lock
+        # Слот повреждён (например, удалён вручную) - убираем его
+        shutil.rmtree(worktree, ignore_errors=True)
+        lock.close()
+    return _create_slot(repo_path, pool_dir)
+
+
+def checkout_worktree(worktree, commit):
+    """
+    Переключает worktree из пула на заданный коммит.
+
+    :param worktree: Путь к worktree.
+    :param commit: Ветка, тег или хэш коммита.
+    """
+    subprocess.run(
+        ["git", "checkout", "--detach", "--force", commit],
+        cwd=worktree,
+        check=True,
+    )
+    subprocess.run(["git", "clean", "-fdq"], cwd=worktree, check=True)
+
+
+def evict_worktrees(repo_path, pool_root=None, max_worktrees=MAX_WORKTREES):
+    """
+    Удаляет давно не использовавшиеся worktree сверх лимита (LRU).
+
+    Слоты, занятые другими процессами, не трогаются.
+
+    :param repo_path: Путь к исходному репозиторию.
+    :param pool_root: Корень пула.
+    :param max_worktrees: Максимальное число worktree в пуле.
+    :return: Список удалённых worktree.
+    """
+    pool_dir = get_pool_dir(repo_path, pool_root)
+    if not os.path.isdir(pool_dir):
+        return []
+
+    removed = []
+    with _pool_lock(pool_dir):
+        for worktree in _list_slots(pool_dir)[max_worktrees:]:
+            lock = _try_lock(worktree + ".lock")
+            if lock is None:
+                continue
+            try:
+                subprocess.run(
+                    ["git", "worktree", "remove", "--force", worktree],
+                    cwd=repo_path,
+                    capture_output=True,
+                )
+                shutil.rmtree(worktree, ignore_errors=True)
+                os.remove(worktree + ".lock")
+                removed.append(worktree)
+            finally:
+                lock.close()
+        if removed:
+            subprocess.run(
+                ["git", "worktree", "prune"], cwd=repo_path, capture_output=True
+            )
+    return removed
+
+
+@contextlib.contextmanager
+def acquire_worktree(
+    repo_path, commit=None, pool_root=None, max_worktrees=MAX_WORKTREES
+):
+    """
+    Выдаёт worktree исходного репозитория из постоянного пула.
+
+    Worktree разделяют объекты git и кэш DVC с исходным репозиторием, поэтому
+    переключение коммита не требует клонирования. Пока контекст открыт, слот
+    заблокирован для других процессов; после выхода лишние слоты удаляются
+    по принципу LRU.
+
+    :param repo_path: Путь к исходному репозиторию.
+    :param commit: Коммит, на который нужно переключить worktree.
+    :param pool_root: Корень пула (по умолчанию POOL_ROOT).
+    :param max_worktrees: Максимальное число worktree в пуле.
+    :return: Путь к worktree.
+    """
+    pool_dir = get_pool_dir(repo_path, pool_root)
+    os.makedirs(pool_dir, exist_ok=True)
+    with _pool_lock(pool_dir):
+        worktree, lock = _claim_slot(repo_path, pool_dir)
+    try:
+        if commit:
+            # HEAD и относительные ссылки должны разрешаться в исходном репозитории
+            checkout_worktree(worktree, resolve_refs(repo_path, [commit])[commit])
+        yield worktree
+    finally:
+        os.utime(worktree)
+        lock.close()
+        evict_worktrees(repo_path, pool_root, max_worktrees)
@@ -69,8 +69,14 @@ def main(team_id, cd_id, input_file):
     print("\nСредние значения оценки изменения данных по процессам:")
     stage_averages = {}
     for stage, stage_data in input_data.items():
-        # Выбираем только ключи с числовыми значениями
-        numeric_keys = [value for key, value in stage_data.items() if isinstance(value, (int, float))]
+        # Выбираем только ключи с числовыми значениями (в приближённом режиме cim
+        # значение риска лежит в поле "risk")
+        numeric_keys = [
+            value["risk"] if isinstance(value, dict) else value
+            for key, value in stage_data.items()
+            if isinstance(value, (int, float))
+            or (isinstance(value, dict) and isinstance(value.get("risk"), (int, float)))
+        ]
         if numeric_keys:
             avg_value = sum(numeric_keys) / len(numeric_keys)
             stage_averages[stage] = avg_value
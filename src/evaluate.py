@@ -1,6 +1,5 @@
 import json
 import math
-import os
 import pickle
 import sys
 
@@ -10,6 +9,8 @@ from sklearn import tree
 from dvclive import Live
 from matplotlib import pyplot as plt
 
+from matrix_io import load_features
+
 
 def evaluate(model, matrix, split, live, save_path):
     """
@@ -86,18 +87,14 @@ def main():
         sys.exit(1)
 
     model_file = sys.argv[1]
-    train_file = os.path.join(sys.argv[2], "train.pkl")
-    test_file = os.path.join(sys.argv[2], "test.pkl")
+    features_dir = sys.argv[2]
 
     # Load model and data.
     with open(model_file, "rb") as fd:
         model = pickle.load(fd)
 
-    with open(train_file, "rb") as fd:
-        train, feature_names = pickle.load(fd)
-
-    with open(test_file, "rb") as fd:
-        test, _ = pickle.load(fd)
+    train, feature_names = load_features(features_dir, "train")
+    test, _ = load_features(features_dir, "test")
 
     # Evaluate train and test datasets.
     with Live(EVAL_PATH, dvcyaml=False) as live:
@@ -1,48 +1,105 @@
+import argparse
+import hashlib
+import json
 import os
 import pickle
+import shutil
 import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
+import joblib
 import numpy as np
 import pandas as pd
 import scipy.sparse as sparse
+import sklearn
 import yaml
-from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
-
+from sklearn.feature_extraction.text import (
+    CountVectorizer,
+    HashingVectorizer,
+    TfidfTransformer,
+)
+
+from matrix_io import CSR_SUFFIX, FEATURE_OFFSET, HEADER_FILE, append_csr, save_csr
+
+# The fitted vectorizer and TF-IDF transformer, saved next to the matrices
+# (see save_featurizer); the meta file is written last.
+FEATURIZER_DIR = "featurizer"
+FEATURIZER_FILE = "transformers.joblib"
+FEATURIZER_META = "meta.json"
+FEATURIZER_VERSION = 1
+# Incremental mode: the high-water marks of the inputs, kept next to the outputs.
+STATE_FILE = ".featurize-state"
+STATE_VERSION = 3
+# Bytes of an input at the beginning and before the high-water mark that
+# must be unchanged for its features to be appended to.
+CHECK_BYTES = 64 * 1024
+# Drift of fewer appended train rows is not checked, it is mostly noise.
+MIN_DRIFT_ROWS = 1000
+# The drift is measured over this many most frequent fitted features: the
+# rare ones (most of the hashed columns) carry mostly sampling noise.
+DRIFT_FEATURES = 200
+# featurize.engine values: "count" fits a CountVectorizer vocabulary on the
+# whole train text, "hashing" hashes the n-grams into hash_features columns
+# and streams over the inputs in chunks.
+ENGINES = ("count", "hashing")
+HASH_FEATURES = 2**16
+# Rows of one chunk of the hashing engine (the unit of work of a process).
+CHUNK_ROWS = 20000
+TSV_OPTIONS = {
+    "encoding": "utf-8",
+    "header": None,
+    "delimiter": "\t",
+    "names": ["id", "label", "text"],
+}
+
+
+def get_df(data, offset=0):
+    """
+    Read the input data file and return a data frame.
 
-def get_df(data):
-    """Read the input data file and return a data frame."""
-    df = pd.read_csv(
-        data,
-        encoding="utf-8",
-        header=None,
-        delimiter="\t",
-        names=["id", "label", "text"],
-    )
+    Args:
+        data (str): Input TSV file.
+        offset (int): Byte offset of the first row to read.
+    """
+    with open(data, "rb") as fd:
+        fd.seek(offset)
+        try:
+            df = pd.read_csv(fd, **TSV_OPTIONS)
+        except pd.errors.EmptyDataError:
+            df = pd.DataFrame(columns=["id", "label", "text"])
     sys.stderr.write(f"The input data frame {data} size is {df.shape}\n")
     return df
 
 
-def save_matrix(df, matrix, names, output):
+def stack_matrix(df, matrix):
+    """Prepend the id and label columns of the data frame to the feature matrix."""
+    id_matrix = sparse.csr_matrix(df.id.astype(np.int64)).T
+    label_matrix = sparse.csr_matrix(df.label.astype(np.int64)).T
+    return sparse.hstack([id_matrix, label_matrix, matrix], format="csr")
+
+
+def save_matrix(df, matrix, names, output, append=False):
     """
-    Save the matrix to a pickle file.
+    Save the matrix in the memory-mappable CSR format (see matrix_io.save_csr).
 
     Args:
         df (pandas.DataFrame): Input data frame.
         matrix (scipy.sparse.csr_matrix): Input matrix.
         names (list): List of feature names.
-        output (str): Output file name.
+        output (str): Output directory name.
+        append (bool): Append the rows to the saved matrix (matrix_io.append_csr).
     """
-    id_matrix = sparse.csr_matrix(df.id.astype(np.int64)).T
-    label_matrix = sparse.csr_matrix(df.label.astype(np.int64)).T
-
-    result = sparse.hstack([id_matrix, label_matrix, matrix], format="csr")
+    result = stack_matrix(df, matrix)
 
     msg = "The output matrix {} size is {} and data type is {}\n"
     sys.stderr.write(msg.format(output, result.shape, result.dtype))
 
-    with open(output, "wb") as fd:
-        pickle.dump((result, names), fd)
-    pass
+    if append:
+        append_csr(output, result, ["id", "label", *names])
+    else:
+        save_csr(output, result, ["id", "label", *names], FEATURE_OFFSET)
 
 
 def generate_and_save_train_features(train_input, train_output, bag_of_words, tfidf):
@@ -54,6 +111,10 @@ def generate_and_save_train_features(train_input, train_output, bag_of_words, tf
         train_output (str): Train output file name.
         bag_of_words (sklearn.feature_extraction.text.CountVectorizer): Bag of words.
         tfidf (sklearn.feature_extraction.text.TfidfTransformer): TF-IDF transformer.
+
+    Returns:
+        tuple: Feature names of the fitted vocabulary and the number of train
+        rows containing each feature.
     """
     df_train = get_df(train_input)
     train_words = np.array(df_train.text.str.lower().values)
@@ -67,9 +128,12 @@ def generate_and_save_train_features(train_input, train_output, bag_of_words, tf
     train_words_tfidf_matrix = tfidf.transform(train_words_binary_matrix)
 
     save_matrix(df_train, train_words_tfidf_matrix, feature_names, train_output)
+    return feature_names, train_words_binary_matrix.getnnz(axis=0)
 
 
-def generate_and_save_test_features(test_input, test_output, bag_of_words, tfidf):
+def generate_and_save_test_features(
+    test_input, test_output, bag_of_words, tfidf, feature_names
+):
     """
     Generate test feature matrix.
 
@@ -78,58 +142,580 @@ def generate_and_save_test_features(test_input, test_output, bag_of_words, tfidf
         test_output (str): Test output file name.
         bag_of_words (sklearn.feature_extraction.text.CountVectorizer): Bag of words.
         tfidf (sklearn.feature_extraction.text.TfidfTransformer): TF-IDF transformer.
+        feature_names (list): Feature names returned by the train step.
     """
     df_test = get_df(test_input)
     test_words = np.array(df_test.text.str.lower().values)
 
     test_words_binary_matrix = bag_of_words.transform(test_words)
     test_words_tfidf_matrix = tfidf.transform(test_words_binary_matrix)
-    feature_names = bag_of_words.get_feature_names_out()
 
     save_matrix(df_test, test_words_tfidf_matrix, feature_names, test_output)
 
 
-def main():
-    params = yaml.safe_load(open("params.yaml"))["featurize"]
-
-    np.set_printoptions(suppress=True)
+def iter_mapped(func, tasks, jobs=1):
+    """
+    Apply func to every task, in a process pool if jobs > 1.
 
-    if len(sys.argv) != 3 and len(sys.argv) != 5:
-        sys.stderr.write("Arguments error. Usage:\n")
-        sys.stderr.write("\tpython featurization.py data-dir-path features-dir-path\n")
-        sys.exit(1)
+    Results are yielded in the order of the tasks; a bounded window of
+    submitted tasks keeps the memory use independent of their number.
+    """
+    if jobs <= 1:
+        yield from map(func, tasks)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(func, task))
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_chunks(path):
+    """Read the input data file in chunks of CHUNK_ROWS rows."""
+    try:
+        yield from pd.read_csv(path, chunksize=CHUNK_ROWS, **TSV_OPTIONS)
+    except pd.errors.EmptyDataError:
+        return
+
+
+def _count_chunk(task):
+    """Hash a train chunk, spill the counts to disk, return the document frequencies."""
+    df, vectorizer, spill_path = task
+    counts = vectorizer.transform(np.array(df.text.str.lower().values))
+    sparse.save_npz(spill_path, stack_matrix(df, counts), compressed=False)
+    return spill_path, counts.getnnz(axis=0), len(df)
+
+
+def _weigh_chunk(task):
+    """Apply the IDF weights to a spilled train chunk."""
+    spill_path, tfidf = task
+    matrix = sparse.load_npz(spill_path).tocsr()
+    os.remove(spill_path)
+    return sparse.hstack([matrix[:, :2], tfidf.transform(matrix[:, 2:])], format="csr")
+
+
+def _transform_chunk(task):
+    """Hash and weigh a chunk with the fitted transformers."""
+    df, vectorizer, tfidf = task
+    counts = vectorizer.transform(np.array(df.text.str.lower().values))
+    return stack_matrix(df, tfidf.transform(counts))
+
+
+def _save_chunks(matrices, names, output):
+    """Save the first matrix and append the rest; return the number of rows."""
+    rows = 0
+    columns = ["id", "label", *names]
+    for matrix in matrices:
+        if rows == 0:
+            save_csr(output, matrix, columns, FEATURE_OFFSET)
+        else:
+            append_csr(output, matrix, columns)
+        rows += matrix.shape[0]
+    if rows == 0:
+        save_csr(output, sparse.csr_matrix((0, len(columns))), columns, FEATURE_OFFSET)
+    sys.stderr.write(f"The output matrix {output} has {rows} rows\n")
+    return rows
+
+
+def featurize_hashing(in_path, out_path, ngrams, hash_features=HASH_FEATURES, jobs=1):
+    """
+    Build the feature matrices with a stateless hashing vectorizer.
 
-    in_path = sys.argv[1]
-    out_path = sys.argv[2]
+    Nothing is fitted but the IDF: the train chunks are hashed in parallel,
+    their counts are spilled to a temporary directory while the document
+    frequencies are summed, then the weighted chunks are appended to the
+    output one by one. The test chunks are hashed and weighted in one pass.
+    At no point is more than a window of chunks in memory.
 
-    train_input = os.path.join(in_path, "train.tsv")
-    test_input = os.path.join(in_path, "test.tsv")
-    train_output = os.path.join(out_path, "train.pkl")
-    test_output = os.path.join(out_path, "test.pkl")
+    The weights are those of TfidfTransformer(smooth_idf=False), except that
+    a column no train row has (possible with hashing, not with a fitted
+    vocabulary) gets the weight of a column of one row instead of infinity.
 
-    max_features = params["max_features"]
-    ngrams = params["ngrams"]
+    Args:
+        in_path (str): Directory with train.tsv and test.tsv.
+        out_path (str): Output directory.
+        ngrams (int): featurize.ngrams.
+        hash_features (int): Number of hashed feature columns.
+        jobs (int): Number of worker processes.
+
+    Returns:
+        tuple: (HashingVectorizer, TfidfTransformer with the streamed IDF,
+        feature names, number of train rows containing each feature).
+    """
+    vectorizer = HashingVectorizer(
+        stop_words="english",
+        ngram_range=(1, ngrams),
+        n_features=hash_features,
+        alternate_sign=False,
+        norm=None,
+    )
+    names = [f"hash_{i}" for i in range(hash_features)]
+
+    spill_dir = tempfile.mkdtemp(dir=out_path)
+    try:
+        tasks = (
+            (df, vectorizer, os.path.join(spill_dir, f"{i}.npz"))
+            for i, df in enumerate(iter_chunks(os.path.join(in_path, "train.tsv")))
+        )
+        spills = []
+        df_total = np.zeros(hash_features, dtype=np.int64)
+        rows = 0
+        for spill_path, chunk_df, chunk_rows in iter_mapped(_count_chunk, tasks, jobs):
+            spills.append(spill_path)
+            df_total += chunk_df
+            rows += chunk_rows
+
+        tfidf = TfidfTransformer(smooth_idf=False)
+        tfidf.idf_ = np.log(max(rows, 1) / np.maximum(df_total, 1)) + 1
+        _save_chunks(
+            iter_mapped(_weigh_chunk, ((path, tfidf) for path in spills), jobs),
+            names,
+            os.path.join(out_path, "train" + CSR_SUFFIX),
+        )
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    tasks = (
+        (df, vectorizer, tfidf)
+        for df in iter_chunks(os.path.join(in_path, "test.tsv"))
+    )
+    _save_chunks(
+        iter_mapped(_transform_chunk, tasks, jobs),
+        names,
+        os.path.join(out_path, "test" + CSR_SUFFIX),
+    )
+    return vectorizer, tfidf, names, df_total
+
+
+def featurize(
+    in_path,
+    out_path,
+    max_features,
+    ngrams,
+    engine="count",
+    hash_features=HASH_FEATURES,
+    jobs=1,
+):
+    """
+    Fit the transformers on the train data set and save both feature matrices.
 
+    Args:
+        in_path (str): Directory with train.tsv and test.tsv.
+        out_path (str): Output directory.
+        max_features (int): featurize.max_features (count engine).
+        ngrams (int): featurize.ngrams.
+        engine (str): featurize.engine, see ENGINES.
+        hash_features (int): featurize.hash_features (hashing engine).
+        jobs (int): Number of worker processes (hashing engine).
+
+    The fitted transformers are saved to out_path/FEATURIZER_DIR.
+
+    Returns:
+        tuple: Fitted (vectorizer, TfidfTransformer) and the number of train
+        rows containing each feature.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown featurize engine {engine!r}, expected one of {ENGINES}")
     os.makedirs(out_path, exist_ok=True)
-
-    bag_of_words = CountVectorizer(
-        stop_words="english", max_features=max_features, ngram_range=(1, ngrams)
+    # The outputs are rewritten, the state of an incremental run is stale
+    try:
+        os.remove(os.path.join(out_path, STATE_FILE))
+    except FileNotFoundError:
+        pass
+
+    train_output = os.path.join(out_path, "train" + CSR_SUFFIX)
+    if engine == "hashing":
+        bag_of_words, tfidf, feature_names, train_df = featurize_hashing(
+            in_path, out_path, ngrams, hash_features, jobs
+        )
+    else:
+        bag_of_words = CountVectorizer(
+            stop_words="english", max_features=max_features, ngram_range=(1, ngrams)
+        )
+        tfidf = TfidfTransformer(smooth_idf=False)
+
+        feature_names, train_df = generate_and_save_train_features(
+            train_input=os.path.join(in_path, "train.tsv"),
+            train_output=train_output,
+            bag_of_words=bag_of_words,
+            tfidf=tfidf,
+        )
+
+        generate_and_save_test_features(
+            test_input=os.path.join(in_path, "test.tsv"),
+            test_output=os.path.join(out_path, "test" + CSR_SUFFIX),
+            bag_of_words=bag_of_words,
+            tfidf=tfidf,
+            feature_names=feature_names,
+        )
+
+    params = {
+        "engine": engine,
+        "max_features": max_features,
+        "ngrams": ngrams,
+        "hash_features": hash_features,
+    }
+    save_featurizer(
+        os.path.join(out_path, FEATURIZER_DIR),
+        bag_of_words,
+        tfidf,
+        feature_names,
+        params,
+        _matrix_rows(train_output),
     )
-    tfidf = TfidfTransformer(smooth_idf=False)
+    return bag_of_words, tfidf, train_df
 
-    generate_and_save_train_features(
-        train_input=train_input,
-        train_output=train_output,
-        bag_of_words=bag_of_words,
-        tfidf=tfidf,
+
+def save_featurizer(path, vectorizer, tfidf, feature_names, params, rows):
+    """
+    Save the fitted transformers as a versioned directory.
+
+    The directory holds the joblib dump of the transformers and the feature
+    names and a meta.json with the format version, the scikit-learn version,
+    the featurize parameters and the number of train rows. meta.json is
+    written last: a directory without it is incomplete.
+
+    Args:
+        path (str): Output directory.
+        vectorizer: Fitted CountVectorizer or HashingVectorizer.
+        tfidf (sklearn.feature_extraction.text.TfidfTransformer): Fitted transformer.
+        feature_names (list): Names of the feature columns.
+        params (dict): featurize parameters of the fit.
+        rows (int): Number of train rows of the fit.
+    """
+    os.makedirs(path, exist_ok=True)
+    meta_path = os.path.join(path, FEATURIZER_META)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    joblib.dump(
+        {
+            "vectorizer": vectorizer,
+            "tfidf": tfidf,
+            "feature_names": [str(name) for name in feature_names],
+        },
+        os.path.join(path, FEATURIZER_FILE),
     )
+    meta = {
+        "format": "featurizer",
+        "version": FEATURIZER_VERSION,
+        "sklearn": sklearn.__version__,
+        "params": params,
+        "features": len(feature_names),
+        "train_rows": rows,
+    }
+    with open(meta_path, "w") as fd:
+        json.dump(meta, fd, indent=2)
+
+
+def load_featurizer(path):
+    """
+    Load the transformers saved by save_featurizer.
+
+    Args:
+        path (str): Featurizer directory.
+
+    Returns:
+        tuple: (vectorizer, TfidfTransformer, feature names, meta dict).
+    """
+    with open(os.path.join(path, FEATURIZER_META)) as fd:
+        meta = json.load(fd)
+    if meta.get("format") != "featurizer" or meta.get("version") != FEATURIZER_VERSION:
+        raise ValueError(f"Unsupported featurizer format in {path}: {meta}")
+    if meta.get("sklearn") != sklearn.__version__:
+        sys.stderr.write(
+            f"The featurizer {path} was saved with scikit-learn {meta.get('sklearn')}, "
+            f"loading it with {sklearn.__version__}\n"
+        )
+    saved = joblib.load(os.path.join(path, FEATURIZER_FILE))
+    return saved["vectorizer"], saved["tfidf"], saved["feature_names"], meta
+
+
+def transform_only(inputs, out_path, featurizer_path, jobs=1):
+    """
+    Transform TSV files with the saved transformers, without fitting.
+
+    Every input is read in chunks of CHUNK_ROWS rows that are transformed in
+    a process pool and written to out_path/<input name>.csr, so any number
+    of rows can be featurized with a bounded amount of memory. The matrix
+    holds exactly the rows of the input: an existing matrix is replaced, not
+    appended to (the chunks are appended only within the run).
+
+    Args:
+        inputs (list): TSV files in the prepare format (id, label, text).
+        out_path (str): Output directory.
+        featurizer_path (str): Directory written by save_featurizer.
+        jobs (int): Number of worker processes.
+
+    Returns:
+        list: Paths of the written matrices.
+    """
+    vectorizer, tfidf, feature_names, _ = load_featurizer(featurizer_path)
+    os.makedirs(out_path, exist_ok=True)
+    outputs = []
+    for path in inputs:
+        name = os.path.splitext(os.path.basename(path))[0]
+        output = os.path.join(out_path, name + CSR_SUFFIX)
+        tasks = ((df, vectorizer, tfidf) for df in iter_chunks(path))
+        _save_chunks(iter_mapped(_transform_chunk, tasks, jobs), feature_names, output)
+        outputs.append(output)
+    return outputs
+
+
+def input_digest(path, offset):
+    """Digest of the beginning of a file and of the bytes before offset."""
+    digest = hashlib.md5()
+    with open(path, "rb") as fd:
+        digest.update(fd.read(min(CHECK_BYTES, offset)))
+        fd.seek(max(offset - CHECK_BYTES, 0))
+        digest.update(fd.read(offset - fd.tell()))
+    return digest.hexdigest()
+
+
+def feature_drift(expected, observed, top=DRIFT_FEATURES):
+    """
+    Total variation distance between two document frequency distributions.
+
+    Only the top most frequent fitted features are compared. Over tens of
+    thousands of hashed columns, most of them seen in a handful of rows, the
+    distance between two samples of the same distribution is far from zero;
+    over the frequent features it is not.
+
+    Args:
+        expected (numpy.ndarray): Document frequencies of the fitted data.
+        observed (numpy.ndarray): Document frequencies of the new rows.
+        top (int): Number of the compared features.
+
+    Returns:
+        float: From 0 (the same shares of the features) to 1.
+    """
+    expected = np.asarray(expected, dtype=float)
+    observed = np.asarray(observed, dtype=float)
+    if len(expected) > top:
+        # A stable sort keeps the choice of tied features deterministic
+        columns = np.argsort(-expected, kind="stable")[:top]
+        expected, observed = expected[columns], observed[columns]
+    if expected.sum() == 0 or observed.sum() == 0:
+        return float(expected.sum() != observed.sum())
+    return float(np.abs(expected / expected.sum() - observed / observed.sum()).sum() / 2)
+
+
+def load_state(out_path):
+    """
+    Read the state of the previous incremental run.
+
+    Returns:
+        tuple: (state, (vectorizer, tfidf, feature names) of the saved
+        featurizer), or (None, None).
+    """
+    try:
+        with open(os.path.join(out_path, STATE_FILE)) as fd:
+            state = json.load(fd)
+        vectorizer, tfidf, feature_names, _ = load_featurizer(
+            os.path.join(out_path, FEATURIZER_DIR)
+        )
+    except (OSError, ValueError, KeyError, pickle.UnpicklingError):
+        return None, None
+    if state.get("version") != STATE_VERSION:
+        return None, None
+    return state, (vectorizer, tfidf, feature_names)
+
+
+def save_state(out_path, state):
+    """Write the state of an incremental run; the outputs must be complete by then."""
+    path = os.path.join(out_path, STATE_FILE)
+    with open(path + ".tmp", "w") as fd:
+        json.dump({"version": STATE_VERSION, **state}, fd)
+    os.replace(path + ".tmp", path)
+
+
+def _matrix_rows(path):
+    with open(os.path.join(path, HEADER_FILE)) as fd:
+        return json.load(fd)["shape"][0]
+
+
+def _can_append(state, inputs, outputs, params):
+    """Whether the saved matrices hold exactly the rows before the marks."""
+    if state is None or state["params"] != params:
+        return False
+    for split, path in inputs.items():
+        mark = state["inputs"][split]
+        if os.path.getsize(path) < mark["offset"]:
+            return False
+        if input_digest(path, mark["offset"]) != mark["digest"]:
+            return False
+        output = outputs[split]
+        if not os.path.exists(os.path.join(output, HEADER_FILE)):
+            return False
+        if _matrix_rows(output) != mark["rows"]:
+            return False
+    return True
+
+
+def featurize_incremental(
+    in_path,
+    out_path,
+    max_features,
+    ngrams,
+    refit_drift,
+    engine="count",
+    hash_features=HASH_FEATURES,
+    jobs=1,
+):
+    """
+    Transform only the rows appended to the inputs since the previous run.
+
+    The previous run leaves the fitted transformers and the high-water marks
+    of train.tsv and test.tsv in out_path. If the parameters are the same and
+    the inputs were only appended to (see prepare.py --incremental), the new
+    rows are transformed with the fitted transformers and appended to the
+    feature matrices. The document frequencies of the features in all rows
+    appended since the fit are compared with the fitted ones; when their
+    drift (feature_drift) exceeds refit_drift, everything is refitted.
+
+    Args:
+        in_path (str): Directory with train.tsv and test.tsv.
+        out_path (str): Output directory.
+        max_features (int): featurize.max_features (count engine).
+        ngrams (int): featurize.ngrams.
+        refit_drift (float): featurize.refit_drift.
+        engine (str): featurize.engine, see ENGINES.
+        hash_features (int): featurize.hash_features (hashing engine).
+        jobs (int): Number of worker processes of a refit (hashing engine).
+
+    Returns:
+        bool: Whether the transformers were (re)fitted.
+    """
+    params = {
+        "max_features": max_features,
+        "ngrams": ngrams,
+        "engine": engine,
+        "hash_features": hash_features,
+    }
+    inputs = {split: os.path.join(in_path, f"{split}.tsv") for split in ("train", "test")}
+    outputs = {split: os.path.join(out_path, split + CSR_SUFFIX) for split in inputs}
+    state, transformers = load_state(out_path)
+
+    refit = not _can_append(state, inputs, outputs, params)
+    if not refit:
+        bag_of_words, tfidf, feature_names = transformers
+        marks = state["inputs"]
+        sizes = {split: os.path.getsize(path) for split, path in inputs.items()}
+        frames = {split: get_df(path, marks[split]["offset"]) for split, path in inputs.items()}
+        # HashingVectorizer cannot transform an empty sequence
+        counts = {
+            split: bag_of_words.transform(np.array(df.text.str.lower().values))
+            for split, df in frames.items()
+            if not df.empty
+        }
+
+        appended_df = np.asarray(state["appended_df"])
+        if "train" in counts:
+            appended_df = appended_df + counts["train"].getnnz(axis=0)
+        appended_rows = state["appended_rows"] + len(frames["train"])
+        drift = feature_drift(state["fit_df"], appended_df)
+        sys.stderr.write(f"Feature drift of {appended_rows} appended rows is {drift:.4f}\n")
+        refit = appended_rows >= MIN_DRIFT_ROWS and drift > refit_drift
+
+    if refit:
+        bag_of_words, tfidf, train_df = featurize(
+            in_path, out_path, max_features, ngrams, engine, hash_features, jobs
+        )
+        state = {
+            "params": params,
+            "fit_df": np.asarray(train_df).tolist(),
+            "appended_df": [0] * len(train_df),
+            "appended_rows": 0,
+        }
+        sizes = {split: os.path.getsize(path) for split, path in inputs.items()}
+    else:
+        for split, matrix in counts.items():
+            save_matrix(
+                frames[split], tfidf.transform(matrix), feature_names, outputs[split], append=True
+            )
+        state["appended_df"] = appended_df.tolist()
+        state["appended_rows"] = appended_rows
+
+    state["inputs"] = {
+        split: {
+            "offset": sizes[split],
+            "digest": input_digest(path, sizes[split]),
+            "rows": _matrix_rows(outputs[split]),
+        }
+        for split, path in inputs.items()
+    }
+    save_state(out_path, state)
+    return refit
+
 
-    generate_and_save_test_features(
-        test_input=test_input,
-        test_output=test_output,
-        bag_of_words=bag_of_words,
-        tfidf=tfidf,
+def main():
+    np.set_printoptions(suppress=True)
+
+    parser = argparse.ArgumentParser(description="Build the TF-IDF feature matrices.")
+    parser.add_argument(
+        "data_dir",
+        help="Directory with train.tsv and test.tsv (with --transform-only: "
+        "a TSV file or a directory of them).",
+    )
+    parser.add_argument("features_dir", help="Output directory.")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Append the features of the rows added since the previous run.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes of the hashing engine and --transform-only.",
     )
+    parser.add_argument(
+        "--transform-only",
+        action="store_true",
+        help="Transform the TSVs with the saved featurizer instead of fitting.",
+    )
+    parser.add_argument(
+        "--featurizer",
+        help=f"Featurizer directory (default: <features_dir>/{FEATURIZER_DIR}).",
+    )
+    args = parser.parse_args()
+
+    if args.transform_only:
+        if os.path.isdir(args.data_dir):
+            inputs = sorted(
+                os.path.join(args.data_dir, name)
+                for name in os.listdir(args.data_dir)
+                if name.endswith(".tsv")
+            )
+        else:
+            inputs = [args.data_dir]
+        transform_only(
+            inputs,
+            args.features_dir,
+            args.featurizer or os.path.join(args.features_dir, FEATURIZER_DIR),
+            jobs=args.jobs,
+        )
+        return
+
+    params = yaml.safe_load(open("params.yaml"))["featurize"]
+    options = {
+        "max_features": params["max_features"],
+        "ngrams": params["ngrams"],
+        "engine": params.get("engine", "count"),
+        "hash_features": params.get("hash_features", HASH_FEATURES),
+        "jobs": args.jobs,
+    }
+    if args.incremental:
+        featurize_incremental(
+            args.data_dir,
+            args.features_dir,
+            refit_drift=params.get("refit_drift", 0.1),
+            **options,
+        )
+    else:
+        featurize(args.data_dir, args.features_dir, **options)
 
 
 if __name__ == "__main__":
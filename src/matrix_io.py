@@ -0,0 +1,212 @@
+import io
+import json
+import os
+import pickle
+
+import numpy as np
+import scipy.sparse as sparse
+
+CSR_SUFFIX = ".csr"
+CSR_ARRAYS = ("indptr", "indices", "data")
+HEADER_FILE = "header.json"
+FORMAT_VERSION = 1
+
+# The first two columns of a feature matrix are the id and the label
+# (see featurization.save_matrix), the rest are the features.
+FEATURE_OFFSET = 2
+
+
+def save_csr(path, matrix, columns, feature_offset=0):
+    """
+    Save a CSR matrix as a directory of .npy arrays plus a JSON header.
+
+    Each array can later be memory-mapped with np.load(mmap_mode="r"),
+    so readers do not have to load or unpickle the whole matrix.
+
+    Args:
+        path (str): Output directory, conventionally ending with ".csr".
+        matrix (scipy.sparse.csr_matrix): Matrix to save.
+        columns (list): Names of all matrix columns.
+        feature_offset (int): Number of leading non-feature columns (such as
+            the id and the label), recorded so that readers can skip them.
+    """
+    matrix = sparse.csr_matrix(matrix)
+    matrix.sort_indices()
+    os.makedirs(path, exist_ok=True)
+    for name in CSR_ARRAYS:
+        np.save(os.path.join(path, f"{name}.npy"), getattr(matrix, name))
+
+    header = {
+        "format": "csr",
+        "version": FORMAT_VERSION,
+        "shape": list(matrix.shape),
+        "columns": [str(column) for column in columns],
+        "feature_offset": feature_offset,
+    }
+    # The header is written last: a directory without it is incomplete
+    _write_header(path, header)
+
+
+def _write_header(path, header):
+    """Replace header.json atomically: readers see either the old or the new one."""
+    temp_path = os.path.join(path, HEADER_FILE + ".tmp")
+    with open(temp_path, "w") as fd:
+        json.dump(header, fd)
+    os.replace(temp_path, os.path.join(path, HEADER_FILE))
+
+
+def _stored_arrays(path, header, mmap_mode="r"):
+    """
+    Load the arrays of a matrix, cut to the lengths recorded in its header.
+
+    The header is authoritative: an append interrupted after the arrays grew
+    but before header.json was replaced leaves longer arrays, whose extra
+    values are ignored.
+    """
+    indptr, indices, data = (
+        np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+        for name in CSR_ARRAYS
+    )
+    rows = header["shape"][0]
+    if len(indptr) < rows + 1:
+        raise ValueError(f"The arrays of {path} are shorter than its header")
+    indptr = indptr[: rows + 1]
+    nnz = int(indptr[-1])
+    if len(indices) < nnz or len(data) < nnz:
+        raise ValueError(f"The arrays of {path} are shorter than its header")
+    return indptr, indices[:nnz], data[:nnz]
+
+
+def load_csr(path, mmap_mode="r"):
+    """
+    Load a matrix saved by save_csr without copying its buffers.
+
+    Args:
+        path (str): Matrix directory.
+        mmap_mode (str): Passed to np.load; None reads the arrays into memory.
+
+    Returns:
+        tuple: (scipy.sparse.csr_matrix, list of column names).
+    """
+    with open(os.path.join(path, HEADER_FILE)) as fd:
+        header = json.load(fd)
+    if header.get("format") != "csr" or header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported matrix format in {path}: {header}")
+
+    indptr, indices, data = _stored_arrays(path, header, mmap_mode)
+    matrix = sparse.csr_matrix(
+        (data, indices, indptr), shape=tuple(header["shape"]), copy=False
+    )
+    return matrix, header["columns"]
+
+
+def _append_npy(path, values, length):
+    """
+    Append values to the first length values of a 1-d .npy file in place.
+
+    The values are written after the first length values (anything beyond
+    them is left by an interrupted append; bytes past the recorded length
+    are ignored by numpy) and then the array header is
+    rewritten with the new length (numpy pads headers so that the shape can
+    grow in place). If the header does not fit or the values do not fit the
+    dtype of the file, the whole array is rewritten into a temporary file
+    that replaces the old one.
+    """
+    with open(path, "r+b") as fd:
+        version = np.lib.format.read_magic(fd)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fd)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fd)
+        header_length = fd.tell()
+        if shape[0] < length:
+            raise ValueError(f"{path} is shorter than {length} values")
+        converted = values.astype(dtype)
+        if np.array_equal(converted, values) and len(shape) == 1 and not fortran_order:
+            header = io.BytesIO()
+            if version == (1, 0):
+                write_header = np.lib.format.write_array_header_1_0
+            else:
+                write_header = np.lib.format.write_array_header_2_0
+            write_header(
+                header,
+                {
+                    "descr": np.lib.format.dtype_to_descr(dtype),
+                    "fortran_order": False,
+                    "shape": (length + len(values),),
+                },
+            )
+            header = header.getvalue()
+            if len(header) == header_length:
+                fd.seek(header_length + length * dtype.itemsize)
+                fd.write(converted.tobytes())
+                # The length is updated last, after the values are written
+                fd.seek(0)
+                fd.write(header)
+                return
+
+    existing = np.load(path, mmap_mode="r")[:length]
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as fd:
+        np.save(fd, np.concatenate([existing, values]))
+    os.replace(temp_path, path)
+
+
+def append_csr(path, matrix, columns):
+    """
+    Append the rows of a CSR matrix to a directory written by save_csr.
+
+    Only the new rows are written: the .npy arrays grow in place, so the cost
+    does not depend on the size of the stored matrix. header.json is
+    replaced last, so an interrupted append leaves the previous matrix (see
+    _stored_arrays) and the next append overwrites its partial values.
+
+    Args:
+        path (str): Matrix directory.
+        matrix (scipy.sparse.csr_matrix): Rows to append.
+        columns (list): Names of all matrix columns; must match the stored ones.
+    """
+    with open(os.path.join(path, HEADER_FILE)) as fd:
+        header = json.load(fd)
+    columns = [str(column) for column in columns]
+    if header["columns"] != columns:
+        raise ValueError(f"The columns of {path} do not match the appended rows")
+
+    matrix = sparse.csr_matrix(matrix)
+    matrix.sort_indices()
+    rows = header["shape"][0]
+    nnz = int(_stored_arrays(path, header)[0][-1])
+    lengths = {"indptr": rows + 1, "indices": nnz, "data": nnz}
+    appended = {
+        "indptr": matrix.indptr[1:].astype(np.int64) + nnz,
+        "indices": matrix.indices,
+        "data": matrix.data,
+    }
+    for name in CSR_ARRAYS:
+        _append_npy(os.path.join(path, f"{name}.npy"), appended[name], lengths[name])
+
+    header["shape"] = [rows + matrix.shape[0], header["shape"][1]]
+    _write_header(path, header)
+
+
+def load_features(features_dir, split):
+    """
+    Load a feature matrix produced by the featurize stage.
+
+    Reads the memory-mapped "<split>.csr" directory and falls back to the
+    legacy pickled "<split>.pkl" (matrix, feature names) tuple.
+
+    Args:
+        features_dir (str): Features directory.
+        split (str): Dataset name ("train" or "test").
+
+    Returns:
+        tuple: (scipy.sparse.csr_matrix, list of feature names).
+    """
+    csr_path = os.path.join(features_dir, split + CSR_SUFFIX)
+    if os.path.isdir(csr_path):
+        matrix, columns = load_csr(csr_path)
+        return matrix, columns[FEATURE_OFFSET:]
+
+    with open(os.path.join(features_dir, f"{split}.pkl"), "rb") as fd:
+        return pickle.load(fd)
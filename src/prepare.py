@@ -1,77 +1,512 @@
+import argparse
+import hashlib
+import json
 import os
 import random
-import re
 import sys
 import xml.etree.ElementTree
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 import yaml
 
+# Size of one block read from the input file; a block (rounded to whole
+# lines) is also the unit of work sent to a worker process.
+READ_BLOCK = 4 * 1024 * 1024
+# Buffer size of the output files.
+WRITE_BUFFER = 1024 * 1024
+# prepare.split_mode values: "random" draws the split from one RNG stream
+# over all lines, "hash" derives it from the post Id and prepare.seed.
+SPLIT_MODES = ("random", "hash")
+# High-water mark of the incremental mode, kept next to the outputs.
+STATE_FILE = ".prepare-state"
+STATE_VERSION = 1
+# Bytes of the input at the beginning and before the high-water mark that
+# must be unchanged for the outputs to be appended to.
+CHECK_BYTES = 64 * 1024
 
-def process_posts(input_lines, fd_out_train, fd_out_test, target_tag, split):
+
+def iter_line_blocks(fd_in, block_size=READ_BLOCK, start=0, end=None):
+    """
+    Read a binary file in large blocks and split them into whole lines.
+
+    With start/end only a byte range of the file is read: it holds the lines
+    that begin inside [start, end), so adjacent ranges split the file into
+    shards without losing or repeating lines.
+
+    Args:
+        fd_in (file): Input file opened in binary mode.
+        block_size (int): Number of bytes read at once.
+        start (int): Byte offset of the range.
+        end (int): End of the range (None - the end of the file).
+
+    Yields:
+        tuple: (byte offset of the first line, list of lines of one block as
+        bytes without the line separator).
+    """
+    fd_in.seek(max(start - 1, 0))
+    if start > 0:
+        # The line that begins before start belongs to the previous range
+        fd_in.readline()
+    offset = fd_in.tell()
+    tail = b""
+    while end is None or offset < end:
+        block = fd_in.read(block_size)
+        if not block:
+            break
+        data = tail + block
+        lines = data.split(b"\n")
+        tail = lines.pop()
+        next_offset = offset + len(data) - len(tail)
+        if end is not None and next_offset > end:
+            line_start = offset
+            for count, line in enumerate(lines):
+                if line_start >= end:
+                    lines = lines[:count]
+                    break
+                line_start += len(line) + 1
+        if lines:
+            yield offset, lines
+        offset = next_offset
+    if tail and (end is None or offset < end):
+        yield offset, [tail]
+
+
+def hash_split(pid, seed):
+    """
+    Stable pseudo-random number in [0, 1) for the post Id and the seed.
+
+    Args:
+        pid (str): Post Id.
+        seed (int): prepare.seed.
+
+    Returns:
+        float: The same value for the same (pid, seed) on every run and
+        platform, independent of the other rows.
+    """
+    digest = hashlib.blake2b(f"{seed}:{pid}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2**64
+
+
+def format_post(attr, target_tag):
+    """
+    Format the attributes of one <row> element as an output TSV line.
+
+    Args:
+        attr (dict): Element attributes.
+        target_tag (str): Target tag.
+
+    Returns:
+        str: "id<TAB>label<TAB>text" line.
+    """
+    pid = attr.get("Id", "")
+    label = 1 if target_tag in attr.get("Tags", "") else 0
+    # str.split() without arguments splits on the same whitespace as \s+
+    title = " ".join(attr.get("Title", "").split())
+    body = " ".join(attr.get("Body", "").split())
+    text = title + " " + body
+    return "{}\t{}\t{}\n".format(pid, label, text)
+
+
+def parse_rows(lines):
     """
-    Process the input lines and write the output to the output files.
+    Parse the lines holding one <row/> element each with a single pull parser.
 
     Args:
-        input_lines (list): List of input lines.
+        lines (list): Lines of a block (bytes).
+
+    Returns:
+        list: Attributes of every line, or None for the lines that have to be
+        parsed one by one (the XML header, the root element, broken rows).
+    """
+    rows = [None] * len(lines)
+    candidates = [
+        i
+        for i, line in enumerate(lines)
+        if line.lstrip().startswith(b"<row ") and line.rstrip().endswith(b"/>")
+    ]
+    if not candidates:
+        return rows
+
+    parser = xml.etree.ElementTree.XMLPullParser(events=("end",))
+    try:
+        parser.feed(b"<rows>")
+        parser.feed(b"\n".join(lines[i] for i in candidates))
+        parser.feed(b"</rows>")
+        parser.close()
+        parsed = [elem.attrib for _, elem in parser.read_events() if elem.tag == "row"]
+    except xml.etree.ElementTree.ParseError:
+        return rows
+    if len(parsed) == len(candidates):
+        for i, attr in zip(candidates, parsed):
+            rows[i] = attr
+    return rows
+
+
+def process_block(lines, to_test, target_tag, offset=0, split=None, seed=None):
+    """
+    Convert a block of input lines into train and test TSV text.
+
+    Args:
+        lines (list): Input lines (bytes).
+        to_test (list): For every line, whether it goes to the test data set;
+            None - decided by hash_split of the post Id.
+        target_tag (str): Target tag.
+        offset (int): Byte offset of the first line in the input file.
+        split (float): Test data set split ratio (for the hash split).
+        seed (int): prepare.seed (for the hash split).
+
+    Returns:
+        tuple: (train text, test text, list of error messages, (byte offset
+        after the last converted line, its post Id) or (None, None)).
+    """
+    train, test, errors = [], [], []
+    end = last_id = None
+    rows = parse_rows(lines)
+    for i, line in enumerate(lines):
+        try:
+            attr = rows[i]
+            if attr is None:
+                attr = xml.etree.ElementTree.fromstring(line).attrib
+            if to_test is None:
+                is_test = hash_split(attr.get("Id", ""), seed) < split
+            else:
+                is_test = to_test[i]
+            (test if is_test else train).append(format_post(attr, target_tag))
+            end, last_id = offset + len(line) + 1, attr.get("Id")
+        except Exception as ex:
+            errors.append(f"Skipping the broken line at byte {offset}: {ex}\n")
+        offset += len(line) + 1
+    return "".join(train), "".join(test), errors, (end, last_id)
+
+
+def _process_block_task(args):
+    return process_block(*args)
+
+
+def iter_tasks(blocks, target_tag, split, split_mode="random", seed=None):
+    """
+    Attach the train/test split to every block of lines.
+
+    In the random mode the split is drawn here, in the reading process, one
+    random number per line in the input order, so it only depends on
+    prepare.seed and not on how the blocks are distributed between workers.
+    In the hash mode every worker decides it from the post Id.
+    """
+    for offset, lines in blocks:
+        if split_mode == "hash":
+            to_test = None
+        else:
+            to_test = [random.random() <= split for _ in lines]
+        yield lines, to_test, target_tag, offset, split, seed
+
+
+def write_results(results, fd_out_train, fd_out_test, mark=(None, None)):
+    """
+    Write the results of process_block in the order they are given.
+
+    Returns:
+        tuple: The high-water mark (byte offset after the last converted line,
+        its post Id) updated by the written blocks.
+    """
+    for train, test, errors, block_mark in results:
+        fd_out_train.write(train)
+        fd_out_test.write(test)
+        for message in errors:
+            sys.stderr.write(message)
+        if block_mark[0] is not None:
+            mark = block_mark
+    return mark
+
+
+def process_posts(
+    blocks,
+    fd_out_train,
+    fd_out_test,
+    target_tag,
+    split,
+    jobs=1,
+    split_mode="random",
+    seed=None,
+):
+    """
+    Process the blocks of input lines and write the output to the output files.
+
+    Args:
+        blocks (iterable): Blocks of input lines, as produced by
+            iter_line_blocks.
         fd_out_train (file): Output file for the training data set.
         fd_out_test (file): Output file for the test data set.
         target_tag (str): Target tag.
         split (float): Test data set split ratio.
+        jobs (int): Number of worker processes; 1 processes the blocks in
+            this process. The output does not depend on the number of jobs.
+        split_mode (str): "random" or "hash" (see SPLIT_MODES).
+        seed (int): prepare.seed for the hash split.
+
+    Returns:
+        tuple: (byte offset after the last converted line, its post Id);
+        (None, None) if no line was converted.
     """
-    num = 1
-    for line in input_lines:
+    tasks = iter_tasks(blocks, target_tag, split, split_mode, seed)
+    outputs = (fd_out_train, fd_out_test)
+
+    if jobs <= 1:
+        return write_results(map(_process_block_task, tasks), *outputs)
+
+    # A bounded window of submitted blocks keeps the memory use independent
+    # of the input size; results are written in the input order.
+    mark = (None, None)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(_process_block_task, task))
+            if len(pending) >= 2 * jobs:
+                mark = write_results([pending.popleft().result()], *outputs, mark)
+        return write_results((future.result() for future in pending), *outputs, mark)
+
+
+def prepare(
+    input,
+    output_dir,
+    split,
+    seed,
+    jobs=1,
+    block_size=READ_BLOCK,
+    split_mode="random",
+    shard=None,
+    start=0,
+    append=False,
+):
+    """
+    Split the XML posts into the train and test TSV files.
+
+    Args:
+        input (str): Input XML file.
+        output_dir (str): Output directory.
+        split (float): Test data set split ratio.
+        seed (int): Random seed of the split.
+        jobs (int): Number of worker processes.
+        block_size (int): Number of bytes read and processed at once.
+        split_mode (str): "random" - one RNG stream over all lines (a row's
+            side depends on every row before it); "hash" - hash_split of
+            (Id, seed), which allows shards and appending.
+        shard (tuple): (index, count) - process only the index-th of count
+            byte ranges of the input and write train-<index>-of-<count>.tsv
+            and test-<index>-of-<count>.tsv. The shards concatenated in order
+            equal the output of the whole file. Hash mode only.
+        start (int): Byte offset to start from (the lines before it are
+            already processed). Hash mode only.
+        append (bool): Append to the output files instead of rewriting them.
+
+    Returns:
+        tuple: Paths of the train and test files and the high-water mark
+        (byte offset after the last converted line, its post Id), see
+        process_posts.
+    """
+    if split_mode not in SPLIT_MODES:
+        raise ValueError(f"Unknown split mode {split_mode!r}, expected one of {SPLIT_MODES}")
+    if split_mode == "random" and (shard is not None or start or append):
+        raise ValueError("Shards and appending require prepare.split_mode: hash")
+
+    random.seed(seed)
+    suffix = ".tsv"
+    end = None
+    if shard is not None:
+        index, count = shard
+        span = os.path.getsize(input) - start
+        start, end = start + span * index // count, start + span * (index + 1) // count
+        suffix = f"-{index:05d}-of-{count:05d}.tsv"
+    output_train = os.path.join(output_dir, "train" + suffix)
+    output_test = os.path.join(output_dir, "test" + suffix)
+    os.makedirs(output_dir, exist_ok=True)
+
+    if shard is None and not append:
+        # The outputs are rewritten, the mark of an incremental run is stale
         try:
-            fd_out = fd_out_train if random.random() > split else fd_out_test
-            attr = xml.etree.ElementTree.fromstring(line).attrib
+            os.remove(os.path.join(output_dir, STATE_FILE))
+        except FileNotFoundError:
+            pass
 
-            pid = attr.get("Id", "")
-            label = 1 if target_tag in attr.get("Tags", "") else 0
-            title = re.sub(r"\s+", " ", attr.get("Title", "")).strip()
-            body = re.sub(r"\s+", " ", attr.get("Body", "")).strip()
-            text = title + " " + body
+    mode = "a" if append else "w"
+    with open(input, "rb") as fd_in, open(
+        output_train, mode, encoding="utf-8", buffering=WRITE_BUFFER
+    ) as fd_out_train, open(
+        output_test, mode, encoding="utf-8", buffering=WRITE_BUFFER
+    ) as fd_out_test:
+        mark = process_posts(
+            blocks=iter_line_blocks(fd_in, block_size, start, end),
+            fd_out_train=fd_out_train,
+            fd_out_test=fd_out_test,
+            target_tag="<r>",
+            split=split,
+            jobs=jobs,
+            split_mode=split_mode,
+            seed=seed,
+        )
+    return output_train, output_test, mark
 
-            fd_out.write("{}\t{}\t{}\n".format(pid, label, text))
 
-            num += 1
-        except Exception as ex:
-            sys.stderr.write(f"Skipping the broken line {num}: {ex}\n")
+def input_digest(input, offset):
+    """
+    Digest of the beginning of the input and of the bytes before offset.
+
+    Appending posts to the input keeps it; rewriting or truncating the
+    already processed part changes it (with the usual caveats of sampling:
+    an edit in the middle of a large file goes unnoticed).
+    """
+    digest = hashlib.md5()
+    with open(input, "rb") as fd:
+        digest.update(fd.read(min(CHECK_BYTES, offset)))
+        fd.seek(max(offset - CHECK_BYTES, 0))
+        digest.update(fd.read(offset - fd.tell()))
+    return digest.hexdigest()
 
 
-def main():
-    params = yaml.safe_load(open("params.yaml"))["prepare"]
+def load_state(output_dir):
+    """Read the high-water mark of the previous incremental run (or None)."""
+    try:
+        with open(os.path.join(output_dir, STATE_FILE)) as fd:
+            state = json.load(fd)
+    except (OSError, ValueError):
+        return None
+    return state if state.get("version") == STATE_VERSION else None
+
+
+def save_state(output_dir, state):
+    """Write the high-water mark; the outputs must be complete by then."""
+    path = os.path.join(output_dir, STATE_FILE)
+    with open(path + ".tmp", "w") as fd:
+        json.dump({"version": STATE_VERSION, **state}, fd)
+    os.replace(path + ".tmp", path)
+
 
-    if len(sys.argv) != 2:
-        sys.stderr.write("Arguments error. Usage:\n")
-        sys.stderr.write("\tpython prepare.py data-file\n")
-        sys.exit(1)
+def _resume_offset(state, input, outputs, params):
+    """Byte offset to continue from, or 0 if the outputs have to be rebuilt."""
+    if state is None or state["params"] != params or params["split_mode"] != "hash":
+        return 0
+    offset = state["offset"]
+    if os.path.getsize(input) < offset or input_digest(input, offset) != state["digest"]:
+        return 0
+    for path, size in zip(outputs, state["sizes"]):
+        if not os.path.exists(path) or os.path.getsize(path) < size:
+            return 0
+    return offset
 
-    # Test data set split ratio
-    split = params["split"]
-    random.seed(params["seed"])
 
-    input = sys.argv[1]
-    output_train = os.path.join("data", "prepared", "train.tsv")
-    output_test = os.path.join("data", "prepared", "test.tsv")
+def prepare_incremental(input, output_dir, split, seed, split_mode, jobs=1):
+    """
+    Process only the posts added to the input since the previous run.
 
-    os.makedirs(os.path.join("data", "prepared"), exist_ok=True)
+    The previous run leaves a high-water mark in output_dir (STATE_FILE):
+    the byte offset after the last converted post, its Id, the parameters and
+    the sizes of the outputs. If the parameters are the same and the input
+    was only appended to, the outputs are cut back to the recorded sizes (in
+    case the previous run was interrupted) and the new posts are appended;
+    otherwise everything is rebuilt. Requires prepare.split_mode: hash.
 
-    input_lines = []
-    with open(input) as fd_in:
-        input_lines = fd_in.readlines()
+    Args:
+        input (str): Input XML file.
+        output_dir (str): Output directory.
+        split (float): Test data set split ratio.
+        seed (int): prepare.seed.
+        split_mode (str): prepare.split_mode.
+        jobs (int): Number of worker processes.
 
-    fd_out_train = open(output_train, "w", encoding="utf-8")
-    fd_out_test = open(output_test, "w", encoding="utf-8")
+    Returns:
+        int: Byte offset the run started from (0 - full rebuild).
+    """
+    params = {"split": split, "seed": seed, "split_mode": split_mode}
+    outputs = [os.path.join(output_dir, name) for name in ("train.tsv", "test.tsv")]
+    state = load_state(output_dir)
+    start = _resume_offset(state, input, outputs, params)
+    if start:
+        for path, size in zip(outputs, state["sizes"]):
+            os.truncate(path, size)
+        sys.stderr.write(f"Appending the posts after byte {start} of {input}\n")
 
-    process_posts(
-        input_lines=input_lines,
-        fd_out_train=fd_out_train,
-        fd_out_test=fd_out_test,
-        target_tag="<r>",
+    _, _, (offset, last_id) = prepare(
+        input,
+        output_dir,
         split=split,
+        seed=seed,
+        jobs=jobs,
+        split_mode=split_mode,
+        start=start,
+        append=bool(start),
+    )
+    if offset is None:
+        offset, last_id = start, state["last_id"] if start else None
+    save_state(
+        output_dir,
+        {
+            "params": params,
+            "offset": offset,
+            "last_id": last_id,
+            "digest": input_digest(input, offset),
+            "sizes": [os.path.getsize(path) for path in outputs],
+        },
     )
+    return start
+
 
-    fd_out_train.close()
-    fd_out_test.close()
+def parse_shard(value):
+    """Parse the --shard argument "INDEX/COUNT"."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected INDEX/COUNT, got {value!r}")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be in [0, {count})")
+    return index, count
+
+
+def main():
+    params = yaml.safe_load(open("params.yaml"))["prepare"]
+
+    parser = argparse.ArgumentParser(description="Split the XML posts into train/test.")
+    parser.add_argument("data_file", help="Input XML file.")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes (the output does not depend on it).",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        metavar="INDEX/COUNT",
+        help="Process one byte range of the input (prepare.split_mode: hash).",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Append only the posts added since the previous run (prepare.split_mode: hash).",
+    )
+    args = parser.parse_args()
+
+    split_mode = params.get("split_mode", "random")
+    output_dir = os.path.join("data", "prepared")
+    if args.incremental and args.shard is None:
+        prepare_incremental(
+            args.data_file,
+            output_dir,
+            split=params["split"],
+            seed=params["seed"],
+            split_mode=split_mode,
+            jobs=args.jobs,
+        )
+        return
+
+    prepare(
+        args.data_file,
+        output_dir,
+        split=params["split"],
+        seed=params["seed"],
+        jobs=args.jobs,
+        split_mode=split_mode,
+        shard=args.shard,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,115 @@
+"""
+Throughput of the prepare stage: the former line-by-line parser against
+the block-based serial and process-pool paths of prepare.py.
+
+Usage:
+    python src/prepare_benchmark.py --rows 200000 --jobs 4
+"""
+import argparse
+import filecmp
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+import xml.etree.ElementTree
+from xml.sax.saxutils import quoteattr
+
+from prepare import prepare
+
+WORDS = ["r", "python", "data", "frame", "plot", "error", "function", "vector"]
+
+
+def legacy_prepare(input, output_dir, split, seed):
+    """The former prepare.py (readlines + fromstring per line), for comparison only."""
+    random.seed(seed)
+    with open(input) as fd_in:
+        input_lines = fd_in.readlines()
+    with open(os.path.join(output_dir, "train.tsv"), "w", encoding="utf-8") as train, open(
+        os.path.join(output_dir, "test.tsv"), "w", encoding="utf-8"
+    ) as test:
+        for line in input_lines:
+            try:
+                fd_out = train if random.random() > split else test
+                attr = xml.etree.ElementTree.fromstring(line).attrib
+                pid = attr.get("Id", "")
+                label = 1 if "<r>" in attr.get("Tags", "") else 0
+                title = re.sub(r"\s+", " ", attr.get("Title", "")).strip()
+                body = re.sub(r"\s+", " ", attr.get("Body", "")).strip()
+                fd_out.write("{}\t{}\t{}\n".format(pid, label, title + " " + body))
+            except Exception:
+                pass
+
+
+def make_posts(path, rows, seed=0):
+    """Write a synthetic Posts.xml dump with one <row/> per line."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as fd:
+        fd.write('<?xml version="1.0" encoding="utf-8"?>\n<posts>\n')
+        for pid in range(1, rows + 1):
+            title = " ".join(rng.choices(WORDS, k=8))
+            body = "<p>" + "  \n".join(rng.choices(WORDS, k=60)) + "</p>"
+            tags = "".join(f"<{tag}>" for tag in rng.sample(WORDS, 3))
+            fd.write(
+                f"  <row Id={quoteattr(str(pid))} PostTypeId=\"1\" "
+                f"Title={quoteattr(title)} Body={quoteattr(body)} "
+                f"Tags={quoteattr(tags)} />\n"
+            )
+        fd.write("</posts>\n")
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the prepare stage.")
+    parser.add_argument("--rows", type=int, default=200_000, help="Number of posts.")
+    parser.add_argument(
+        "--jobs", type=int, default=os.cpu_count() or 1, help="Number of worker processes."
+    )
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        input = os.path.join(temp_dir, "data.xml")
+        make_posts(input, args.rows)
+        runs = {
+            "legacy": lambda out: legacy_prepare(input, out, 0.2, 20170428),
+            "serial": lambda out: prepare(input, out, 0.2, 20170428, jobs=1),
+            f"pool, {args.jobs} jobs": lambda out: prepare(
+                input, out, 0.2, 20170428, jobs=args.jobs
+            ),
+        }
+        outputs = []
+        print(f"rows: {args.rows}")
+        for name, run in runs.items():
+            output_dir = os.path.join(temp_dir, str(len(outputs)))
+            os.makedirs(output_dir)
+            seconds = timed(run, output_dir)
+            outputs.append(output_dir)
+            print(f"{name:16} {seconds:6.2f}s  {args.rows / seconds:10.0f} rows/s")
+
+        for output_dir in outputs[1:]:
+            for name in ("train.tsv", "test.tsv"):
+                same = filecmp.cmp(
+                    os.path.join(outputs[0], name), os.path.join(output_dir, name), False
+                )
+                assert same, f"{name} differs from the legacy output"
+        print("outputs are identical")
+
+        # The hash split is decided in the workers, not in the reading process
+        output_dir = os.path.join(temp_dir, "hash")
+        seconds = timed(
+            prepare, input, output_dir, 0.2, 20170428, jobs=args.jobs, split_mode="hash"
+        )
+        print(f"{'pool, hash split':16} {seconds:6.2f}s  {args.rows / seconds:10.0f} rows/s")
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    main()
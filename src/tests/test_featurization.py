@@ -0,0 +1,108 @@
+import os
+import random
+import shutil
+import tempfile
+
+import numpy as np
+import pytest
+
+import featurization
+from featurization import feature_drift, featurize_incremental
+from matrix_io import load_csr
+
+VOCABULARY = [f"w{index}" for index in range(3000)]
+# Zipf-like word frequencies, as in the posts
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+
+
+def write_rows(path, start, rows, seed, words=VOCABULARY):
+    rng = random.Random(seed)
+    with open(path, "a", encoding="utf-8") as fd:
+        for pid in range(start, start + rows):
+            text = " ".join(rng.choices(words, WEIGHTS, k=40))
+            fd.write(f"{pid}\t{pid % 2}\t{text}\n")
+
+
+@pytest.fixture
+def data_dirs(monkeypatch):
+    monkeypatch.setattr(featurization, "MIN_DRIFT_ROWS", 500)
+    temp_dir = tempfile.mkdtemp()
+    in_path = os.path.join(temp_dir, "prepared")
+    out_path = os.path.join(temp_dir, "features")
+    os.makedirs(in_path)
+    write_rows(os.path.join(in_path, "train.tsv"), 0, 2000, seed=1)
+    write_rows(os.path.join(in_path, "test.tsv"), 0, 500, seed=2)
+    yield in_path, out_path
+    shutil.rmtree(temp_dir)
+
+
+def run(in_path, out_path, engine):
+    return featurize_incremental(
+        in_path, out_path, 500, 1, refit_drift=0.1, engine=engine, hash_features=2**16
+    )
+
+
+@pytest.mark.parametrize("engine", ["count", "hashing"])
+def test_same_distribution_appends_do_not_refit(data_dirs, engine):
+    in_path, out_path = data_dirs
+    assert run(in_path, out_path, engine)
+    for step in range(3):
+        write_rows(os.path.join(in_path, "train.tsv"), 2000 + step * 400, 400, seed=10 + step)
+        assert not run(in_path, out_path, engine)
+    state, _ = featurization.load_state(out_path)
+    assert state["appended_rows"] == 1200
+
+
+@pytest.mark.parametrize("engine", ["count", "hashing"])
+def test_shifted_distribution_refits(data_dirs, engine):
+    in_path, out_path = data_dirs
+    assert run(in_path, out_path, engine)
+    write_rows(
+        os.path.join(in_path, "train.tsv"), 2000, 1000, seed=3, words=VOCABULARY[::-1]
+    )
+    assert run(in_path, out_path, engine)
+
+
+def test_fit_df_is_train_document_frequency(data_dirs):
+    in_path, out_path = data_dirs
+    run(in_path, out_path, "hashing")
+    state, (bag_of_words, _, _) = featurization.load_state(out_path)
+    df = featurization.get_df(os.path.join(in_path, "train.tsv"))
+    counts = bag_of_words.transform(np.array(df.text.str.lower().values))
+    assert state["fit_df"] == counts.getnnz(axis=0).tolist()
+
+
+def test_feature_drift_compares_frequent_features():
+    expected = np.array([50, 30, 20, 1, 1, 0])
+    observed = np.array([25, 15, 10, 0, 0, 1])
+    assert feature_drift(expected, observed, top=3) == 0
+    assert feature_drift(expected, observed, top=6) > 0
+
+
+def test_transform_only_replaces_existing_output(data_dirs, monkeypatch):
+    in_path, out_path = data_dirs
+    run(in_path, out_path, "count")
+    featurizer = os.path.join(out_path, featurization.FEATURIZER_DIR)
+    # Several chunks per input: the chunks of one run are appended
+    monkeypatch.setattr(featurization, "CHUNK_ROWS", 200)
+
+    new_path = os.path.join(in_path, "new.tsv")
+    write_rows(new_path, 0, 500, seed=4)
+    transformed = os.path.join(out_path, "transformed")
+    (output,) = featurization.transform_only([new_path], transformed, featurizer)
+    first, columns = load_csr(output)
+    first = first.copy()
+    assert first.shape == (500, len(columns))
+
+    # A second run over an existing matrix does not append to it
+    featurization.transform_only([new_path], transformed, featurizer, jobs=2)
+    second, _ = load_csr(output)
+    assert second.shape == first.shape
+    assert (second != first).nnz == 0
+
+    # A shorter input replaces the longer matrix
+    with open(new_path, "w"):
+        pass
+    write_rows(new_path, 0, 10, seed=5)
+    featurization.transform_only([new_path], transformed, featurizer)
+    assert load_csr(output)[0].shape == (10, len(columns))
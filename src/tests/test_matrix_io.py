@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pytest
+import scipy.sparse as sparse
+
+import matrix_io
+from matrix_io import append_csr, load_csr, save_csr
+
+COLUMNS = ["id", "label"] + [f"f{index}" for index in range(30)]
+
+
+def random_rows(rng, rows):
+    return sparse.random(
+        rows, len(COLUMNS), density=0.2, format="csr", random_state=rng, dtype=np.float64
+    )
+
+
+def read_header(path):
+    """Raw header of a .npy file, from the magic string to the data."""
+    with open(path, "rb") as fd:
+        if np.lib.format.read_magic(fd) == (1, 0):
+            np.lib.format.read_array_header_1_0(fd)
+        else:
+            np.lib.format.read_array_header_2_0(fd)
+        length = fd.tell()
+        fd.seek(0)
+        return fd.read(length)
+
+
+def write_tight_npy(path, array):
+    """Write a version 1.0 .npy file with neither alignment nor spare space in the header."""
+    descr = np.lib.format.dtype_to_descr(array.dtype)
+    header = f"{{'descr': {descr!r}, 'fortran_order': False, 'shape': {array.shape}}}\n"
+    with open(path, "wb") as fd:
+        fd.write(np.lib.format.magic(1, 0))
+        fd.write(np.uint16(len(header)).tobytes())
+        fd.write(header.encode("latin1"))
+        fd.write(array.tobytes())
+
+
+@pytest.fixture
+def matrix_dir():
+    temp_dir = tempfile.mkdtemp()
+    yield os.path.join(temp_dir, "train.csr")
+    shutil.rmtree(temp_dir)
+
+
+def test_append_csr_round_trip(matrix_dir):
+    rng = np.random.default_rng(0)
+    parts = [random_rows(rng, 50)]
+    save_csr(matrix_dir, parts[0], COLUMNS)
+    lengths = {
+        name: len(read_header(os.path.join(matrix_dir, f"{name}.npy")))
+        for name in ("indptr", "indices", "data")
+    }
+    for rows in (1, 17, 0, 200, 3):
+        parts.append(random_rows(rng, rows))
+        append_csr(matrix_dir, parts[-1], COLUMNS)
+
+    matrix, columns = load_csr(matrix_dir)
+    assert columns == COLUMNS
+    expected = sparse.vstack(parts, format="csr")
+    assert matrix.shape == expected.shape
+    assert (matrix != expected).nnz == 0
+    # The arrays grew in place, without rewriting their headers
+    for name, length in lengths.items():
+        assert len(read_header(os.path.join(matrix_dir, f"{name}.npy"))) == length
+
+
+def test_append_csr_rewrites_arrays_when_header_overflows(matrix_dir):
+    rng = np.random.default_rng(1)
+    parts = [random_rows(rng, 20)]
+    save_csr(matrix_dir, parts[0], COLUMNS)
+    for name in ("indptr", "indices", "data"):
+        path = os.path.join(matrix_dir, f"{name}.npy")
+        write_tight_npy(path, np.load(path))
+        assert read_header(path).endswith(b"}\n")
+
+    # The first append overflows the tight headers, the rest grow the rewritten arrays
+    for _ in range(30):
+        parts.append(random_rows(rng, 40))
+        append_csr(matrix_dir, parts[-1], COLUMNS)
+
+    matrix, _ = load_csr(matrix_dir)
+    expected = sparse.vstack(parts, format="csr")
+    assert matrix.shape == expected.shape
+    assert (matrix != expected).nnz == 0
+    for name in ("indptr", "indices", "data"):
+        # np.save pads the rewritten header with spare space
+        assert read_header(os.path.join(matrix_dir, f"{name}.npy")).endswith(b" \n")
+
+
+def test_append_csr_checks_columns(matrix_dir):
+    save_csr(matrix_dir, sparse.csr_matrix((1, len(COLUMNS))), COLUMNS)
+    with pytest.raises(ValueError):
+        append_csr(matrix_dir, sparse.csr_matrix((1, 3)), ["a", "b", "c"])
+
+
+@pytest.mark.parametrize("failing_step", ["indices", "header"])
+def test_append_csr_survives_interrupted_append(matrix_dir, monkeypatch, failing_step):
+    rng = np.random.default_rng(2)
+    parts = [random_rows(rng, 30), random_rows(rng, 10)]
+    save_csr(matrix_dir, parts[0], COLUMNS)
+    append_csr(matrix_dir, parts[1], COLUMNS)
+
+    # Simulate a crash after some of the arrays grew but before header.json was replaced
+    append_npy = matrix_io._append_npy
+
+    def crashing_append_npy(path, values, length):
+        if failing_step == "indices" and path.endswith("indices.npy"):
+            raise KeyboardInterrupt
+        append_npy(path, values, length)
+
+    def crashing_write_header(path, header):
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as patch:
+        patch.setattr(matrix_io, "_append_npy", crashing_append_npy)
+        patch.setattr(matrix_io, "_write_header", crashing_write_header)
+        with pytest.raises(KeyboardInterrupt):
+            append_csr(matrix_dir, random_rows(rng, 25), COLUMNS)
+
+    expected = sparse.vstack(parts, format="csr")
+    matrix, _ = load_csr(matrix_dir)
+    assert matrix.shape == expected.shape
+    assert (matrix != expected).nnz == 0
+
+    # The next append overwrites the values left by the interrupted one
+    parts.append(random_rows(rng, 5))
+    append_csr(matrix_dir, parts[-1], COLUMNS)
+    expected = sparse.vstack(parts, format="csr")
+    matrix, _ = load_csr(matrix_dir)
+    assert matrix.shape == expected.shape
+    assert (matrix != expected).nnz == 0
+    assert not os.path.exists(os.path.join(matrix_dir, "header.json.tmp"))
@@ -1,4 +1,3 @@
-import os
 import pickle
 import sys
 
@@ -6,6 +5,8 @@ import numpy as np
 import yaml
 from sklearn.ensemble import RandomForestClassifier
 
+from matrix_io import load_features
+
 
 def train(seed, n_est, min_split, matrix):
     """
@@ -50,9 +51,8 @@ def main():
     n_est = params["n_est"]
     min_split = params["min_split"]
 
-    # Load the data
-    with open(os.path.join(input, "train.pkl"), "rb") as fd:
-        matrix, _ = pickle.load(fd)
+    # Load the data (memory-mapped, see matrix_io.load_features)
+    matrix, _ = load_features(input, "train")
 
     clf = train(seed=seed, n_est=n_est, min_split=min_split, matrix=matrix)
 